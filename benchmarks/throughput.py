@@ -0,0 +1,180 @@
+'''Throughput benchmark of the acquisition paths.
+
+Sweeps the number of bytes per point, encoding, record length, number of channels and read
+strategy, and reports traces/s, MB/s, per-trace latency and Python CPU time per trace for each
+combination. Runs against the simulator by default, or a real scope with ``--ip``/``--resource``.
+
+	python benchmarks/throughput.py --record-length 1000 10000 --output new.json
+	python benchmarks/throughput.py --record-length 1000 10000 --compare new.json
+
+Read strategies:
+	* ``curve``: ``CURVE?`` polling, one query per trace (and per channel)
+	* ``multi``: ``CURVE?`` polling, all channels in a single transfer
+	* ``stream``: curvestream, all channels in a single transfer
+'''
+
+import argparse
+import importlib.metadata
+import itertools
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+import pyMSO4
+
+STRATEGIES = ['curve', 'multi', 'stream']
+
+def configure(scope: pyMSO4.MSO4, byte_nr: int, encoding: str, record_length: int, channels: int) -> None:
+	scope.acq.curvestream = False
+	with scope.batch():
+		scope.ch_a_enable([True] * channels + [False] * (scope.ch_a_num - channels))
+		scope.acq.horiz_mode = 'manual'
+		scope.acq.horiz_record_length = record_length
+		scope.acq.wfm_src = [f'ch{i + 1}' for i in range(channels)]
+		scope.acq.wfm_encoding = encoding
+		scope.acq.wfm_binary_format = 'ri'
+		scope.acq.wfm_byte_nr = byte_nr
+	scope.acq.set_window(1, record_length) # Acquires once, so that the preamble matches the window
+	scope.clear_cache()
+
+def read_ascii(scope: pyMSO4.MSO4) -> tuple[np.ndarray, int]:
+	resp = scope.sc.query('CURVE?')
+	return np.array(resp.replace(';', ',').split(','), dtype=np.int32), len(resp)
+
+def run(scope: pyMSO4.MSO4, strategy: str, encoding: str, channels: int, traces: int, warmup: int) -> dict:
+	'''Read ``warmup + traces`` traces, return the measurements of the last ``traces``.'''
+	acq = scope.acq
+	srcs = acq.wfm_src
+	if encoding == 'ascii':
+		read = lambda: read_ascii(scope)
+	elif strategy == 'curve':
+		def read():
+			n = 0
+			for src in srcs: # One transfer per channel, like switching DATa:SOUrce by hand
+				if channels > 1:
+					acq.wfm_src = [src]
+				n += acq.query_waveform().nbytes
+			return None, n
+		acq.get_dtype()
+	else:
+		acq.get_dtype() # Fill the cache, no query can be sent in curvestream mode
+		acq.wfm_src # pylint: disable=pointless-statement
+		if strategy == 'multi':
+			read = lambda: (None, acq.query_waveforms().nbytes)
+		else:
+			read = lambda: (None, acq.read_waveforms().nbytes)
+			acq.curvestream = True
+			scope.clear_buffers()
+
+	latencies = np.empty(traces)
+	size = 0
+	try:
+		for _ in range(warmup):
+			read()
+		cpu = time.process_time()
+		start = last = time.perf_counter()
+		for i in range(traces):
+			_, n = read()
+			now = time.perf_counter()
+			latencies[i] = now - last
+			last = now
+			size += n
+		cpu = time.process_time() - cpu
+		wall = time.perf_counter() - start
+	finally:
+		if strategy == 'stream':
+			acq.curvestream = False
+			scope.clear_buffers()
+		acq.wfm_src = srcs # Changed one source at a time by the curve strategy
+	return {
+		'traces_per_s': traces / wall,
+		'mb_per_s': size / wall / 1e6,
+		'latency_p50_ms': float(np.percentile(latencies, 50) * 1e3),
+		'latency_p99_ms': float(np.percentile(latencies, 99) * 1e3),
+		'cpu_per_trace_ms': cpu / traces * 1e3,
+		'bytes_per_trace': size // traces,
+	}
+
+def version() -> str | None:
+	try:
+		return importlib.metadata.version('pyMSO4')
+	except importlib.metadata.PackageNotFoundError:
+		return None
+
+def key(r: dict) -> tuple:
+	return (r['strategy'], r['encoding'], r['byte_nr'], r['record_length'], r['channels'])
+
+def compare(results: list[dict], path: str) -> None:
+	with open(path, encoding='utf-8') as f:
+		baseline = {key(r): r for r in json.load(f)['results']}
+	print(f'\nCompared with {path} (traces/s, new / baseline):')
+	for r in results:
+		old = baseline.get(key(r))
+		if old:
+			print(f'{"/".join(map(str, key(r))):40} {r["traces_per_s"]:10.1f} / {old["traces_per_s"]:10.1f}'
+				f' ({(r["traces_per_s"] / old["traces_per_s"] - 1) * 100:+.1f}%)')
+
+def main() -> int:
+	parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+	target = parser.add_mutually_exclusive_group()
+	target.add_argument('--ip', help='IP address of a real scope')
+	target.add_argument('--resource', help='VISA resource string of a real scope')
+	parser.add_argument('--sim-trigger-rate', type=float, default=1000.0, help='Simulator: acquisitions per second in curvestream mode')
+	parser.add_argument('--sim-bandwidth', type=float, default=0.0, help='Simulator: transfer rate limit (bytes/s), 0 for unlimited')
+	parser.add_argument('--sim-latency', type=float, default=0.0, help='Simulator: delay before each response (s)')
+	parser.add_argument('--strategy', nargs='+', choices=STRATEGIES, default=STRATEGIES)
+	parser.add_argument('--encoding', nargs='+', choices=['binary', 'ascii'], default=['binary'])
+	parser.add_argument('--byte-nr', nargs='+', type=int, choices=[1, 2], default=[1, 2])
+	parser.add_argument('--record-length', nargs='+', type=int, default=[1000, 10000, 100000])
+	parser.add_argument('--channels', nargs='+', type=int, default=[1, 2])
+	parser.add_argument('--traces', type=int, default=100, help='Traces measured for each combination')
+	parser.add_argument('--warmup', type=int, default=3, help='Traces discarded before measuring')
+	parser.add_argument('--timeout', type=float, default=5000.0, help='VISA timeout (ms)')
+	parser.add_argument('--output', help='Save the results to this JSON file')
+	parser.add_argument('--compare', help='Compare the results with a JSON file saved with --output')
+	args = parser.parse_args()
+
+	sim = None
+	if not (args.ip or args.resource):
+		sim = pyMSO4.MSO4Simulator(latency=args.sim_latency, bandwidth=args.sim_bandwidth,
+			trigger_rate=args.sim_trigger_rate, seed=0).start()
+	scope = pyMSO4.MSO4(timeout=args.timeout)
+	scope.con(ip=args.ip or '', resource=args.resource or (sim.resource if sim else ''))
+
+	results = []
+	try:
+		for strategy, encoding, byte_nr, record_length, channels in itertools.product(
+				args.strategy, args.encoding, args.byte_nr, args.record_length, args.channels):
+			if channels > scope.ch_a_num or (encoding == 'ascii' and (strategy != 'curve' or byte_nr != args.byte_nr[0])):
+				continue # ASCII is only read with CURVE?, and the number of bytes does not matter
+			configure(scope, byte_nr, encoding, record_length, channels)
+			r = {'strategy': strategy, 'encoding': encoding, 'byte_nr': byte_nr, 'record_length': record_length,
+				'channels': channels, **run(scope, strategy, encoding, channels, args.traces, args.warmup)}
+			results.append(r)
+			print(f'{"/".join(map(str, key(r))):40} {r["traces_per_s"]:10.1f} traces/s {r["mb_per_s"]:8.2f} MB/s'
+				f'  p50 {r["latency_p50_ms"]:8.3f} ms  p99 {r["latency_p99_ms"]:8.3f} ms  cpu {r["cpu_per_trace_ms"]:7.3f} ms/trace')
+	finally:
+		scope.dis()
+		if sim:
+			sim.stop()
+
+	if args.output:
+		meta = {
+			'pymso4': version(),
+			'python': platform.python_version(),
+			'numpy': np.__version__,
+			'platform': platform.platform(),
+			'target': args.ip or args.resource or 'simulator',
+			'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+			'args': vars(args),
+		}
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump({'meta': meta, 'results': results}, f, indent=1)
+	if args.compare:
+		compare(results, args.compare)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -5,3 +5,11 @@ scope_logger = logging.getLogger("pyMSO44")
 scope_logger.addHandler(logging.NullHandler())
 
 from .pyMSO4 import *
+from .buffer import TraceBuffer
+from .integrity import TraceIntegrity, TraceIntegrityError
+from .storage import TraceArchive, TraceArchiveWriter
+from .sim import MSO4Simulator
+from .aio import AsyncMSO4
+from .session import CurvestreamSession
+from .group import MSO4Group, MSO4GroupError
+from .pipeline import TracePipeline, PipelineStage, RunningStats, Align, Decimate, BandFilter
@@ -1,18 +1,109 @@
+import datetime
+import queue
 import re
-from typing import Literal
+import threading
+from typing import Callable, Literal
+
+import numpy as np
 import pyvisa
 
-from . import util
+from . import burst
+from . import cache
 from . import scope_logger
+from .batch import SCPIBatch
+from .integrity import TraceIntegrity
+from .state import MSO4State
+from .wait import wait_complete
 
 # Taken from pyvisa.util
 BINARY_DATATYPES = Literal[
     "s", "b", "B", "h", "H", "i", "I", "l", "L", "q", "Q", "f", "d"
 ]
 
-class MSO4Acquisition(util.DisableNewAttr):
+def _parse_timestamp(stamp: str) -> tuple[int, float] | None:
+	'''Parse a FastFrame timestamp (e.g. ``12 Feb 2024 10:43:54.662 917 999 999``) to whole seconds since
+	the epoch and fraction of second, kept apart to preserve the sub-nanosecond resolution.'''
+	m = re.fullmatch(r'\s*(\d+ \w+ \d+ \d+:\d+:\d+)(\.[\d ]*)?\s*', stamp)
+	if not m:
+		return None
+	try:
+		whole = datetime.datetime.strptime(m.group(1), '%d %b %Y %H:%M:%S').replace(tzinfo=datetime.timezone.utc)
+	except ValueError:
+		return None
+	return int(whole.timestamp()), float('0' + (m.group(2) or '').replace(' ', ''))
+
+class MSO4Preamble:
+	'''Waveform transfer settings and scaling, as returned by ``WFMOutpre?``.
+	See the programmer manual § WFMOutpre for the meaning of each field.'''
+
+	def __init__(self, st: MSO4State):
+		'''
+		Args:
+			st: The response to ``WFMOutpre?`` (with headers), parsed as a state
+		'''
+		#: Number of bytes per data point
+		self.byt_nr: int = st.get('WFMOutpre:BYT_Nr', int, 0)
+		#: Binary format (``ri``, ``rp`` or ``fp``)
+		self.bn_fmt: str = st.get('WFMOutpre:BN_Fmt', str, '').lower()
+		#: Byte order (``lsb`` or ``msb``)
+		self.byt_or: str = st.get('WFMOutpre:BYT_Or', str, '').lower()
+		#: Number of points in the waveform
+		self.nr_pt: int = st.get('WFMOutpre:NR_Pt', int, 0)
+		#: Waveform description
+		self.wfid: str = st.get('WFMOutpre:WFId', str, '').strip('"')
+		#: Horizontal unit
+		self.xunit: str = st.get('WFMOutpre:XUNit', str, '').strip('"')
+		#: Time between two points (in ``xunit``)
+		self.xincr: float = st.get('WFMOutpre:XINcr', float, 0.0)
+		#: Time of the trigger point (in ``xunit``) relative to ``pt_off``
+		self.xzero: float = st.get('WFMOutpre:XZEro', float, 0.0)
+		#: Index of the trigger point in the waveform
+		self.pt_off: int = st.get('WFMOutpre:PT_Off', int, 0)
+		#: Vertical unit
+		self.yunit: str = st.get('WFMOutpre:YUNit', str, '').strip('"')
+		#: Vertical scale factor (``yunit`` per raw level)
+		self.ymult: float = st.get('WFMOutpre:YMUlt', float, 1.0)
+		#: Vertical offset (in raw levels)
+		self.yoff: float = st.get('WFMOutpre:YOFf', float, 0.0)
+		#: Vertical offset (in ``yunit``)
+		self.yzero: float = st.get('WFMOutpre:YZEro', float, 0.0)
+
+	def as_dict(self) -> dict:
+		'''Return the preamble fields as a JSON-serializable dict.'''
+		return dict(vars(self))
+
+	def to_volts(self, raw: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+		'''Convert raw samples to ``yunit`` (usually volts): ``(raw - yoff) * ymult + yzero``.
+
+		Args:
+			raw: Raw samples, any shape (e.g. one trace, or a batch of traces)
+			out: Optional preallocated float array with the same shape as ``raw``, written in place.
+				Can be ``raw`` itself if it is a float array.
+
+		Returns: ``out`` if given, otherwise a new float32 array
+		'''
+		if out is None:
+			out = np.empty(raw.shape, dtype=np.float32)
+		np.subtract(raw, self.yoff, out=out)
+		out *= self.ymult
+		out += self.yzero
+		return out
+
+	def time_axis(self, n: int | None = None, dtype: np.dtype | type = np.float64) -> np.ndarray:
+		'''Return the time (in ``xunit``, usually seconds) of each point relative to the trigger.
+
+		Args:
+			n: Number of points, defaults to ``nr_pt``
+			dtype: Data type of the returned array
+		'''
+		n = self.nr_pt if n is None else n
+		return (self.xzero + (np.arange(n, dtype=np.float64) - self.pt_off) * self.xincr).astype(dtype, copy=False)
+
+class MSO4Acquisition(cache.CachedComponent):
 	'''Handle all the properties related to waveform acquisition.'''
 
+	_affects_scaling = True
+
 	# See programmer manual for explanation of these
 	_modes = ['sample', 'peakdetect', 'hires', 'average', 'envelope']
 	_stop_afters = ['sequence', 'runstop']
@@ -21,6 +112,16 @@ class MSO4Acquisition(util.DisableNewAttr):
 	_wfm_binary_formats = ['ri', 'rp', 'fp']
 	_wfm_byte_nrs = [1, 2, 8] # Programmer manual § WFMOutpre:BYT_Nr
 	_wfm_byte_orders = ['lsb', 'msb']
+	# Transfer width used for each acquisition mode when auto_byte_nr is enabled. Sample, peak detect
+	# and envelope waveforms are transferred with 8 bits, hi res and average ones gain resolution from
+	# the combination of samples and need 16 bits. Can be changed per instance.
+	_mode_byte_nrs: dict[str, tuple[int, str]] = {
+		'sample': (1, 'ri'),
+		'peakdetect': (1, 'ri'),
+		'envelope': (1, 'ri'),
+		'hires': (2, 'ri'),
+		'average': (2, 'ri'),
+	}
 	_wfm_datatypes: dict[int, dict[str, BINARY_DATATYPES]] = { # Got these from the programmer manual § WFMOutpre:BN_Fmt
 		1: {'ri': 'b', 'rp': 'B'},
 		2: {'ri': 'h', 'rp': 'H'},
@@ -36,33 +137,16 @@ class MSO4Acquisition(util.DisableNewAttr):
 			ch_a_count: The number of analog channels available on the scope (1-based, so 4 if the scope has 4 channels)
 		'''
 
-		super().__init__()
+		super().__init__(res)
 
-		self.sc: pyvisa.resources.MessageBasedResource = res
 		self._ch_a_count: int = ch_a_count
-
-		self._cached_wfm_encoding = None
-		self._cached_wfm_format = None
-		self._cached_wfm_byte_nr = None
-		self._cached_wfm_order = None
-		self._cached_curvestream = None
-		self._cached_fast_acq = None
+		self._auto_byte_nr: bool = False
+		self._mode_byte_nrs = dict(MSO4Acquisition._mode_byte_nrs)
+		#: Integrity checks of the waveforms read, None to disable them (see :class:`TraceIntegrity`)
+		self.integrity: TraceIntegrity | None = None
 
 		self.disable_newattr()
 
-	def clear_caches(self):
-		'''Resets the local configuration cache so that values will be fetched from
-		the scope.
-
-		This is useful when the scope configuration is (potentially) changed externally.
-		'''
-		self._cached_wfm_encoding = None
-		self._cached_wfm_format = None
-		self._cached_wfm_byte_nr = None
-		self._cached_wfm_order = None
-		self._cached_curvestream = None
-		self._cached_fast_acq = None
-
 	def configured(self) -> bool:
 		'''Check if the scope have been configured for acquisition.
 
@@ -77,9 +161,12 @@ class MSO4Acquisition(util.DisableNewAttr):
 			return True
 		raise ValueError('Variables [acq.mode, acq.src, acq.wfm_encoding, acq.wfm_binary_format, acq.wfm_byte_nr, acq.wfm_byte_order] must be set before acquisition')
 
-	@property
-	def mode(self) -> str:
-		'''The acquisition mode of the scope. Valid modes are:
+	def _apply_mode_byte_nr(self, mode: str):
+		if self._auto_byte_nr:
+			self.wfm_byte_nr, self.wfm_binary_format = self._mode_byte_nrs[mode]
+
+	mode = cache.scpi_property('ACQuire:MODe', str.lower, validate=cache.choice('mode', _modes),
+		on_set=_apply_mode_byte_nr, doc='''The acquisition mode of the scope. Valid modes are:
 			* ``sample``: SAMple specifies that the displayed data point value is the
 			  sampled value that is taken during the acquisition interval
 			* ``peakdetect``: PEAKdetect specifies the display of high-low range of the
@@ -92,231 +179,176 @@ class MSO4Acquisition(util.DisableNewAttr):
 			* ``envelope``: ENVelope specifies envelope mode, where the resulting waveform
 			  displays the range of PEAKdetect from continued waveform acquisitions.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the acquisition mode
 
 		:Setter: Set the acquisition mode
-		'''
-		return self.sc.query('ACQuire:MODe?').strip().lower()
-	@mode.setter
-	def mode(self, value: str):
-		if value.lower() not in self._modes:
-			raise ValueError(f'Invalid mode {value}. Valid modes are {self._modes}')
-		self.sc.write(f'ACQuire:MODe {value}')
+		''')
 
-	@property
-	def stop_after(self) -> str:
-		'''Wether the instrument continually acquires waves or acquires a single sequence. Valid modes are:
+	stop_after = cache.scpi_property('ACQuire:STOPAfter', str.lower, validate=cache.choice('stop after', _stop_afters),
+		doc='''Wether the instrument continually acquires waves or acquires a single sequence. Valid modes are:
 			* ``sequence``: specifies that the next acquisition will be a single-sequence acquisition
 			* ``runstop``: specifies that the instrument will continually acquire data, if
 			  ACQuire:STATE is turned on.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the acquisition mode
 
 		:Setter: Set the acquisition mode.
-		'''
-		return self.sc.query('ACQuire:STOPAfter?').strip().lower()
-	@stop_after.setter
-	def stop_after(self, value: str):
-		if value.lower() not in self._stop_afters:
-			raise ValueError(f'Invalid stop after {value}. Valid stop afters are {self._stop_afters}')
-		self.sc.write(f'ACQuire:STOPAfter {value}')
+		''')
 
-	@property
-	def num_seq(self) -> int:
-		'''In single sequence acquisition mode, specify the number of acquisitions or measurements
+	def _validate_num_seq(self, value: int) -> int:
+		stopafter = self.stop_after
+		if stopafter != 'sequence':
+			raise ValueError(f'Cannot set number of acquisitions or measurements in {stopafter} mode. Must be in sequence mode.')
+		return cache.integer('number of acquisitions or measurements')(self, value)
+
+	num_seq = cache.scpi_property('ACQuire:SEQuence:NUMSEQuence', int, validate=_validate_num_seq,
+		doc='''In single sequence acquisition mode, specify the number of acquisitions or measurements
 		that comprise the sequence.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the number of acquisitions or measurements
 
 		:Setter: Set the number of acquisitions or measurements
-		'''
-		return int(self.sc.query('ACQuire:SEQuence:NUMSEQuence?').strip())
-	@num_seq.setter
-	def num_seq(self, value: int):
-		stopafter = self.stop_after
-		if stopafter != 'sequence':
-			raise ValueError(f'Cannot set number of acquisitions or measurements in {stopafter} mode. Must be in sequence mode.')
-		if not isinstance(value, int):
-			raise ValueError(f'Invalid number of acquisitions or measurements {value}. Must be an int.')
-		self.sc.write(f'ACQuire:SEQuence:NUMSEQuence {value}')
+		''')
 
-	@property
-	def horiz_mode(self) -> str:
-		'''The horizontal operating mode. Valid values are:
+	def _validate_num_avg(self, value: int) -> int:
+		cache.integer('number of averages')(self, value)
+		return cache.number('number of averages', 2, 10240)(self, value)
+
+	num_avg = cache.scpi_property('ACQuire:NUMAVg', int, validate=_validate_num_avg,
+		verify=True, doc='''The number of waveform acquisitions averaged in ``average`` mode (2 to 10240).
+		In single sequence mode, the sequence completes once they have all been acquired.
+
+		*Cached*
+
+		:Getter: Return the number of averages
+
+		:Setter: Set the number of averages
+		''')
+
+	num_acq = cache.scpi_property('ACQuire:NUMACq', int, policy=cache.NEVER, readonly=True,
+		doc='''The number of waveform acquisitions that have occurred since starting acquisition,
+		e.g. to follow the progress of an average.
+
+		*Not cached*: this is updated by the scope while acquiring.
+
+		:Getter: Return the number of acquisitions
+		''')
+
+	# Horizontal settings interact with each other: setting one of them drops the cached value of the others
+	horiz_mode = cache.scpi_property('HORizontal:MODe', str.lower, validate=cache.choice('mode', _horiz_modes),
+		invalidates=('horiz_sample_rate', 'horiz_scale', 'horiz_record_length'),
+		doc='''The horizontal operating mode. Valid values are:
 			* ``auto``: automatically adjusts the sample rate and record length to provide
 			  a high acquisition rate in Fast Acq or signal fidelity in analysis
 			* ``manual``: lets you change the sample rate, horizontal scale, and record length.
 			  These values interact. For example, when you change record length
 			  then the horizontal scale also changes.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the mode
 
 		:Setter: Set the mode
-		'''
-		return self.sc.query('HORizontal:MODe?').strip().lower()
-	@horiz_mode.setter
-	def horiz_mode(self, value: str):
-		if value.lower() not in self._horiz_modes:
-			raise ValueError(f'Invalid mode {value}. Valid modes are {self._horiz_modes}')
-		self.sc.write(f'HORizontal:MODe {value}')
+		''')
 
-	@property
-	def horiz_sample_rate(self) -> float:
-		'''The horizontal sample rate of the waveform.
+	horiz_sample_rate = cache.scpi_property('HORizontal:MODe:SAMPlerate', float, validate=cache.number('sample rate'),
+		verify=True, invalidates=('horiz_scale', 'horiz_record_length'),
+		doc='''The horizontal sample rate of the waveform.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the sample rate in Hz
 
 		:Setter: Set the sample rate in Hz (int or float)
-		'''
-		return float(self.sc.query('HORizontal:MODe:SAMPlerate?').strip())
-	@horiz_sample_rate.setter
-	def horiz_sample_rate(self, value: float | int):
-		if not isinstance(value, float) and not isinstance(value, int):
-			raise ValueError(f'Invalid sample rate {value}. Must be a float or an int.')
-		self.sc.write(f'HORizontal:MODe:SAMPlerate {value}')
-		# Check if the sample rate was set correctly
-		actual = self.horiz_sample_rate
-		if actual != value:
-			scope_logger.warning('Failed to set horizontal sample rate to %f. Got %f instead.', value, actual)
+		''')
 
-	@property
-	def horiz_scale(self) -> float:
-		'''The horizontal scale of the waveform.
+	horiz_scale = cache.scpi_property('HORizontal:SCAle', float, validate=cache.number('scale'),
+		verify=True, invalidates=('horiz_sample_rate', 'horiz_record_length'),
+		doc='''The horizontal scale of the waveform.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the scale in s
 
 		:Setter: Set the scale in s (int or float)
-		'''
-		return float(self.sc.query('HORizontal:SCAle?').strip())
-	@horiz_scale.setter
-	def horiz_scale(self, value: float | int):
-		if not isinstance(value, float) and not isinstance(value, int):
-			raise ValueError(f'Invalid scale {value}. Must be a float or an int.')
-		self.sc.write(f'HORizontal:SCAle {value}')
-		# Check if the scale was set correctly
-		actual = self.horiz_scale
-		if actual != value:
-			scope_logger.warning('Failed to set horizontal scale to %f. Got %f instead.', value, actual)
+		''')
 
-	@property
-	def horiz_pos(self) -> float:
-		'''The horizontal position of the waveform in percent of the screen:
+	horiz_pos = cache.scpi_property('HORizontal:POSition', float, validate=cache.number('position', 0, 100),
+		verify=True, doc='''The horizontal position of the waveform in percent of the screen:
 		0% is the left edge of the screen and 100% is the right edge of the screen.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the position in %
 
 		:Setter: Set the position in % (int or float)
-		'''
-		return float(self.sc.query('HORizontal:POSition?').strip())
-	@horiz_pos.setter
-	def horiz_pos(self, value: float | int):
-		if not isinstance(value, float) and not isinstance(value, int):
-			raise ValueError(f'Invalid position {value}. Must be a float or an int.')
-		if value < 0 or value > 100:
-			raise ValueError(f'Invalid position {value}. Must be between 0 and 100.')
-		self.sc.write(f'HORizontal:POSition {value}')
-		# Check if the position was set correctly
-		actual = self.horiz_pos
-		if actual != value:
-			scope_logger.warning('Failed to set horizontal position to %f. Got %f instead.', value, actual)
+		''')
 
-	@property
-	def horiz_record_length(self) -> int:
-		'''The horizontal record length of the waveform.
+	horiz_record_length = cache.scpi_property('HORizontal:MODe:RECOrdlength', int, validate=cache.integer('record length'),
+		invalidates=('horiz_sample_rate', 'horiz_scale'),
+		doc='''The horizontal record length of the waveform.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the record length
 
 		:Setter: Set the record length
-		'''
-		return int(self.sc.query('HORizontal:MODe:RECOrdlength?').strip())
-	@horiz_record_length.setter
-	def horiz_record_length(self, value: int):
-		if not isinstance(value, int):
-			raise ValueError(f'Invalid record length {value}. Must be an int.')
-		self.sc.write(f'HORizontal:MODe:RECOrdlength {value}')
+		''')
 
-	@property
-	def wfm_src(self) -> list[str]:
-		'''Source of the retrieved waveform (analog FlexChannel(s) source(s)). Valid values are ``chN`` (Analog channel n).
+	def _validate_wfm_src(self, value: list[str]) -> list[str]:
+		for v in value:
+			matches = re.fullmatch(r'(ch|math)(\d+)', v, re.IGNORECASE)
+			if not matches or int(matches.group(2)) < 1 or (matches.group(1).lower() == 'ch' and int(matches.group(2)) > self._ch_a_count):
+				raise ValueError(f'Invalid source {v}. Valid sources are ch1-ch{self._ch_a_count} and mathN')
+		return [v.lower() for v in value]
 
-		*Not cached*
+	wfm_src = cache.scpi_property('DATa:SOUrce', lambda r: r.lower().replace(',', ' ').split(), ' '.join,
+		validate=_validate_wfm_src, doc='''Source of the retrieved waveform (analog FlexChannel(s) source(s)). Valid values are ``chN`` (Analog channel n)
+		and ``mathN`` (Math waveform n, see :class:`MSO4MathChannel`).
+
+		*Cached*
 
 		:Getter: Return the source
 
 		:Setter: Set the source
-		'''
-		return self.sc.query('DATa:SOUrce?').strip().split()
-	@wfm_src.setter
-	def wfm_src(self, value: list[str]):
-		for v in value:
-			matches = re.match(r'ch(\d+)', v, re.IGNORECASE)
-			if not matches or int(matches.group(1)) > self._ch_a_count:
-				raise ValueError(f'Invalid source {v}. Valid sources are ch1-ch{self._ch_a_count}')
-		self.sc.write(f'DATa:SOUrce {" ".join(value)}')
+		''')
 
-	@property
-	def wfm_start(self) -> int:
-		'''The starting data point for waveform transfer.
+	wfm_start = cache.scpi_property('DATa:STARt', int, validate=cache.integer('start index'),
+		doc='''The starting data point for waveform transfer.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the start index
 
 		:Setter: Set the start index
-		'''
-		return int(self.sc.query('DATa:STARt?').strip())
-	@wfm_start.setter
-	def wfm_start(self, value: int):
-		if not isinstance(value, int):
-			raise ValueError(f'Invalid start index {value}. Must be an int.')
-		self.sc.write(f'DATa:STARt {value}')
+		''')
 
-	@property
-	def wfm_stop(self) -> int:
-		'''The last data point that will be transferred when retrieving the waveform.
+	wfm_stop = cache.scpi_property('DATa:STOP', int, validate=cache.integer('stop index'),
+		doc='''The last data point that will be transferred when retrieving the waveform.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the stop index
 
 		:Setter: Set the stop index
-		'''
-		return int(self.sc.query('DATa:STOP?').strip())
-	@wfm_stop.setter
-	def wfm_stop(self, value: int):
-		if not isinstance(value, int):
-			raise ValueError(f'Invalid stop index {value}. Must be an int.')
-		self.sc.write(f'DATa:STOP {value}')
+		''')
 
-	@property
-	def wfm_len(self) -> int:
-		'''The number of data points in the waveform.
+	wfm_len = cache.scpi_property('WFMOutpre:NR_Pt', int, policy=cache.NEVER, readonly=True,
+		doc='''The number of data points in the waveform.
 
-		*Not cached*
+		*Not cached*: this is only updated by the scope after an acquisition.
 
 		:Getter: Return the number of data points
-		'''
-		return int(self.sc.query('WFMOutpre:NR_Pt?').strip())
+		''')
 
-	@property
-	def wfm_encoding(self) -> str:
-		'''The encoding of the waveform data.  Valid values are:
+	wfm_encoding = cache.scpi_property('WFMOutpre:ENCdg', str.lower, validate=cache.choice('encoding', _wfm_encodings),
+		doc='''The encoding of the waveform data.  Valid values are:
 			* ``binary``: Binary
 			* ``ascii``: ASCII
 
@@ -328,22 +360,10 @@ class MSO4Acquisition(util.DisableNewAttr):
 
 		Raises:
 			ValueError: Invalid encoding
-		'''
-		if self._cached_wfm_encoding is None:
-			self._cached_wfm_encoding = self.sc.query('WFMOutpre:ENCdg?').strip().lower()
-		return self._cached_wfm_encoding
-	@wfm_encoding.setter
-	def wfm_encoding(self, value: str):
-		if value.lower() not in self._wfm_encodings:
-			raise ValueError(f'Invalid encoding {value}. Valid encodings are {self._wfm_encodings}')
-		if self._cached_wfm_encoding == value:
-			return
-		self._cached_wfm_encoding = value
-		self.sc.write(f'WFMOutpre:ENCdg {value}')
+		''')
 
-	@property
-	def wfm_binary_format(self) -> str:
-		'''The data format of binary waveform data. Valid values are:
+	wfm_binary_format = cache.scpi_property('WFMOutpre:BN_Fmt', str.lower, validate=cache.choice('binary format', _wfm_binary_formats),
+		doc='''The data format of binary waveform data. Valid values are:
 			* ``ri``: Signed integer
 			* ``rp``: Unsigned integer
 			* ``fp``: Floating point
@@ -356,47 +376,85 @@ class MSO4Acquisition(util.DisableNewAttr):
 
 		Raises:
 			ValueError: Invalid data format
-		'''
-		if self._cached_wfm_format is None:
-			self._cached_wfm_format = self.sc.query('WFMOutpre:BN_Fmt?').strip().lower()
-		return self._cached_wfm_format
-	@wfm_binary_format.setter
-	def wfm_binary_format(self, value: str):
-		if value.lower() not in self._wfm_binary_formats:
-			raise ValueError(f'Invalid binary format {value}. Valid binary formats are {self._wfm_binary_formats}')
-		if self._cached_wfm_format == value:
-			return
-		self._cached_wfm_format = value
-		self.sc.write(f'WFMOutpre:BN_Fmt {value}')
+		''')
 
 	@property
-	def wfm_byte_nr(self) -> int:
-		'''The number of bytes per data point in the waveform.
+	def auto_byte_nr(self) -> bool:
+		'''Select the transfer width (:attr:`MSO4Acquisition.wfm_byte_nr` and
+		:attr:`MSO4Acquisition.wfm_binary_format`) from the acquisition :attr:`MSO4Acquisition.mode`
+		every time it is set, halving the bytes transferred in ``sample``, ``peakdetect`` and ``envelope``
+		modes. ``hires`` and ``average`` modes use 2 bytes.
+
+		NOTE: The MSO4 ADC has 12 bits, so 1 byte transfers drop the 4 least significant bits.
+		This is usually below the noise floor at high sample rates. Use
+		:func:`MSO4Acquisition.set_mode_byte_nr` to change the width used for a mode.
+
+		*Not cached* (local setting). Disabled by default.
+
+		:Getter: Return True if the transfer width follows the mode
+
+		:Setter: Enable or disable the policy. When enabled, the width is applied for the current mode.
+		'''
+		return self._auto_byte_nr
+	@auto_byte_nr.setter
+	def auto_byte_nr(self, value: bool):
+		cache.boolean('auto byte nr')(self, value)
+		self._auto_byte_nr = value
+		if value:
+			self._apply_mode_byte_nr(self.mode)
+
+	def set_mode_byte_nr(self, mode: str, byte_nr: int, binary_format: str = 'ri'):
+		'''Change the transfer width used for an acquisition mode by :attr:`MSO4Acquisition.auto_byte_nr`.
+
+		Args:
+			mode: The acquisition mode
+			byte_nr: Number of bytes per data point
+			binary_format: Binary format of the data points
+
+		Raises:
+			ValueError: Invalid mode, number of bytes or binary format
+		'''
+		mode = cache.choice('mode', self._modes)(self, mode)
+		binary_format = cache.choice('binary format', self._wfm_binary_formats)(self, binary_format)
+		byte_nr = self._validate_wfm_byte_nr(byte_nr)
+		if binary_format not in self._wfm_datatypes[byte_nr]:
+			raise ValueError(f'Invalid binary format {binary_format} for {byte_nr} bytes per data point')
+		self._mode_byte_nrs[mode] = (byte_nr, binary_format)
+		if self._auto_byte_nr and self.mode == mode:
+			self._apply_mode_byte_nr(mode)
+
+	def copy_local_settings(self, other: 'MSO4Acquisition') -> None:
+		'''Take the settings kept on the host rather than on the scope from another acquisition
+		object, e.g. the one of a previous connection: :attr:`MSO4Acquisition.integrity`,
+		:attr:`MSO4Acquisition.auto_byte_nr` and the widths set with :func:`MSO4Acquisition.set_mode_byte_nr`.
+		Nothing is sent to the scope.
+
+		Args:
+			other: The acquisition object to copy the settings from
+		'''
+		self.integrity = other.integrity
+		self._auto_byte_nr = other._auto_byte_nr
+		self._mode_byte_nrs = dict(other._mode_byte_nrs)
+
+	def _validate_wfm_byte_nr(self, value: int) -> int:
+		cache.integer('number of bytes per data point')(self, value)
+		if value not in self._wfm_byte_nrs:
+			raise ValueError(f'Invalid number of bytes per data point {value}. Valid values are {self._wfm_byte_nrs}')
+		return value
+
+	wfm_byte_nr = cache.scpi_property('WFMOutpre:BYT_Nr', int, validate=_validate_wfm_byte_nr,
+		doc='''The number of bytes per data point in the waveform.
 
 		*Cached*
 
 		:Getter: Return the number of bytes per data point
 
 		:Setter: Set the number of bytes per data point
-			NOTE: Check the programmer manual for valid values § WFMOutpre:BYT_Nr. If unsure, clear the cache with :code:`scope._clear_cache()` and read back the value
-		'''
-		if self._cached_wfm_byte_nr is None:
-			self._cached_wfm_byte_nr = int(self.sc.query('WFMOutpre:BYT_Nr?').strip())
-		return self._cached_wfm_byte_nr
-	@wfm_byte_nr.setter
-	def wfm_byte_nr(self, value: int):
-		if not isinstance(value, int):
-			raise ValueError(f'Invalid number of bytes per data point {value}. Must be an int.')
-		if value not in self._wfm_byte_nrs:
-			raise ValueError(f'Invalid number of bytes per data point {value}. Valid values are {self._wfm_byte_nrs}')
-		if self._cached_wfm_byte_nr == value:
-			return
-		self._cached_wfm_byte_nr = value
-		self.sc.write(f'WFMOutpre:BYT_Nr {value}')
+			NOTE: Check the programmer manual for valid values § WFMOutpre:BYT_Nr. If unsure, clear the cache with :code:`scope.clear_cache()` and read back the value
+		''')
 
-	@property
-	def wfm_byte_order(self) -> str:
-		'''The byte order of the waveform data. Valid values are:
+	wfm_byte_order = cache.scpi_property('WFMOutpre:BYT_Or', str.lower, validate=cache.choice('byte order', _wfm_byte_orders),
+		doc='''The byte order of the waveform data. Valid values are:
 			* ``lsb``: Least significant byte first
 			* ``msb``: Most significant byte first
 
@@ -408,18 +466,7 @@ class MSO4Acquisition(util.DisableNewAttr):
 
 		Raises:
 			ValueError: Invalid byte order
-		'''
-		if self._cached_wfm_order is None:
-			self._cached_wfm_order = self.sc.query('WFMOutpre:BYT_Or?').strip().lower()
-		return self._cached_wfm_order
-	@wfm_byte_order.setter
-	def wfm_byte_order(self, value: str):
-		if value.lower() not in self._wfm_byte_orders:
-			raise ValueError(f'Invalid byte order {value}. Valid byte orders are {self._wfm_byte_orders}')
-		if self._cached_wfm_order == value:
-			return
-		self._cached_wfm_order = value
-		self.sc.write(f'WFMOutpre:BYT_Or {value}')
+		''')
 
 	@property
 	def is_big_endian(self) -> bool:
@@ -439,37 +486,211 @@ class MSO4Acquisition(util.DisableNewAttr):
 
 		:Setter: Set the curvestream state
 		'''
-		if self._cached_curvestream is None:
+		if 'curvestream' not in self._cache:
 			self.sc.write('*CLS') # If we don't know, better disable it to be sure
-			self._cached_curvestream = False
-		return self._cached_curvestream
+			self._cache['curvestream'] = (False, 0.0)
+		return self._cache['curvestream'][0]
 	@curvestream.setter
 	def curvestream(self, value: bool):
-		self._cached_curvestream = value
+		self._cache['curvestream'] = (value, 0.0)
 		if value:
 			self.sc.write('CURVestream?')
 		else:
 			self.sc.write('*CLS')
 
-	@property
-	def fast_acq(self) -> bool:
-		'''Enable or disable fast acquisition mode.
+	fast_acq = cache.scpi_property('ACQuire:FASTAcq:STATE', cache.parse_bool, cache.fmt_bool,
+		validate=cache.boolean('fast acquisition state'), doc='''Enable or disable fast acquisition mode.
 
 		*Cached*
 
 		:Getter: Return the fast acquisition state
 
 		:Setter: Set the fast acquisition state
+		''')
+
+	fastframe = cache.scpi_property('HORizontal:FASTframe:STATE', cache.parse_bool, cache.fmt_bool,
+		validate=cache.boolean('FastFrame state'), doc='''Enable or disable FastFrame mode, where each trigger
+		acquires a frame into one long record. See :func:`MSO4Acquisition.acquire_fastframe`.
+
+		*Cached*
+
+		:Getter: Return the FastFrame state
+
+		:Setter: Set the FastFrame state
+		''')
+
+	def _validate_frame_count(self, value: int) -> int:
+		cache.integer('number of frames')(self, value)
+		if value < 1:
+			raise ValueError(f'Invalid number of frames {value}. Must be positive.')
+		return value
+
+	fastframe_count = cache.scpi_property('HORizontal:FASTframe:COUNt', int, validate=_validate_frame_count,
+		verify=True, doc='''The number of frames acquired in FastFrame mode. The scope might lower it
+		to fit the available memory.
+
+		*Cached*
+
+		:Getter: Return the number of frames
+
+		:Setter: Set the number of frames
+		''')
+
+	wfm_frame_start = cache.scpi_property('DATa:FRAMESTARt', int, validate=_validate_frame_count,
+		doc='''The first FastFrame frame (1-based) of the waveform transfer.
+
+		*Cached*
+
+		:Getter: Return the first frame
+
+		:Setter: Set the first frame
+		''')
+
+	wfm_frame_stop = cache.scpi_property('DATa:FRAMESTOP', int, validate=_validate_frame_count,
+		doc='''The last FastFrame frame (1-based) of the waveform transfer.
+
+		*Cached*
+
+		:Getter: Return the last frame
+
+		:Setter: Set the last frame
+		''')
+
+	def preamble(self) -> MSO4Preamble:
+		'''Fetch the waveform preamble (scaling and transfer settings) with a single
+		``WFMOutpre?`` query.
+
+		*Cached* until a channel or acquisition setting is changed, or the cache is cleared.
+		Note the scope only updates some of these values after an acquisition happens.
 		'''
-		if self._cached_fast_acq is None:
-			self._cached_fast_acq = bool(int(self.sc.query("ACQuire:FASTAcq:STATE?").strip()))
-		return self._cached_fast_acq
-	@fast_acq.setter
-	def fast_acq(self, value: bool):
-		if self._cached_fast_acq == value:
-			return
-		self._cached_fast_acq = value
-		self.sc.write(f'ACQuire:FASTAcq:STATE {int(value)}')
+		epoch = cache.scaling_epoch(self.sc)
+		cached = self._cache.get('preamble')
+		if cached is not None and cached[1] == epoch:
+			self._cache_counts['hits'] += 1
+			return cached[0]
+		self._cache_counts['misses'] += 1
+		# Headers make the response self-describing, the field order changes between firmwares
+		try:
+			resp = self.sc.query(':HEADer 1;:WFMOutpre?;:HEADer 0')
+		except BaseException:
+			# Headers in the responses would break parsing, whether the message was executed or not
+			self.sc.write(':HEADer 0')
+			raise
+		preamble = MSO4Preamble(MSO4State.parse(resp))
+		self._cache['preamble'] = (preamble, epoch)
+		return preamble
+
+	def to_volts(self, raw: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+		'''Convert raw samples read from the scope to volts, using the cached :func:`MSO4Acquisition.preamble`.
+		Vectorized, works on single traces as well as ``(n_traces, n_points)`` batches.
+
+		Args:
+			raw: Raw samples
+			out: Optional preallocated float array with the same shape as ``raw``, written in place
+
+		Returns: ``out`` if given, otherwise a new float32 array
+		'''
+		return self.preamble().to_volts(raw, out)
+
+	def time_axis(self, n: int | None = None) -> np.ndarray:
+		'''Return the time (in s) of each point relative to the trigger, using the cached
+		:func:`MSO4Acquisition.preamble`.
+
+		Args:
+			n: Number of points, defaults to the number of points in the waveform
+		'''
+		return self.preamble().time_axis(n)
+
+	def time_to_index(self, t: float) -> int:
+		'''Convert a time relative to the trigger to the index of the nearest point of the record
+		(1-based, like :attr:`MSO4Acquisition.wfm_start`), using the cached horizontal settings
+		(sample rate, record length and position) rather than the preamble, which the scope only
+		updates after an acquisition. Assumes the horizontal delay mode is off.
+
+		Args:
+			t: Time (in s) relative to the trigger, negative before it
+		'''
+		trigger = self.horiz_record_length * self.horiz_pos / 100
+		return int(round(trigger + t * self.horiz_sample_rate)) + 1
+
+	def set_window(self, start: int, stop: int, timeout: float | None = 2000.0) -> tuple[int, int]:
+		'''Set the points transferred for each waveform (:attr:`MSO4Acquisition.wfm_start` and
+		:attr:`MSO4Acquisition.wfm_stop`) and make sure the scope applies them.
+
+		``CURVE?`` applies a new data window right away to the record in memory (see
+		:func:`MSO4Acquisition.read_long`), but the scope only updates the waveform preamble
+		(:attr:`MSO4Acquisition.wfm_len`, the time of the first point...) after an acquisition, so
+		:func:`MSO4Acquisition.preamble` and the integrity checks would describe the previous window.
+		This runs a single sequence acquisition with a forced trigger, then verifies the number of
+		points in the preamble. The previous stop condition is restored, and the acquisition is
+		restarted if it was running. The window cannot be changed in curvestream mode.
+
+		Args:
+			start: First point (1-based)
+			stop: Last point (inclusive)
+			timeout: Maximum time (in ms) to wait for the forced acquisition, None to wait forever
+
+		Returns: The ``(start, stop)`` window
+
+		Raises:
+			ValueError: Curvestream mode is enabled, or invalid window
+			TimeoutError: The forced acquisition did not complete within ``timeout``
+			OSError: The scope did not apply the window
+		'''
+		if self.curvestream:
+			raise ValueError('Cannot set the data window while in curvestream mode.')
+		cache.integer('start index')(self, start)
+		cache.integer('stop index')(self, stop)
+		if not 1 <= start <= stop:
+			raise ValueError(f'Invalid window {start}-{stop}')
+		running = self.sc.query('ACQuire:STATE?').strip() in ('1', 'ON', 'RUN')
+		old_stop_after = self.stop_after
+		with SCPIBatch(self.sc):
+			self.wfm_start = start
+			self.wfm_stop = stop
+			self.stop_after = 'sequence'
+		try:
+			self.sc.write('ACQuire:STATE ON;:TRIGger FORCe')
+			wait_complete(self.sc, timeout)
+			n_points = self.wfm_len
+		finally:
+			self.stop_after = old_stop_after
+			if running:
+				self.sc.write('ACQuire:STATE ON')
+		if n_points != stop - start + 1:
+			raise OSError(f'The scope sends {n_points} points, expected {stop - start + 1} (window {start}-{stop})')
+		return start, stop
+
+	def set_roi(self, t_start: float, t_stop: float, timeout: float | None = 2000.0) -> tuple[int, int]:
+		'''Only transfer the points between two times relative to the trigger (region of interest),
+		e.g. a leakage window, rather than the whole record:
+
+		.. code-block:: python
+
+			mso44.acq.set_roi(-20e-9, 400e-9)
+			mso44.acq.curvestream = True # Only the points of the window are sent
+
+		The times are converted to indices with :func:`MSO4Acquisition.time_to_index`, clipped to the
+		record, and committed with :func:`MSO4Acquisition.set_window`. The actual time of each point is
+		given by :func:`MSO4Acquisition.time_axis`.
+
+		Args:
+			t_start: Start time (in s), negative before the trigger
+			t_stop: Stop time (in s)
+			timeout: Maximum time (in ms) to wait for the forced acquisition, None to wait forever
+
+		Returns: The ``(start, stop)`` window in points (1-based, inclusive)
+
+		Raises:
+			ValueError: Curvestream mode is enabled, or the window is empty or outside the record
+			TimeoutError: The forced acquisition did not complete within ``timeout``
+			OSError: The scope did not apply the window
+		'''
+		start = max(1, self.time_to_index(t_start))
+		stop = min(self.horiz_record_length, self.time_to_index(t_stop))
+		if t_stop <= t_start or stop < start:
+			raise ValueError(f'The window {t_start}-{t_stop} s is empty or outside the record')
+		return self.set_window(start, stop, timeout)
 
 	def get_datatype(self) -> BINARY_DATATYPES:
 		'''Get the data type of the binary waveform data in struct.pack form. Does not return endianess.
@@ -477,3 +698,489 @@ class MSO4Acquisition(util.DisableNewAttr):
 		*Cached*
 		'''
 		return self._wfm_datatypes[self.wfm_byte_nr][self.wfm_binary_format]
+
+	def get_dtype(self) -> np.dtype:
+		'''Get the NumPy dtype of the binary waveform data, including endianess.
+
+		*Cached*
+		'''
+		return np.dtype(self.get_datatype()).newbyteorder('>' if self.is_big_endian else '<')
+
+	def _read_block(self) -> memoryview:
+		'''Read an IEEE 488.2 definite length arbitrary block (``#<n><len><payload>``) from
+		the scope and return the payload. The trailing message terminator is consumed as well.
+
+		Raises:
+			OSError: The scope sent an invalid or indefinite length block header
+		'''
+		header = self._read_block_header()
+		# The payload and the message terminator are read with one call, each call being a separate
+		# device read (and round trip) on VXI-11 and USBTMC
+		payload = memoryview(self.sc.read_bytes(int(header[2:]) + 1))[:-1] # No copy
+		if self.integrity is not None:
+			self.integrity.check(payload, len(payload))
+		return payload
+
+	def _read_block_header(self) -> bytes:
+		'''Read the header (``#<n><len>``) of an IEEE 488.2 definite length arbitrary block.
+
+		Raises:
+			OSError: The scope sent an invalid or indefinite length block header
+		'''
+		try:
+			head = self.sc.read_bytes(2)
+		except pyvisa.errors.VisaIOError as e:
+			if self.integrity is not None and e.error_code == pyvisa.constants.VI_ERROR_TMO:
+				self.integrity.timeouts += 1
+			raise
+		if head[:1] != b'#' or not head[1:2].isdigit():
+			raise OSError(f'Invalid block header {head!r} received from scope')
+		digits = int(head[1:2])
+		if digits == 0:
+			raise OSError('Indefinite length blocks are not supported')
+		return head + self.sc.read_bytes(digits)
+
+	def _read_blocks(self, n_blocks: int) -> tuple[bytes, int, int]:
+		'''Read a response made of ``n_blocks`` definite length blocks of the same length, separated
+		by ``;``, with a single call once the first header is parsed.
+
+		Returns: The whole response (terminator included), the length of each block header and
+			the length of each payload. Block ``i`` starts at ``i * (header_len + length + 1)``.
+
+		Raises:
+			OSError: Invalid block headers, or blocks of different lengths
+		'''
+		header = self._read_block_header()
+		length = int(header[2:])
+		stride = len(header) + length + 1 # Header, payload and separator (``;`` or terminator)
+		data = header + self.sc.read_bytes(stride * n_blocks - len(header))
+		for i in range(1, n_blocks):
+			if data[i * stride:i * stride + len(header)] != header:
+				raise OSError(f'Block {i} header {data[i * stride:i * stride + len(header)]!r} does not match the first block {header!r}')
+		return data, len(header), length
+
+	def read_waveform(self, out: np.ndarray | None = None) -> np.ndarray:
+		'''Read a binary waveform from the scope into a NumPy array. Use this in curvestream
+		mode, or after having sent ``CURVE?`` manually (see :func:`MSO4Acquisition.query_waveform`).
+
+		The block header is parsed here and the payload is wrapped with :func:`numpy.frombuffer`,
+		so no Python list is ever built. The dtype is taken from :func:`MSO4Acquisition.get_dtype`.
+
+		Args:
+			out: Optional preallocated 1-D array the samples are copied into. Its length must match
+				the number of points in the waveform, the dtype can be anything the samples can
+				be safely cast to (e.g. a native endian int16 array for big endian int16 data).
+
+		Returns: ``out`` if given, otherwise a read-only array backed by the received payload
+
+		Raises:
+			OSError: Invalid block received from the scope
+			TraceIntegrityError: Unexpected waveform length (only if :attr:`MSO4Acquisition.integrity` is set)
+			ValueError: ``out`` does not match the received waveform length
+		'''
+		dtype = self.get_dtype()
+		wfm = np.frombuffer(self._read_block(), dtype=dtype)
+		if out is None:
+			return wfm
+		if out.shape != wfm.shape:
+			raise ValueError(f'Output array has shape {out.shape}, but the waveform has {wfm.shape[0]} points')
+		np.copyto(out, wfm)
+		return out
+
+	def query_waveform(self, out: np.ndarray | None = None) -> np.ndarray:
+		'''Query a binary waveform (``CURVE?``) from the scope into a NumPy array.
+		See :func:`MSO4Acquisition.read_waveform` for details.
+
+		Args:
+			out: Optional preallocated 1-D array the samples are copied into
+
+		Returns: ``out`` if given, otherwise a read-only array backed by the received payload
+
+		Raises:
+			ValueError: Curvestream mode is enabled (use :func:`MSO4Acquisition.read_waveform` instead)
+		'''
+		if self.curvestream:
+			raise ValueError('Cannot query CURVE? while in curvestream mode. Use read_waveform() instead.')
+		self.get_dtype() # Fill the cache, no query can be sent once CURVE? is
+		self.sc.write('CURVE?')
+		return self.read_waveform(out)
+
+	def read_waveforms(self, out: np.ndarray | None = None) -> np.ndarray:
+		'''Read the waveforms of all the sources in :attr:`MSO4Acquisition.wfm_src` from a single
+		transfer into a ``(n_sources, n_points)`` NumPy array. Use this in curvestream mode, or after
+		having sent ``CURVE?`` manually (see :func:`MSO4Acquisition.query_waveforms`).
+
+		The scope sends one block per source, separated by ``;``. All the blocks have the same length,
+		so once the first header is parsed the rest of the response is read with one call and
+		demultiplexed with a strided view, without copying or parsing each block in Python.
+
+		Args:
+			out: Optional preallocated ``(n_sources, n_points)`` array the samples are copied into.
+				See :func:`MSO4Acquisition.read_waveform` for the allowed dtypes.
+
+		Returns: ``out`` if given, otherwise a read-only array backed by the received data
+
+		Raises:
+			OSError: Invalid or inconsistent blocks received from the scope
+			TraceIntegrityError: Unexpected waveform length (only if :attr:`MSO4Acquisition.integrity` is set)
+			ValueError: ``out`` does not match the received waveforms
+		'''
+		n_src = len(self.wfm_src)
+		dtype = self.get_dtype()
+		data, header_len, length = self._read_blocks(n_src)
+		if length % dtype.itemsize:
+			raise OSError(f'Block length {length} is not a multiple of the sample size {dtype.itemsize}')
+		if self.integrity is not None:
+			self.integrity.check(data, length)
+		wfms = np.ndarray((n_src, length // dtype.itemsize), dtype=dtype, buffer=data,
+			offset=header_len, strides=(header_len + length + 1, dtype.itemsize))
+		if out is None:
+			return wfms
+		if out.shape != wfms.shape:
+			raise ValueError(f'Output array has shape {out.shape}, but the waveforms have shape {wfms.shape}')
+		np.copyto(out, wfms)
+		return out
+
+	def query_waveforms(self, out: np.ndarray | None = None) -> np.ndarray:
+		'''Query the waveforms of all the sources in :attr:`MSO4Acquisition.wfm_src` (``CURVE?``)
+		with a single transfer. See :func:`MSO4Acquisition.read_waveforms` for details.
+
+		Args:
+			out: Optional preallocated ``(n_sources, n_points)`` array the samples are copied into
+
+		Returns: ``out`` if given, otherwise a read-only array backed by the received data
+
+		Raises:
+			ValueError: Curvestream mode is enabled (use :func:`MSO4Acquisition.read_waveforms` instead)
+		'''
+		if self.curvestream:
+			raise ValueError('Cannot query CURVE? while in curvestream mode. Use read_waveforms() instead.')
+		self.get_dtype() # Fill the cache, no query can be sent once CURVE? is
+		self.wfm_src # pylint: disable=pointless-statement
+		self.sc.write('CURVE?')
+		return self.read_waveforms(out)
+
+	def read_long(self, chunk_points: int = 1_000_000, start: int = 1, stop: int | None = None,
+			out: np.ndarray | None = None, chunk_timeout: float | None = None,
+			progress: Callable[[int, int], None] | None = None) -> np.ndarray:
+		'''Read a long record in windows of ``chunk_points`` points (``DATa:STARt``/``DATa:STOP``),
+		so that no single transfer needs a huge timeout or buffer:
+
+		.. code-block:: python
+
+			mso44.acq.horiz_record_length = 62_500_000
+			mso44.acq.acquire_single()
+			wfm = mso44.acq.read_long(chunk_timeout=2000, progress=lambda done, total: print(f'{done / total:.0%}'))
+
+		``CURVE?`` applies ``DATa:STARt``/``DATa:STOP`` to the record in memory, so all the windows
+		come from the same acquisition and no new one is needed between them. The waveform preamble
+		is not updated by moving the window (see :func:`MSO4Acquisition.set_window`): the length of
+		each window is taken from its block header.
+
+		A thread fetches the windows from the scope while the previous one is copied into the
+		output array, and at most two windows are held in memory at any time. The data window is
+		restored when done. :attr:`MSO4Acquisition.integrity` is not applied to the windows (the
+		length of each of them is checked instead).
+
+		Args:
+			chunk_points: Number of points per window
+			start: First point of the record to read
+			stop: Last point of the record to read, defaults to :attr:`MSO4Acquisition.horiz_record_length`
+			out: Optional preallocated array the samples are copied into, ``(n_points,)`` with a single
+				source, ``(n_sources, n_points)`` otherwise
+			chunk_timeout: Timeout (in ms) of each window, None to keep the current timeout
+			progress: Called after each window with the number of points read so far and the total
+
+		Returns: ``out`` if given, otherwise a new native endian array
+
+		Raises:
+			ValueError: Curvestream mode is enabled, invalid window, or ``out`` has the wrong shape
+			OSError: Invalid or truncated window received from the scope
+		'''
+		if self.curvestream:
+			raise ValueError('Cannot query CURVE? while in curvestream mode.')
+		stop = self.horiz_record_length if stop is None else stop
+		if chunk_points < 1 or not 1 <= start <= stop:
+			raise ValueError(f'Invalid window {start}-{stop} or chunk size {chunk_points}')
+		n_src = len(self.wfm_src)
+		dtype = self.get_dtype()
+		total = stop - start + 1
+		shape = (total,) if n_src == 1 else (n_src, total)
+		if out is None:
+			out = np.empty(shape, dtype=dtype.newbyteorder('='))
+		elif out.shape != shape:
+			raise ValueError(f'Output array has shape {out.shape}, but the record has shape {shape}')
+		old_window = (self.wfm_start, self.wfm_stop)
+		old_timeout = self.sc.timeout
+
+		windows: queue.Queue[tuple[int, np.ndarray] | BaseException | None] = queue.Queue(maxsize=1)
+		abort = threading.Event()
+		def fetch():
+			try:
+				for first in range(start, stop + 1, chunk_points):
+					if abort.is_set():
+						return
+					last = min(first + chunk_points - 1, stop)
+					self.sc.write(f'DATa:STARt {first};:DATa:STOP {last};:CURVE?')
+					wfms = self.read_waveforms()
+					if wfms.shape[1] != last - first + 1:
+						raise OSError(f'Received {wfms.shape[1]} points for window {first}-{last}')
+					windows.put((first, wfms))
+				windows.put(None)
+			except BaseException as e: # pylint: disable=broad-exception-caught
+				windows.put(e)
+
+		integrity, self.integrity = self.integrity, None
+		if chunk_timeout is not None:
+			self.sc.timeout = chunk_timeout
+		fetcher = threading.Thread(target=fetch, name='pyMSO4-long-read', daemon=True)
+		fetcher.start()
+		try:
+			done = 0
+			while (item := windows.get()) is not None:
+				if isinstance(item, BaseException):
+					raise item
+				first, wfms = item
+				dst = out[first - start:first - start + wfms.shape[1]] if n_src == 1 else out[:, first - start:first - start + wfms.shape[1]]
+				np.copyto(dst, wfms[0] if n_src == 1 else wfms)
+				done += wfms.shape[1]
+				if progress is not None:
+					progress(done, total)
+		finally:
+			abort.set()
+			while fetcher.is_alive(): # Unblock the fetcher if it is waiting for room in the queue
+				try:
+					windows.get(timeout=0.1)
+				except queue.Empty:
+					pass
+			self.integrity = integrity
+			self.sc.timeout = old_timeout
+			self.sc.write(f'DATa:STARt {old_window[0]};:DATa:STOP {old_window[1]}')
+		return out
+
+	def arm(self) -> None:
+		'''Start a single sequence acquisition without waiting for it to complete. Returns once the
+		scope has processed the command, so the trigger can be sent right after. Wait for the
+		acquisition with :func:`wait_complete` (or use :func:`MSO4Acquisition.acquire_single`).
+
+		Raises:
+			ValueError: Curvestream mode is enabled
+		'''
+		if self.curvestream:
+			raise ValueError('Cannot run a single sequence acquisition while in curvestream mode.')
+		self.stop_after = 'sequence'
+		self.sc.query('ACQuire:STATE ON;:ACQuire:STATE?') # Round trip: the scope is armed on return
+
+	def acquire_single(self, timeout: float | None = None) -> None:
+		'''Run a single sequence acquisition and wait for it to complete, using a service request
+		when the VISA backend supports it (see :func:`wait_complete`). The waveform can then be
+		read with :func:`MSO4Acquisition.query_waveform`.
+
+		Args:
+			timeout: Maximum time (in ms) to wait for the trigger(s), None to wait forever
+
+		Raises:
+			ValueError: Curvestream mode is enabled
+			TimeoutError: The acquisition did not complete within ``timeout``
+		'''
+		if self.curvestream:
+			raise ValueError('Cannot run a single sequence acquisition while in curvestream mode.')
+		self.stop_after = 'sequence'
+		self.sc.write('ACQuire:STATE ON')
+		wait_complete(self.sc, timeout)
+
+	def acquire_average(self, n_avg: int, timeout: float | None = None, out: np.ndarray | None = None) -> np.ndarray:
+		'''Average ``n_avg`` acquisitions on the scope and read only the result: the traffic is the
+		same as for a single waveform, instead of ``n_avg`` of them averaged on the host.
+
+		.. code-block:: python
+
+			mso44.acq.wfm_src = ['ch1']
+			avg = mso44.acq.to_volts(mso44.acq.acquire_average(64, timeout=10000))
+
+		The scope is put in ``average`` mode (with FastFrame disabled) and a single sequence acquisition
+		is run: it completes once ``n_avg`` waveforms have been acquired (see :func:`wait_complete`).
+		Average mode is left enabled afterwards. Averages of math waveforms (e.g. ``CH1-CH2``, see :func:`MSO4.add_math`)
+		can be read the same way by selecting them in :attr:`MSO4Acquisition.wfm_src`.
+
+		Args:
+			n_avg: Number of acquisitions averaged (2 to 10240)
+			timeout: Maximum time (in ms) to wait for all the triggers, None to wait forever
+			out: Optional preallocated array the samples are copied into, 1-D with a single source,
+				``(n_sources, n_points)`` otherwise
+
+		Returns: The averaged waveform, ``(n_points,)`` with a single source, ``(n_sources, n_points)``
+			otherwise. ``out`` if given.
+
+		Raises:
+			ValueError: Curvestream mode is enabled, or invalid number of averages
+			TimeoutError: The averages were not acquired within ``timeout``
+			OSError: The scope sent a different number of points than announced
+		'''
+		if self.curvestream:
+			raise ValueError('Cannot acquire an average while in curvestream mode.')
+		n_avg = self._validate_num_avg(n_avg) # Before anything is sent
+		with SCPIBatch(self.sc):
+			self.fastframe = False # Or the transfer holds one average per frame
+			self.mode = 'average'
+			self.num_avg = n_avg
+			self.stop_after = 'sequence'
+
+		self.acquire_single(timeout) # Returns when all the averages are acquired
+
+		n_points = self.wfm_len # Only updated by the scope after the acquisition
+		if len(self.wfm_src) == 1:
+			wfm = self.query_waveform(out)
+		else:
+			wfm = self.query_waveforms(out)
+		if wfm.shape[-1] != n_points:
+			raise OSError(f'Received {wfm.shape[-1]} points, expected {n_points}')
+		return wfm
+
+	def acquire_fastframe(self, n_frames: int, timeout: float | None = None, out: np.ndarray | None = None) -> np.ndarray:
+		'''Acquire ``n_frames`` triggered frames in FastFrame mode and read all of them with a
+		single transfer, avoiding a round trip per trigger:
+
+		.. code-block:: python
+
+			frames = mso44.acq.acquire_fastframe(1000, timeout=10000)
+			volts = mso44.acq.to_volts(frames)
+
+		The scope is configured for a single sequence acquisition of ``n_frames`` frames, armed
+		once, and the transfer starts when the sequence is complete (see :func:`wait_complete`). FastFrame mode
+		is left enabled afterwards.
+
+		With several sources in :attr:`MSO4Acquisition.wfm_src`, the scope sends one block per source
+		holding all its frames, and a ``(n_sources, n_frames, n_points)`` array is returned.
+
+		Args:
+			n_frames: Number of frames
+			timeout: Maximum time (in ms) to wait for all the triggers, None to wait forever
+			out: Optional preallocated ``(n_frames, n_points)`` array (``(n_sources, n_frames, n_points)``
+				with several sources) the samples are copied into
+
+		Returns: A ``(n_frames, n_points)`` or ``(n_sources, n_frames, n_points)`` array, ``out`` if given
+
+		Raises:
+			ValueError: Curvestream mode is enabled, invalid number of frames, or ``out`` does not
+				match the received frames
+			OSError: The scope acquired fewer frames than requested (e.g. not enough memory)
+			TimeoutError: The frames were not acquired within ``timeout``
+			TraceIntegrityError: Unexpected waveform length (only if :attr:`MSO4Acquisition.integrity` is set)
+		'''
+		if self.curvestream:
+			raise ValueError('Cannot acquire FastFrame while in curvestream mode.')
+		n_frames = self._validate_frame_count(n_frames) # Before anything is sent
+		with SCPIBatch(self.sc):
+			self.stop_after = 'sequence'
+			self.fastframe = True
+			self.fastframe_count = n_frames
+			self.wfm_frame_start = 1
+			self.wfm_frame_stop = n_frames
+		if self.fastframe_count < n_frames:
+			raise OSError(f'The scope can only acquire {self.fastframe_count} frames with the current settings')
+
+		self.acquire_single(timeout) # Arm once, returns when all the frames are acquired
+
+		dtype = self.get_dtype()
+		n_src = len(self.wfm_src)
+		n_points = self.wfm_len # Only updated by the scope after the acquisition
+		self.sc.write('CURVE?')
+		data, header_len, length = self._read_blocks(n_src) # Read in full, even if unexpected
+		if length != n_frames * n_points * dtype.itemsize:
+			raise OSError(f'Received {length} bytes per source, expected {n_frames} frames of {n_points} points')
+		if self.integrity is not None:
+			self.integrity.check(data, length // n_frames)
+		frames = np.ndarray((n_src, n_frames, n_points), dtype=dtype, buffer=data, offset=header_len,
+			strides=(header_len + length + 1, n_points * dtype.itemsize, dtype.itemsize))
+		if n_src == 1:
+			frames = frames[0]
+		if out is None:
+			return frames
+		if out.shape != frames.shape:
+			raise ValueError(f'Output array has shape {out.shape}, but the frames have shape {frames.shape}')
+		np.copyto(out, frames)
+		return out
+
+	def acquire_burst(self, seg_len: int, data_src: str = 'ch1', sync_src: str = 'ch2', offset: int = 0,
+			threshold: float | None = None, slope: Literal['rise', 'fall'] = 'rise', holdoff: int | None = None,
+			template: np.ndarray | None = None, min_corr: float = 0.8, timeout: float | None = None,
+			chunk_points: int = 1_000_000) -> tuple[np.ndarray, np.ndarray]:
+		'''Capture many operations of the device under test with a single trigger and a long record,
+		then split the record into one segment per operation. This trades thousands of short
+		transfers (each with its trigger and round trip overhead) for a single long one:
+
+		.. code-block:: python
+
+			mso44.acq.horiz_record_length = 20_000_000
+			... # Arm the DUT to run 10000 operations back to back after the trigger
+			segments, starts = mso44.acq.acquire_burst(2500, data_src='ch1', sync_src='ch2', offset=-100)
+
+		The start of each operation is found on ``sync_src``, either where it crosses ``threshold``
+		(see :func:`burst.find_edges`) or, if ``template`` is given, where it matches the template
+		(see :func:`burst.match_template`). The record is read with :func:`MSO4Acquisition.read_long`
+		and segmented with :func:`burst.segment`. :attr:`MSO4Acquisition.wfm_src` is restored afterwards.
+
+		Args:
+			seg_len: Number of points of each segment
+			data_src: Source the segments are cut from
+			sync_src: Source used to find the start of each operation, can be ``data_src`` itself
+			offset: Added to each start index, e.g. negative to include some points before the sync edge
+			threshold: Crossing level of the sync signal (in raw levels), defaults to its midpoint
+			slope: Edge of the sync signal, ``rise`` or ``fall``
+			holdoff: Crossings closer than this many points to the previous one are ignored,
+				defaults to half of ``seg_len``
+			template: Pattern (in raw levels) to find in the sync signal instead of threshold crossings
+			min_corr: Minimum normalized correlation with ``template``
+			timeout: Maximum time (in ms) to wait for the acquisition, None to wait forever
+			chunk_points: Number of points per transfer (see :func:`MSO4Acquisition.read_long`)
+
+		Returns: The raw ``(n_segments, seg_len)`` segments and the index of the first point of each
+			of them in the record (0-based). Segments which do not fit in the record are dropped.
+
+		Raises:
+			ValueError: Curvestream mode is enabled, or invalid source
+			TimeoutError: The acquisition did not complete within ``timeout``
+		'''
+		if self.curvestream:
+			raise ValueError('Cannot acquire a burst while in curvestream mode.')
+		old_src = self.wfm_src
+		srcs = [data_src] if data_src.lower() == sync_src.lower() else [data_src, sync_src]
+		self.wfm_src = srcs
+		try:
+			self.acquire_single(timeout)
+			record = self.read_long(chunk_points, stop=self.horiz_record_length)
+		finally:
+			self.wfm_src = old_src
+		data = record if len(srcs) == 1 else record[0]
+		sync = record if len(srcs) == 1 else record[1]
+		if template is None:
+			starts = burst.find_edges(sync, threshold, slope, seg_len // 2 if holdoff is None else holdoff)
+		else:
+			starts = burst.match_template(sync, template, min_corr)
+		starts = starts[(starts + offset >= 0) & (starts + offset + seg_len <= len(data))] + offset
+		return burst.segment(data, starts, seg_len), starts
+
+	def fastframe_timestamps(self, n_frames: int | None = None) -> np.ndarray | None:
+		'''Best effort query of the trigger time of each FastFrame frame of the first source,
+		relative to the first frame. The timestamp format is not documented consistently across
+		firmware versions, so this returns None when the response cannot be parsed.
+
+		Args:
+			n_frames: Number of frames, defaults to :attr:`MSO4Acquisition.wfm_frame_stop`
+
+		Returns: The time (in s) of each frame since the first one, or None
+		'''
+		n_frames = self.wfm_frame_stop if n_frames is None else n_frames
+		src = self.wfm_src[0].upper()
+		try:
+			resp = self.sc.query(f'HORizontal:FASTframe:TIMEStamp:ALL:{src}? 1,{n_frames}')
+		except pyvisa.errors.VisaIOError as e:
+			scope_logger.warning('Could not query the FastFrame timestamps: %s', e)
+			return None
+		stamps = [_parse_timestamp(t) for t in re.findall(r'"([^"]*)"', resp)]
+		if len(stamps) != n_frames or None in stamps:
+			scope_logger.warning('Could not parse the FastFrame timestamps: %s', resp[:100])
+			return None
+		whole, frac = np.array(stamps, dtype=np.float64).T
+		return (whole - whole[0]) + (frac - frac[0])
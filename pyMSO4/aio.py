@@ -0,0 +1,188 @@
+import asyncio
+import concurrent.futures
+import functools
+from typing import Any, AsyncIterator, Callable
+
+import numpy as np
+import pyvisa
+
+from .pyMSO4 import MSO4
+
+class _AsyncProxy:
+	'''Expose the properties and methods of a pyMSO4 object as awaitables executed by the
+	worker of an :class:`AsyncMSO4`.
+
+	Reading a property returns an awaitable for its value, calling a method returns an
+	awaitable for its result. Properties are set with :func:`_AsyncProxy.set`.
+	'''
+
+	def __init__(self, owner: 'AsyncMSO4', target: Callable[[], Any]):
+		'''
+		Args:
+			owner: The AsyncMSO4 whose worker executes all the operations
+			target: Returns the wrapped object. Resolved on each access since the objects
+				of :class:`MSO4` are replaced on (re)connection.
+		'''
+		self._owner = owner
+		self._target = target
+
+	def __getattr__(self, name: str) -> Any:
+		target = self._target()
+		if target is None:
+			raise OSError('Scope is not connected. Connect it first...')
+		if isinstance(getattr(type(target), name, None), property):
+			return self._owner.run(getattr, target, name)
+		attr = getattr(target, name)
+		if callable(attr):
+			@functools.wraps(attr)
+			async def wrapper(*args, **kwargs):
+				return await self._owner.run(attr, *args, **kwargs)
+			return wrapper
+		return attr
+
+	async def set(self, name: str, value: Any) -> None:
+		'''Set a property of the wrapped object.
+
+		Args:
+			name: Name of the property (e.g. ``horiz_scale``)
+			value: Value to set
+		'''
+		await self._owner.run(setattr, self._target(), name, value)
+
+class _AsyncAcquisition(_AsyncProxy):
+	'''Asynchronous view of :class:`MSO4Acquisition`.'''
+
+	async def astream(self, timeout: float | None = None, recover: bool = True) -> AsyncIterator[np.ndarray]:
+		'''Iterate over curvestream traces without blocking the event loop:
+
+		.. code-block:: python
+
+			async for trace in scope.acq.astream(timeout=0.2):
+				...
+
+		Curvestream mode is enabled on start, and disabled (with the input buffer drained) when the
+		iteration ends. Use :func:`contextlib.aclosing` when breaking out of the loop, so that this
+		happens immediately rather than when the generator is garbage collected.
+
+		Args:
+			timeout: Maximum time to wait for each trace (in s). None to keep the current VISA timeout.
+			recover: If True, re-arm curvestream and keep waiting when a trace times out,
+				otherwise raise :class:`TimeoutError`
+
+		Raises:
+			TimeoutError: A trace was not received within ``timeout`` and ``recover`` is False
+		'''
+		acq = self._target()
+		if acq is None:
+			raise OSError('Scope is not connected. Connect it first...')
+		old_timeout = acq.sc.timeout
+
+		read = acq.read_waveform
+
+		def _start():
+			nonlocal read
+			if len(acq.wfm_src) > 1:
+				read = acq.read_waveforms # One (n_sources, n_points) array per transfer
+			if timeout is not None:
+				acq.sc.timeout = timeout * 1000
+			acq.curvestream = True
+			self._owner.scope.clear_buffers() # Good measure
+
+		def _rearm():
+			acq.curvestream = False # Stop first, the scope might still be sending
+			self._owner.scope.clear_buffers()
+			acq.curvestream = True
+
+		def _stop():
+			acq.curvestream = False
+			acq.sc.timeout = old_timeout
+			self._owner.scope.clear_buffers()
+
+		await self._owner.run(_start)
+		try:
+			while True:
+				try:
+					trace = await self._owner.run(read)
+				except pyvisa.errors.VisaIOError as e:
+					if e.error_code != pyvisa.constants.VI_ERROR_TMO:
+						raise
+					if not recover:
+						raise TimeoutError(f'No trace received within {timeout} s') from e
+					await self._owner.run(_rearm)
+					continue
+				yield trace
+		finally:
+			await self._owner.run(_stop)
+
+class AsyncMSO4:
+	'''asyncio front-end for :class:`MSO4`.
+
+	All the VISA traffic of a scope is serialized through a single worker thread, so the
+	event loop is never blocked and several instruments can be driven from one process.
+	Properties and methods of the scope and its subobjects are awaitables:
+
+	.. code-block:: python
+
+		scope = AsyncMSO4(trig_type=pyMSO4.MSO4EdgeTrigger)
+		await scope.con(ip='128.181.240.130')
+		await scope.acq.set('horiz_scale', 200e-9)
+		print(await scope.ch_a[1].scale)
+		async for trace in scope.acq.astream(timeout=0.2):
+			...
+		await scope.dis()
+	'''
+
+	def __init__(self, scope: MSO4 | None = None, **kwargs):
+		'''Create a new asynchronous scope object.
+
+		Args:
+			scope: An existing (possibly connected) :class:`MSO4` to wrap. If None, a new one is
+				created, passing ``kwargs`` to :func:`MSO4.__init__`.
+		'''
+		#: The wrapped synchronous scope object. Do not use it while async operations are pending.
+		self.scope: MSO4 = scope if scope is not None else MSO4(**kwargs)
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='pyMSO4')
+		self._proxy = _AsyncProxy(self, lambda: self.scope)
+
+		#: Asynchronous view of :attr:`MSO4.acq`
+		self.acq: _AsyncAcquisition = _AsyncAcquisition(self, lambda: self.scope.acq)
+		#: Asynchronous view of :attr:`MSO4.trigger`
+		self.trigger: _AsyncProxy = _AsyncProxy(self, lambda: self.scope.trigger)
+
+	async def run(self, func: Callable, *args, **kwargs) -> Any:
+		'''Run a function in the worker of this scope.
+
+		Args:
+			func: Function to run. It may use the scope freely, as no other operation
+				on this scope runs at the same time.
+		'''
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+	@property
+	def ch_a(self) -> list[_AsyncProxy]:
+		'''Asynchronous views of :attr:`MSO4.ch_a` (1-indexed, like the synchronous list).'''
+		return [None] + [_AsyncProxy(self, lambda i=i: self.scope.ch_a[i]) for i in range(1, len(self.scope.ch_a))] # type: ignore
+
+	async def query(self, cmd: str) -> str:
+		'''Send a query to the scope and return the response.'''
+		return await self.run(lambda: self.scope.sc.query(cmd))
+
+	async def write(self, cmd: str) -> None:
+		'''Send a command to the scope.'''
+		await self.run(lambda: self.scope.sc.write(cmd))
+
+	async def set(self, name: str, value: Any) -> None:
+		'''Set a property of the scope (e.g. ``display``).'''
+		await self._proxy.set(name, value)
+
+	async def aclose(self) -> None:
+		'''Disconnect from the scope (if connected) and stop the worker.'''
+		if self.scope.connect_status:
+			await self.run(self.scope.dis)
+		self._executor.shutdown(wait=True)
+
+	def __getattr__(self, name: str) -> Any:
+		if name.startswith('_'):
+			raise AttributeError(name)
+		return getattr(self._proxy, name)
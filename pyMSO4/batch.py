@@ -0,0 +1,151 @@
+from typing import Callable
+
+import pyvisa
+
+from . import scope_logger
+
+# Attribute of the VISA resource holding the batch active on it. It is stored on the resource
+# so that it goes away with the connection.
+_ACTIVE = '_pymso4_batch'
+
+def _active(res: pyvisa.resources.MessageBasedResource) -> 'SCPIBatch | None':
+	return getattr(res, _ACTIVE, None)
+
+def join_commands(cmds: list[str]) -> str:
+	'''Join commands in a single SCPI message. Each command is rooted (``:`` prefix), so that
+	the scope does not interpret it relative to the previous one.'''
+	return ';'.join(c if c[:1] in (':', '*') else f':{c}' for c in cmds)
+
+class SCPIBatch:
+	'''Collects the commands written to a VISA resource and sends them as a single
+	``;``-joined SCPI message when the batch ends. Setters which read back the value they
+	set (e.g. :attr:`MSO4AnalogChannel.scale`) register their query with :func:`verify`:
+	all these queries are sent at the end as one combined query.
+
+	Queries issued inside the batch (e.g. by getters) first send the commands collected so far,
+	so they always see the updated configuration. If an exception is raised inside the batch (e.g.
+	by a validator) or while sending it, the collected commands are discarded and the values cached
+	by the setters called inside the batch are dropped (see :func:`on_discard`), so the local cache
+	never holds settings which were not sent.
+
+	Use :func:`MSO4.batch` rather than instantiating this class directly.
+	'''
+
+	def __init__(self, res: pyvisa.resources.MessageBasedResource):
+		'''
+		Args:
+			res: The VISA resource to batch commands for
+		'''
+		self.sc = res
+		self._commands: list[str] = []
+		self._verifications: list[tuple[str, Callable[[str], None]]] = []
+		self._discards: list[Callable[[], None]] = []
+		self._saved: dict[str, Callable | None] = {}
+
+	def __enter__(self) -> 'SCPIBatch':
+		active = _active(self.sc)
+		if active is not None:
+			return active # Nested batch, the outer one sends everything
+		for name, repl in (('write', self._write), ('query', self._query)):
+			self._saved[name] = vars(self.sc).get(name) # Might be wrapped (e.g. debug printing)
+			setattr(self.sc, name, repl)
+		setattr(self.sc, _ACTIVE, self)
+		return self
+
+	def __exit__(self, exc_type, exc, tb) -> None:
+		if _active(self.sc) is not self:
+			return
+		setattr(self.sc, _ACTIVE, None)
+		for name, saved in self._saved.items():
+			if saved is None:
+				delattr(self.sc, name)
+			else:
+				setattr(self.sc, name, saved)
+		if exc_type is None:
+			try:
+				self.send()
+			except BaseException:
+				self.discard()
+				raise
+			self._discards.clear()
+		else:
+			self.discard()
+
+	def discard(self) -> None:
+		'''Drop the commands and verifications not sent yet, and run the callbacks registered
+		with :func:`on_discard`.'''
+		self._commands.clear()
+		self._verifications.clear()
+		for callback in self._discards:
+			callback()
+		self._discards.clear()
+
+	def _write(self, cmd: str, *args, **kwargs) -> int:
+		self._commands.append(cmd)
+		return 0
+
+	def _query(self, cmd: str, *args, **kwargs) -> str:
+		self._send_commands()
+		# The query of the resource writes through self.sc.write, which is the batched one
+		self._saved_or_bound('write')(cmd)
+		return self.sc.read()
+
+	def _saved_or_bound(self, name: str) -> Callable:
+		saved = self._saved.get(name)
+		if saved is not None:
+			return saved
+		return getattr(type(self.sc), name).__get__(self.sc)
+
+	def _send_commands(self) -> None:
+		if self._commands:
+			self._saved_or_bound('write')(join_commands(self._commands))
+			self._commands.clear()
+
+	def verify(self, query: str, callback: Callable[[str], None]) -> None:
+		'''Register a query to be sent when the batch ends.
+
+		Args:
+			query: The query to send
+			callback: Called with the response to the query
+		'''
+		self._verifications.append((query, callback))
+
+	def send(self) -> None:
+		'''Send the collected commands in one message, followed by one combined
+		query for all the registered verifications.'''
+		self._send_commands()
+		if not self._verifications:
+			return
+		resp = self._saved_or_bound('query')(join_commands([q for q, _ in self._verifications])).strip().split(';')
+		if len(resp) != len(self._verifications):
+			scope_logger.warning('Got %d responses for %d batched queries: %s', len(resp), len(self._verifications), resp)
+		for (_, callback), r in zip(self._verifications, resp):
+			callback(r)
+		self._verifications.clear()
+
+def verify(res: pyvisa.resources.MessageBasedResource, query: str, callback: Callable[[str], None]) -> None:
+	'''Send a query and pass its response to ``callback``. If a batch is active on ``res``,
+	the query is deferred to the end of the batch instead.
+
+	Args:
+		res: The VISA resource to query
+		query: The query to send
+		callback: Called with the response to the query
+	'''
+	batch = _active(res)
+	if batch is None:
+		callback(res.query(query))
+	else:
+		batch.verify(query, callback)
+
+def on_discard(res: pyvisa.resources.MessageBasedResource, callback: Callable[[], None]) -> None:
+	'''Register a callback run if the batch active on ``res`` is discarded (e.g. to drop a value
+	cached by a setter whose command was never sent). Does nothing if no batch is active.
+
+	Args:
+		res: The VISA resource the command was written to
+		callback: Called if the batch is discarded
+	'''
+	batch = _active(res)
+	if batch is not None:
+		batch._discards.append(callback) # pylint: disable=protected-access
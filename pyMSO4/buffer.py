@@ -0,0 +1,193 @@
+import numpy as np
+
+from . import util
+from .acquisition import MSO4Acquisition
+
+class TraceBuffer(util.DisableNewAttr):
+	'''Preallocated store for waveforms captured in long acquisition campaigns.
+
+	All traces live in a single contiguous ``(n_traces, wfm_len)`` NumPy array, so the memory
+	used per trace is exactly ``wfm_len * byte_nr``. Rows are handed out as views to be filled
+	in place by :func:`MSO4Acquisition.read_waveform`:
+
+	.. code-block:: python
+
+		buf = TraceBuffer.from_acquisition(mso44.acq, 1000)
+		idx, row = buf.reserve()
+		try:
+			mso44.acq.read_waveform(out=row)
+			buf.commit(idx)
+		except visa.errors.VisaIOError:
+			buf.mark_timeout(idx)
+
+	In ring mode, slots are reused once the buffer is full and the oldest traces are overwritten.
+	'''
+
+	def __init__(self, n_traces: int, wfm_len: int, dtype: np.dtype | str, ring: bool = False):
+		'''Create a new trace buffer.
+
+		Args:
+			n_traces: Number of traces (rows) the buffer can hold
+			wfm_len: Number of points in each trace
+			dtype: Data type of the samples (e.g. :func:`MSO4Acquisition.get_datatype`).
+				Samples are stored in native byte order.
+			ring: If True, overwrite the oldest traces once the buffer is full
+
+		Raises:
+			ValueError: Invalid buffer size
+		'''
+		super().__init__()
+
+		if n_traces < 1 or wfm_len < 1:
+			raise ValueError(f'Invalid buffer size {n_traces}x{wfm_len}. Both must be positive.')
+
+		#: The underlying ``(n_traces, wfm_len)`` array. Use :func:`TraceBuffer.traces` to get
+		#: the valid traces in acquisition order.
+		self.data: np.ndarray = np.empty((n_traces, wfm_len), dtype=np.dtype(dtype).newbyteorder('='))
+		#: Whether the buffer works as a ring, overwriting the oldest traces when full
+		self.ring: bool = ring
+
+		self._valid = np.zeros(n_traces, dtype=bool)
+		self._timed_out = np.zeros(n_traces, dtype=bool)
+		self._reserved = None # Index of the slot currently handed out, if any
+		self._total = 0 # Number of slots handed out since creation (or reset)
+
+		self.disable_newattr()
+
+	@classmethod
+	def from_acquisition(cls, acq: MSO4Acquisition, n_traces: int, ring: bool = False) -> 'TraceBuffer':
+		'''Create a buffer sized from the current acquisition settings
+		(:attr:`MSO4Acquisition.wfm_len` and :func:`MSO4Acquisition.get_datatype`).
+
+		NOTE: This sends queries to the scope, call it before enabling curvestream mode.
+
+		Args:
+			acq: The acquisition object of a connected scope
+			n_traces: Number of traces the buffer can hold
+			ring: If True, overwrite the oldest traces once the buffer is full
+		'''
+		return cls(n_traces, acq.wfm_len, acq.get_datatype(), ring)
+
+	def __len__(self) -> int:
+		return int(np.count_nonzero(self._valid))
+
+	@property
+	def capacity(self) -> int:
+		'''Number of traces the buffer can hold.'''
+		return self.data.shape[0]
+
+	@property
+	def wfm_len(self) -> int:
+		'''Number of points in each trace.'''
+		return self.data.shape[1]
+
+	@property
+	def total(self) -> int:
+		'''Number of slots handed out since creation, including overwritten and timed out ones.'''
+		return self._total
+
+	@property
+	def valid(self) -> np.ndarray:
+		'''Boolean mask of the slots holding a valid trace (read-only view).'''
+		view = self._valid.view()
+		view.flags.writeable = False
+		return view
+
+	@property
+	def timed_out(self) -> np.ndarray:
+		'''Boolean mask of the slots whose acquisition timed out (read-only view).'''
+		view = self._timed_out.view()
+		view.flags.writeable = False
+		return view
+
+	@property
+	def full(self) -> bool:
+		'''True if no more slots can be handed out without overwriting (always False in ring mode).'''
+		return not self.ring and self._total >= self.capacity
+
+	def reserve(self) -> tuple[int, np.ndarray]:
+		'''Hand out the next slot to be filled. The slot is invalid until :func:`TraceBuffer.commit`
+		is called. Reserving again without committing reuses the same slot.
+
+		Returns: A tuple ``(index, row)`` where ``row`` is a writable view into the buffer
+
+		Raises:
+			IndexError: The buffer is full and not in ring mode
+		'''
+		if self._reserved is None:
+			if self.full:
+				raise IndexError(f'Trace buffer is full ({self.capacity} traces)')
+			self._reserved = self._total % self.capacity
+			self._total += 1
+		idx = self._reserved
+		self._valid[idx] = False
+		self._timed_out[idx] = False
+		return idx, self.data[idx]
+
+	def commit(self, idx: int) -> None:
+		'''Mark a reserved slot as holding a valid trace.
+
+		Args:
+			idx: The index returned by :func:`TraceBuffer.reserve`
+
+		Raises:
+			ValueError: The slot was not reserved
+		'''
+		self._release(idx)
+		self._valid[idx] = True
+
+	def mark_timeout(self, idx: int) -> None:
+		'''Mark a reserved slot as timed out. The slot keeps its place in the acquisition order
+		but does not hold a valid trace.
+
+		Args:
+			idx: The index returned by :func:`TraceBuffer.reserve`
+
+		Raises:
+			ValueError: The slot was not reserved
+		'''
+		self._release(idx)
+		self._timed_out[idx] = True
+
+	def _release(self, idx: int) -> None:
+		if idx != self._reserved:
+			raise ValueError(f'Slot {idx} was not reserved')
+		self._reserved = None
+
+	def append(self, trace: np.ndarray) -> int:
+		'''Copy a trace into the next slot and mark it as valid.
+
+		Args:
+			trace: 1-D array of ``wfm_len`` points
+
+		Returns: The index of the slot the trace was stored in
+		'''
+		idx, row = self.reserve()
+		row[:] = trace # On failure the slot stays reserved and is reused by the next reserve()
+		self.commit(idx)
+		return idx
+
+	def _order(self) -> np.ndarray:
+		'''Slot indices in acquisition order (oldest first).'''
+		n = min(self._total, self.capacity)
+		first = self._total - n
+		return np.arange(first, first + n) % self.capacity
+
+	def traces(self) -> np.ndarray:
+		'''Return the valid traces in acquisition order (oldest first).
+
+		Returns: A ``(n, wfm_len)`` array. This is a view when no reordering or
+			filtering is needed, otherwise a copy.
+		'''
+		order = self._order()
+		mask = self._valid[order]
+		if mask.all() and (order.size == 0 or order[0] == 0):
+			return self.data[:order.size]
+		return self.data[order[mask]]
+
+	def reset(self) -> None:
+		'''Discard all traces. The memory is kept allocated.'''
+		self._valid[:] = False
+		self._timed_out[:] = False
+		self._reserved = None
+		self._total = 0
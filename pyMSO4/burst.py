@@ -0,0 +1,99 @@
+from typing import Literal
+
+import numpy as np
+
+def _first_of_clusters(idx: np.ndarray, gap: int, values: np.ndarray | None = None) -> np.ndarray:
+	'''Split sorted indices into clusters separated by more than ``gap``, and return one index
+	per cluster: the first one, or the one with the highest value if ``values`` is given.'''
+	if len(idx) == 0:
+		return idx
+	cluster = np.concatenate(([0], np.cumsum(np.diff(idx) > gap)))
+	if values is None:
+		first = np.concatenate(([True], cluster[1:] != cluster[:-1]))
+		return idx[first]
+	order = np.lexsort((-values, cluster)) # By cluster, highest value first
+	first = np.concatenate(([True], cluster[order][1:] != cluster[order][:-1]))
+	return idx[order[first]]
+
+def find_edges(sync: np.ndarray, threshold: float | None = None, slope: Literal['rise', 'fall'] = 'rise',
+		holdoff: int = 0) -> np.ndarray:
+	'''Find the points where a sync signal crosses a threshold.
+
+	Args:
+		sync: The sync signal (raw levels or volts)
+		threshold: Crossing level, defaults to the midpoint between the minimum and maximum of ``sync``
+		slope: ``rise`` or ``fall``
+		holdoff: Crossings closer than this many points to the previous one are ignored (e.g. noise
+			around the threshold)
+
+	Returns: The index of the first point past the threshold of each edge
+
+	Raises:
+		ValueError: Invalid slope
+	'''
+	if slope not in ('rise', 'fall'):
+		raise ValueError(f'Invalid slope {slope}. Valid slopes are rise and fall')
+	if threshold is None:
+		threshold = (float(sync.min()) + float(sync.max())) / 2
+	above = sync >= threshold
+	edges = np.flatnonzero(~above[:-1] & above[1:] if slope == 'rise' else above[:-1] & ~above[1:]) + 1
+	return _first_of_clusters(edges, holdoff)
+
+def match_template(signal: np.ndarray, template: np.ndarray, min_corr: float = 0.8, min_distance: int | None = None) -> np.ndarray:
+	'''Find the occurrences of a template in a signal by normalized cross-correlation, computed
+	with FFTs for the whole signal at once.
+
+	Args:
+		signal: The signal to search
+		template: The pattern to find (e.g. the sync pattern, or the start of an operation)
+		min_corr: Minimum normalized correlation (1 is a perfect match)
+		min_distance: Matches closer than this many points are merged, keeping the best one.
+			Defaults to the length of the template.
+
+	Returns: The index of the first point of each match
+
+	Raises:
+		ValueError: The template is longer than the signal, or constant
+	'''
+	n, m = len(signal), len(template)
+	if m > n:
+		raise ValueError(f'Template ({m} points) is longer than the signal ({n} points)')
+	tmpl = np.asarray(template, dtype=np.float64) - np.mean(template)
+	tmpl_norm = np.sqrt(np.dot(tmpl, tmpl))
+	if tmpl_norm == 0:
+		raise ValueError('Template is constant')
+	x = np.asarray(signal, dtype=np.float64)
+	size = 1 << (n + m - 1).bit_length()
+	num = np.fft.irfft(np.fft.rfft(x, size) * np.conj(np.fft.rfft(tmpl, size)), size)[:n - m + 1]
+	# Energy of each window of the signal around its mean, from cumulative sums
+	s1 = np.concatenate(([0.0], np.cumsum(x)))
+	s2 = np.concatenate(([0.0], np.cumsum(x * x)))
+	win1 = s1[m:] - s1[:-m]
+	energy = np.maximum(s2[m:] - s2[:-m] - win1 * win1 / m, 0)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		corr = np.where(energy > 0, num / (np.sqrt(energy) * tmpl_norm), 0)
+	matches = np.flatnonzero(corr >= min_corr)
+	return _first_of_clusters(matches, m if min_distance is None else min_distance, corr[matches])
+
+def segment(data: np.ndarray, starts: np.ndarray, seg_len: int, offset: int = 0) -> np.ndarray:
+	'''Cut segments of a long record into a ``(n_segments, seg_len)`` array, in a single vectorized
+	copy. Segments which do not fit entirely in the record are dropped.
+
+	Args:
+		data: The record, ``(n_points,)`` (or ``(n_sources, n_points)``, giving a
+			``(n_segments, n_sources, seg_len)`` array)
+		starts: Index of each segment (e.g. from :func:`find_edges` or :func:`match_template`)
+		seg_len: Number of points of each segment
+		offset: Added to each start index, e.g. negative to include some points before the sync edge
+
+	Raises:
+		ValueError: Invalid segment length
+	'''
+	if seg_len < 1:
+		raise ValueError(f'Invalid segment length {seg_len}. Must be positive.')
+	first = np.asarray(starts, dtype=np.intp) + offset
+	first = first[(first >= 0) & (first + seg_len <= data.shape[-1])]
+	windows = np.lib.stride_tricks.sliding_window_view(data, seg_len, axis=-1) # No copy
+	if data.ndim == 1:
+		return windows[first]
+	return np.moveaxis(windows[..., first, :], -2, 0)
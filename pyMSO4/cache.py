@@ -0,0 +1,243 @@
+import time
+from typing import Any, Callable, Iterator
+
+import pyvisa
+
+from . import batch
+from . import state
+from . import util
+from . import scope_logger
+
+#: Cache policy: always query the scope
+NEVER = 'never'
+#: Cache policy: query the scope once, then keep the last value read or written
+WRITE_THROUGH = 'write'
+#: Cache policy: like :data:`WRITE_THROUGH`, but values expire after a timeout
+TTL = 'ttl'
+
+_policies = [NEVER, WRITE_THROUGH, TTL]
+
+# Attribute of the VISA resource counting the writes to settings affecting the waveform scaling.
+# It is stored on the resource so that it goes away with the connection.
+_SCALING_EPOCH = '_pymso4_scaling_epoch'
+
+def scaling_epoch(res: pyvisa.resources.MessageBasedResource) -> int:
+	'''Return a counter incremented every time a setting affecting the waveform scaling
+	(i.e. a setting of a channel or of the acquisition) is written through ``res``. Used to
+	invalidate values derived from several objects, like the waveform preamble.'''
+	return getattr(res, _SCALING_EPOCH, 0)
+
+class scpi_property(property): # pylint: disable=invalid-name
+	'''A property mapped to a SCPI setting of the scope, with a local cache.
+
+	The SCPI header is a format string, formatted with the owner object as ``self``
+	(e.g. ``'CH{self.channel}:SCAle'``). Reading the property sends ``<header>?``, writing it
+	sends ``<header> <value>``. Depending on the cache policy (see :func:`CachedComponent.set_cache_policy`),
+	values are kept in the owner's cache:
+
+		* :data:`NEVER`: always query the scope
+		* :data:`WRITE_THROUGH`: query once, then keep the last value read or written.
+		  Writing the cached value again is a no-op.
+		* :data:`TTL`: like :data:`WRITE_THROUGH`, but the cached value expires after ``ttl`` seconds
+	'''
+
+	def __init__(self, header: str, parse: Callable[[str], Any] = str.strip, fmt: Callable[[Any], str] = str,
+			validate: Callable[[Any, Any], Any] | None = None, policy: str = WRITE_THROUGH, ttl: float = 0.0,
+			verify: bool = False, invalidates: tuple[str, ...] = (), on_set: Callable[[Any, Any], None] | None = None,
+			readonly: bool = False, doc: str | None = None):
+		'''
+		Args:
+			header: SCPI header of the setting, formatted with the owner object as ``self``
+			parse: Convert the (stripped) response of the scope to the property value
+			fmt: Convert a value to the argument sent to the scope
+			validate: Called with the owner object and the value being set. Returns the
+				(normalized) value to set, or raises ValueError.
+			policy: Default cache policy (:data:`NEVER`, :data:`WRITE_THROUGH` or :data:`TTL`)
+			ttl: Lifetime of cached values (in s) with the :data:`TTL` policy
+			verify: Read the value back after setting it and warn if the scope did not accept it.
+				The read back is deferred to the end of the batch when inside :func:`MSO4.batch`.
+			invalidates: Names of other properties of the owner whose cached value is dropped
+				when this one is set (e.g. horizontal settings affecting each other)
+			on_set: Called with the owner object and the new value after it has been written
+				(e.g. to update settings depending on this one)
+			readonly: The setting can only be queried
+			doc: Docstring
+		'''
+		if policy not in _policies:
+			raise ValueError(f'Invalid cache policy {policy}. Valid policies are {_policies}')
+		super().__init__(self._get, None if readonly else self._set, None, doc)
+		self.header = header
+		self.parse = parse
+		self.fmt = fmt
+		self.validate = validate
+		self.policy = policy
+		self.ttl = ttl
+		self.verify = verify
+		self.invalidates = invalidates
+		self.on_set = on_set
+		self.name = ''
+
+	def __set_name__(self, owner: type, name: str) -> None:
+		self.name = name
+
+	def format_header(self, obj: 'CachedComponent') -> str:
+		'''Return the SCPI header of this setting for a given owner object.'''
+		return self.header.format(self=obj)
+
+	def _get(self, obj: 'CachedComponent') -> Any:
+		policy, ttl = obj._cache_policy(self)
+		if policy != NEVER and self.name in obj._cache:
+			value, stamp = obj._cache[self.name]
+			if policy != TTL or time.monotonic() - stamp < ttl:
+				obj._cache_counts['hits'] += 1
+				return value
+		obj._cache_counts['misses'] += 1
+		value = self.parse(obj.sc.query(f'{self.format_header(obj)}?').strip())
+		if policy != NEVER:
+			obj._cache[self.name] = (value, time.monotonic())
+		return value
+
+	def _set(self, obj: 'CachedComponent', value: Any) -> None:
+		if self.validate is not None:
+			value = self.validate(obj, value)
+		policy, _ = obj._cache_policy(self)
+		if policy == WRITE_THROUGH and obj._cache.get(self.name, (None,))[0] == value:
+			return
+		header = self.format_header(obj)
+		obj.sc.write(f'{header} {self.fmt(value)}')
+		if obj._affects_scaling:
+			setattr(obj.sc, _SCALING_EPOCH, scaling_epoch(obj.sc) + 1)
+		for name in self.invalidates:
+			obj._cache.pop(name, None)
+		if policy != NEVER:
+			obj._cache[self.name] = (value, time.monotonic())
+			batch.on_discard(obj.sc, lambda: obj._cache.pop(self.name, None))
+		if self.on_set is not None:
+			self.on_set(obj, value)
+		if not self.verify:
+			return
+		def check(resp: str):
+			actual = self.parse(resp.strip())
+			if policy != NEVER:
+				obj._cache[self.name] = (actual, time.monotonic())
+			if actual != value:
+				scope_logger.warning('Failed to set %s to %s. Got %s instead.', header, value, actual)
+		batch.verify(obj.sc, f'{header}?', check)
+
+class CachedComponent(util.DisableNewAttr):
+	'''Base class of the objects holding scope settings (channels, acquisition, triggers).
+	Settings are declared with :class:`scpi_property` and share a single cache.'''
+
+	_affects_scaling = False # Whether settings of this object change the waveform scaling (see scaling_epoch)
+
+	def __init__(self, res: pyvisa.resources.MessageBasedResource):
+		'''
+		Args:
+			res: The VISA resource to use for communication
+		'''
+		super().__init__()
+
+		self.sc: pyvisa.resources.MessageBasedResource = res
+		self._cache: dict[str, tuple[Any, float]] = {} # name -> (value, time of caching)
+		self._cache_counts: dict[str, int] = {'hits': 0, 'misses': 0}
+		self._cache_policies: dict[str, tuple[str, float]] = {} # Per-instance policy overrides
+
+	@classmethod
+	def _scpi_properties(cls) -> Iterator[scpi_property]:
+		seen = set()
+		for klass in cls.__mro__:
+			for name, attr in vars(klass).items():
+				if isinstance(attr, scpi_property) and name not in seen:
+					seen.add(name)
+					yield attr
+
+	def _cache_policy(self, prop: scpi_property) -> tuple[str, float]:
+		return self._cache_policies.get(prop.name, (prop.policy, prop.ttl))
+
+	def set_cache_policy(self, name: str, policy: str, ttl: float = 0.0) -> None:
+		'''Change the cache policy of a setting for this object.
+
+		Args:
+			name: Name of the property (e.g. ``horiz_scale``)
+			policy: :data:`NEVER`, :data:`WRITE_THROUGH` or :data:`TTL`
+			ttl: Lifetime of cached values (in s) with the :data:`TTL` policy
+
+		Raises:
+			ValueError: Invalid property or policy
+		'''
+		if not isinstance(getattr(type(self), name, None), scpi_property):
+			raise ValueError(f'{name} is not a cached SCPI property of {type(self).__name__}')
+		if policy not in _policies:
+			raise ValueError(f'Invalid cache policy {policy}. Valid policies are {_policies}')
+		self._cache_policies[name] = (policy, ttl)
+		self._cache.pop(name, None)
+
+	def clear_caches(self):
+		'''Resets the local configuration cache so that values will be fetched from
+		the scope.
+
+		This is useful when the scope configuration is (potentially) changed externally.
+		'''
+		self._cache.clear()
+
+	def cache_stats(self) -> dict[str, int]:
+		'''Return the number of cache ``hits`` and ``misses`` (i.e. queries sent to the scope)
+		of the settings of this object.'''
+		return dict(self._cache_counts)
+
+	def load_state(self, st: state.MSO4State):
+		'''Fill the local configuration cache from a scope state (see :func:`MSO4.snapshot`).
+
+		Args:
+			st: The state to take values from
+		'''
+		for prop in self._scpi_properties():
+			if self._cache_policy(prop)[0] == NEVER:
+				continue
+			value = st.get(prop.format_header(self))
+			if value is not None:
+				self._cache[prop.name] = (prop.parse(value), time.monotonic())
+
+# Validators for scpi_property
+
+def choice(label: str, choices: list[str]) -> Callable[[Any, Any], str]:
+	'''Accept one of ``choices`` (case insensitive), normalized to lower case.'''
+	def validate(_, value):
+		if not isinstance(value, str) or value.lower() not in choices:
+			raise ValueError(f'Invalid {label} {value}. Valid values are {choices}')
+		return value.lower()
+	return validate
+
+def number(label: str, low: float | None = None, high: float | None = None) -> Callable[[Any, Any], float | int]:
+	'''Accept an int or a float, optionally within ``[low, high]``.'''
+	def validate(_, value):
+		if isinstance(value, bool) or not isinstance(value, (float, int)):
+			raise ValueError(f'Invalid {label} {value}. Must be a float or an int.')
+		if (low is not None and value < low) or (high is not None and value > high):
+			raise ValueError(f'Invalid {label} {value}. Must be between {low} and {high}.')
+		return value
+	return validate
+
+def integer(label: str) -> Callable[[Any, Any], int]:
+	'''Accept an int.'''
+	def validate(_, value):
+		if isinstance(value, bool) or not isinstance(value, int):
+			raise ValueError(f'Invalid {label} {value}. Must be an int.')
+		return value
+	return validate
+
+def boolean(label: str) -> Callable[[Any, Any], bool]:
+	'''Accept a bool.'''
+	def validate(_, value):
+		if not isinstance(value, bool):
+			raise ValueError(f'Invalid {label} {value}. Must be bool.')
+		return value
+	return validate
+
+def parse_bool(resp: str) -> bool:
+	'''Parse a SCPI boolean (``1``/``0`` or ``ON``/``OFF``).'''
+	return resp.strip().upper() in ('1', 'ON')
+
+def fmt_bool(value: bool) -> str:
+	'''Format a bool as a SCPI boolean.'''
+	return str(int(value))
@@ -1,11 +1,12 @@
 import pyvisa
 
-from . import util
-from . import scope_logger
+from . import cache
 
-class MSO4AnalogChannel(util.DisableNewAttr):
+class MSO4AnalogChannel(cache.CachedComponent):
 	'''Settings for each analog channel'''
-	
+
+	_affects_scaling = True
+
 	def __init__(self, res: pyvisa.resources.MessageBasedResource, channel: int):
 		'''Creates a new channel object
 
@@ -13,73 +14,142 @@ class MSO4AnalogChannel(util.DisableNewAttr):
 			res: The VISA resource to use for communication
 			channel: The channel number (1-n)
 		'''
-		super().__init__()
+		super().__init__(res)
 
-		self.sc = res
 		self.channel = channel
 
 		self.disable_newattr()
 
-	def clear_caches(self):
-		'''Clear channel caches'''
-		# No caches to clear, implemented to have a consistent interface
-		pass
-
-	@property
-	def enable(self) -> bool:
-		'''Enables the channel.
+	enable = cache.scpi_property('SELect:CH{self.channel}', cache.parse_bool, cache.fmt_bool,
+		validate=cache.boolean('enable'), doc='''Enables the channel.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the enable status
 
 		:Setter: Set the enable status
-		'''
-		return bool(int(self.sc.query(f'SELect:CH{self.channel}?').strip()))
-	@enable.setter
-	def enable(self, value: bool):
-		if not isinstance(value, bool):
-			raise ValueError(f'Invalid enable {value}. Must be bool')
-		self.sc.write(f'SELect:CH{self.channel} {int(value)}')
+		''')
 
-	@property
-	def scale(self) -> float:
-		'''Sets the vertical scale of the waveform.
+	scale = cache.scpi_property('CH{self.channel}:SCAle', float, validate=cache.number('scale'),
+		verify=True, doc='''Sets the vertical scale of the waveform.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the scale in V (float)
 
 		:Setter: Set the scale in V (int or float)
-		'''
-		return float(self.sc.query(f'CH{self.channel}:SCAle?').strip())
-	@scale.setter
-	def scale(self, value: float | int):
-		if not isinstance(value, float) and not isinstance(value, int):
-			raise ValueError(f'Invalid scale {value}. Must be float or int')
-		self.sc.write(f'CH{self.channel}:SCAle {value}')
-		# Check if the scale was set correctly
-		actual = self.scale
-		if actual != value:
-			scope_logger.warning('Channel %d scale was set to %f V, but is actually %f V', self.channel, value, actual)
+		''')
 
-	@property
-	def position(self) -> float:
-		'''Sets the vertical position of the waveform.
+	position = cache.scpi_property('CH{self.channel}:POSition', float, validate=cache.number('position'),
+		verify=True, doc='''Sets the vertical position of the waveform.
 
-		*Not cached*
+		*Cached*
 
 		:Getter: Return the position in V (float)
 
 		:Setter: Set the position in V (int or float)
+		''')
+
+class MSO4MathChannel(cache.CachedComponent):
+	'''Settings for each math waveform. Math waveforms are computed by the scope (e.g. the difference
+	of two channels, or an average) and can be read like a channel (see :attr:`MSO4Acquisition.wfm_src`),
+	so only the result is transferred. Create them with :func:`MSO4.add_math`.'''
+
+	_affects_scaling = True
+
+	_math_types = ['basic', 'fft', 'advanced', 'filter']
+	_functions = ['add', 'subtract', 'multiply', 'divide']
+
+	def __init__(self, res: pyvisa.resources.MessageBasedResource, math: int):
+		'''Creates a new math waveform object
+
+		Args:
+			res: The VISA resource to use for communication
+			math: The math waveform number (1-n)
 		'''
-		return float(self.sc.query(f'CH{self.channel}:POSition?').strip())
-	@position.setter
-	def position(self, value: float | int):
-		if not isinstance(value, float) and not isinstance(value, int):
-			raise ValueError(f'Invalid position {value}. Must be float or int')
-		self.sc.write(f'CH{self.channel}:POSition {value}')
-		# Check if the position was set correctly
-		actual = self.position
-		if actual != value:
-			scope_logger.warning('Channel %d position was set to %f V, but is actually %f V', self.channel, value, actual)
+		super().__init__(res)
+
+		self.math = math
+
+		self.disable_newattr()
+
+	@property
+	def source(self) -> str:
+		'''Name of the math waveform as a waveform source (e.g. ``math1``).'''
+		return f'math{self.math}'
+
+	math_type = cache.scpi_property('MATH:MATH{self.math}:TYPe', str.lower, validate=cache.choice('math type', _math_types),
+		doc='''The type of math waveform. Valid values are:
+			* ``basic``: an arithmetic function of two sources (see :attr:`MSO4MathChannel.function`)
+			* ``fft``: the spectrum of a source
+			* ``advanced``: an expression (see :attr:`MSO4MathChannel.definition`)
+			* ``filter``: a filtered source
+
+		*Cached*
+
+		:Getter: Return the type
+
+		:Setter: Set the type
+		''')
+
+	definition = cache.scpi_property('MATH:MATH{self.math}:DEFine', lambda r: r.strip('"'), lambda v: f'"{v}"',
+		doc='''The expression of an ``advanced`` math waveform, e.g. ``CH1-CH2``.
+
+		*Cached*
+
+		:Getter: Return the expression
+
+		:Setter: Set the expression (str)
+		''')
+
+	source1 = cache.scpi_property('MATH:MATH{self.math}:SOUrce1', str.lower,
+		doc='''The first source of a ``basic`` math waveform (e.g. ``ch1``).
+
+		*Cached*
+
+		:Getter: Return the source
+
+		:Setter: Set the source
+		''')
+
+	source2 = cache.scpi_property('MATH:MATH{self.math}:SOUrce2', str.lower,
+		doc='''The second source of a ``basic`` math waveform (e.g. ``ch2``).
+
+		*Cached*
+
+		:Getter: Return the source
+
+		:Setter: Set the source
+		''')
+
+	function = cache.scpi_property('MATH:MATH{self.math}:FUNCtion', str.lower, validate=cache.choice('function', _functions),
+		doc='''The arithmetic function of a ``basic`` math waveform. Valid values are ``add``,
+		``subtract``, ``multiply`` and ``divide`` (``source1 - source2`` for ``subtract``).
+
+		*Cached*
+
+		:Getter: Return the function
+
+		:Setter: Set the function
+		''')
+
+	avg_mode = cache.scpi_property('MATH:MATH{self.math}:AVG:MODE', cache.parse_bool, cache.fmt_bool,
+		validate=cache.boolean('average mode'), doc='''Enables averaging of the math waveform over
+		successive acquisitions, independently of the acquisition mode.
+
+		*Cached*
+
+		:Getter: Return the average mode
+
+		:Setter: Set the average mode
+		''')
+
+	avg_weight = cache.scpi_property('MATH:MATH{self.math}:AVG:WEIGht', int, validate=cache.integer('average weight'),
+		doc='''The number of acquisitions averaged when :attr:`MSO4MathChannel.avg_mode` is enabled.
+
+		*Cached*
+
+		:Getter: Return the weight
+
+		:Setter: Set the weight
+		''')
@@ -0,0 +1,258 @@
+import concurrent.futures
+from typing import Any, Callable, Sequence
+
+import numpy as np
+
+from . import util
+from .acquisition import MSO4Preamble
+from .pyMSO4 import MSO4
+from .state import MSO4State
+from .wait import wait_complete
+
+class MSO4GroupError(OSError):
+	'''An operation failed on some of the scopes of an :class:`MSO4Group`.'''
+
+	def __init__(self, op: str, errors: dict[int, BaseException]):
+		#: Exception raised on each scope that failed, keyed by the index of the scope
+		self.errors = errors
+		msg = ', '.join(f'scope {i}: {e!r}' for i, e in errors.items())
+		super().__init__(f'{op} failed on {len(errors)} scope(s) ({msg})')
+
+def align_traces(traces: Sequence[np.ndarray], preambles: Sequence[MSO4Preamble],
+		deskew: Sequence[float] | None = None) -> tuple[np.ndarray, list[np.ndarray]]:
+	'''Align the waveforms of several scopes on a common time axis, relative to the trigger of
+	each scope. The waveforms are cropped to the time window covered by all of them: with the same
+	sample interval, the returned arrays are views of ``traces``; otherwise all the waveforms are
+	linearly interpolated on the grid of the scope with the largest sample interval.
+
+	Args:
+		traces: Waveform of each scope, ``(n_points,)`` or ``(n_sources, n_points)``
+		preambles: Preamble of each scope (see :func:`MSO4Acquisition.preamble`)
+		deskew: Time (in s) added to the time axis of each scope, e.g. to compensate for
+			different trigger cable lengths
+
+	Returns: The common time axis (in s) and the aligned waveform of each scope
+
+	Raises:
+		ValueError: The waveforms do not overlap, or the arguments have different lengths
+	'''
+	if len(traces) != len(preambles) or (deskew is not None and len(deskew) != len(traces)):
+		raise ValueError('One preamble (and deskew) is needed for each waveform')
+	deskew = deskew or [0.0] * len(traces)
+	starts = [p.xzero - p.pt_off * p.xincr + d for p, d in zip(preambles, deskew)]
+	ends = [s + (t.shape[-1] - 1) * p.xincr for s, t, p in zip(starts, traces, preambles)]
+	start, end = max(starts), min(ends)
+	xincr = max(p.xincr for p in preambles)
+	if end < start or xincr <= 0:
+		raise ValueError('The waveforms do not overlap')
+
+	n = int(np.floor((end - start) / xincr + 1e-6)) + 1
+	if all(np.isclose(p.xincr, xincr, rtol=1e-9, atol=0) for p in preambles):
+		aligned = []
+		for s, t in zip(starts, traces):
+			i0 = int(round((start - s) / xincr))
+			aligned.append(t[..., i0:i0 + n])
+		n = min(a.shape[-1] for a in aligned) # Rounding might leave one point less
+		aligned = [a[..., :n] for a in aligned]
+	else:
+		grid = start + np.arange(n) * xincr
+		aligned = []
+		for s, t, p in zip(starts, traces, preambles):
+			x = s + np.arange(t.shape[-1]) * p.xincr
+			rows = np.atleast_2d(t)
+			out = np.stack([np.interp(grid, x, row) for row in rows])
+			aligned.append(out if t.ndim > 1 else out[0])
+	return start + np.arange(n) * xincr, aligned
+
+class MSO4Group(util.DisableNewAttr):
+	'''Drive several scopes in parallel. Each scope has its own worker thread, which runs all the
+	operations on it in order, so the time taken by an operation on the whole group is the time
+	taken by the slowest scope rather than the sum:
+
+	.. code-block:: python
+
+		group = pyMSO4.MSO4Group([pyMSO4.MSO4(), pyMSO4.MSO4()])
+		group.con([{'ip': '128.181.240.130'}, {'ip': '128.181.240.131'}])
+		def setup(scope):
+			scope.acq.horiz_scale = 200e-9
+			scope.acq.wfm_src = ['ch1']
+		group.configure(setup) # Sent in a single message to each scope
+		group.arm()
+		target.simpleserial_write('p', pt) # Triggers all the scopes
+		t, traces = group.collect(timeout=1000)
+
+	If an operation fails on any scope, :class:`MSO4GroupError` is raised once all the scopes
+	are done, with the exception raised on each scope that failed.
+	'''
+
+	def __init__(self, scopes: Sequence[MSO4]):
+		'''
+		Args:
+			scopes: The scopes (connected or not, see :func:`MSO4Group.con`)
+
+		Raises:
+			ValueError: The same scope object is in the group more than once
+		'''
+		super().__init__()
+
+		if len({id(s) for s in scopes}) != len(scopes):
+			raise ValueError('Each scope can only be in the group once')
+		#: The scopes, in the order used for all the results
+		self.scopes: list[MSO4] = list(scopes)
+		self._workers = [concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'pyMSO4-group-{i}')
+			for i in range(len(self.scopes))]
+
+		self.disable_newattr()
+
+	def __len__(self) -> int:
+		return len(self.scopes)
+
+	def __getitem__(self, idx: int) -> MSO4:
+		return self.scopes[idx]
+
+	def __enter__(self) -> 'MSO4Group':
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.close()
+
+	def run(self, func: Callable[..., Any], *args, **kwargs) -> list[Any]:
+		'''Call ``func(scope, *args, **kwargs)`` on all the scopes in parallel, each in its worker.
+
+		Returns: The result for each scope
+
+		Raises:
+			MSO4GroupError: ``func`` raised on some of the scopes
+		'''
+		return self._gather(getattr(func, '__name__', 'operation'),
+			[w.submit(func, s, *args, **kwargs) for w, s in zip(self._workers, self.scopes)])
+
+	def run_each(self, func: Callable[[MSO4, Any], Any], args: Sequence[Any]) -> list[Any]:
+		'''Call ``func(scope, arg)`` on all the scopes in parallel, with a different argument for each.
+
+		Returns: The result for each scope
+
+		Raises:
+			ValueError: Not one argument per scope
+			MSO4GroupError: ``func`` raised on some of the scopes
+		'''
+		if len(args) != len(self.scopes):
+			raise ValueError(f'Expected {len(self.scopes)} arguments, got {len(args)}')
+		return self._gather(getattr(func, '__name__', 'operation'),
+			[w.submit(func, s, a) for w, s, a in zip(self._workers, self.scopes, args)])
+
+	@staticmethod
+	def _gather(op: str, futures: list[concurrent.futures.Future]) -> list[Any]:
+		concurrent.futures.wait(futures) # Do not leave operations running on any scope
+		errors = {i: f.exception() for i, f in enumerate(futures) if f.exception() is not None}
+		if errors:
+			raise MSO4GroupError(op, errors) from next(iter(errors.values()))
+		return [f.result() for f in futures]
+
+	def con(self, con_kwargs: Sequence[dict[str, Any]]) -> None:
+		'''Connect all the scopes in parallel. If some fail, the others are left connected.
+
+		Args:
+			con_kwargs: Arguments passed to :func:`MSO4.con` for each scope
+
+		Raises:
+			MSO4GroupError: Some scopes could not be connected
+		'''
+		self.run_each(lambda s, kw: s.con(**kw), con_kwargs)
+
+	def dis(self) -> None:
+		'''Disconnect all the connected scopes in parallel.'''
+		self.run(lambda s: s.dis() if s.connect_status else None)
+
+	def close(self) -> None:
+		'''Disconnect all the scopes and stop the workers.'''
+		try:
+			self.dis()
+		finally:
+			for w in self._workers:
+				w.shutdown()
+
+	def configure(self, config: Callable[[MSO4], None] | MSO4State) -> None:
+		'''Apply the same configuration to all the scopes in parallel.
+
+		Args:
+			config: Either a function configuring a scope, run inside :func:`MSO4.batch` so that
+				each scope receives a single message, or a state taken with :func:`MSO4.snapshot`
+				(only the settings which differ are sent, see :func:`MSO4.apply`)
+
+		Raises:
+			MSO4GroupError: The configuration failed on some of the scopes
+		'''
+		self.run(self._configure, config)
+
+	def configure_each(self, configs: Sequence[Callable[[MSO4], None] | MSO4State]) -> None:
+		'''Apply a different configuration to each scope in parallel (see :func:`MSO4Group.configure`).
+
+		Raises:
+			MSO4GroupError: The configuration failed on some of the scopes
+		'''
+		self.run_each(self._configure, configs)
+
+	@staticmethod
+	def _configure(scope: MSO4, config: Callable[[MSO4], None] | MSO4State) -> None:
+		if isinstance(config, MSO4State):
+			scope.apply(config)
+			return
+		with scope.batch():
+			config(scope)
+
+	def snapshot(self) -> list[MSO4State]:
+		'''Fetch the configuration of all the scopes in parallel (see :func:`MSO4.snapshot`).'''
+		return self.run(MSO4.snapshot)
+
+	def arm(self) -> None:
+		'''Arm a single sequence acquisition on all the scopes in parallel. Returns when all of
+		them are ready for the trigger (see :func:`MSO4Acquisition.arm`).'''
+		self.run(lambda s: s.acq.arm())
+
+	def wait(self, timeout: float | None = None) -> None:
+		'''Wait for the acquisition of all the scopes to complete (see :func:`wait_complete`).
+
+		Args:
+			timeout: Maximum time (in ms) to wait for each scope, None to wait forever
+
+		Raises:
+			MSO4GroupError: Some scopes did not complete (:class:`TimeoutError`) within ``timeout``
+		'''
+		self.run(lambda s: wait_complete(s.sc, timeout))
+
+	def read(self) -> list[np.ndarray]:
+		'''Read the waveforms of all the scopes in parallel, a single transfer each.
+
+		Returns: The raw ``(n_sources, n_points)`` waveforms of each scope
+			(see :func:`MSO4Acquisition.query_waveforms`)
+		'''
+		return self.run(lambda s: s.acq.query_waveforms())
+
+	def collect(self, timeout: float | None = None, deskew: Sequence[float] | None = None) -> tuple[np.ndarray, list[np.ndarray]]:
+		'''Wait for the acquisition armed with :func:`MSO4Group.arm`, read the waveforms and align
+		them on a common time axis (see :func:`align_traces`).
+
+		Args:
+			timeout: Maximum time (in ms) to wait for each scope, None to wait forever
+			deskew: Time (in s) added to the time axis of each scope
+
+		Returns: The common time axis (in s) and the raw ``(n_sources, n_points)`` waveforms of
+			each scope. Use :func:`MSO4Acquisition.to_volts` of each scope to scale them.
+
+		Raises:
+			MSO4GroupError: An operation failed on some of the scopes
+		'''
+		def collect_one(scope: MSO4) -> tuple[np.ndarray, MSO4Preamble]:
+			wait_complete(scope.sc, timeout)
+			return scope.acq.query_waveforms(), scope.acq.preamble()
+		traces, preambles = zip(*self.run(collect_one))
+		return align_traces(traces, preambles, deskew)
+
+	def acquire(self, timeout: float | None = None, deskew: Sequence[float] | None = None) -> tuple[np.ndarray, list[np.ndarray]]:
+		'''Arm all the scopes, then collect the aligned waveforms (see :func:`MSO4Group.collect`).
+		Use :func:`MSO4Group.arm` and :func:`MSO4Group.collect` instead when the trigger must be
+		sent once all the scopes are armed.
+		'''
+		self.arm()
+		return self.collect(timeout, deskew)
@@ -0,0 +1,236 @@
+import bisect
+import functools
+import time
+from typing import Callable
+
+import pyvisa
+
+from . import util
+
+#: Default upper bounds (in s) of the latency histogram buckets
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+	1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Methods wrapped on the resource. All the higher level pyvisa methods (write, query,
+# read_binary_values...) end up in one of these, so each transfer is seen exactly once
+_WRAPPED = ('write_raw', '_read_raw', 'read_bytes')
+
+#: Signature of the hooks: ``hook(command, op, nbytes, seconds)``, with ``op`` ``write`` or ``read``
+Hook = Callable[[str, str, int, float], None]
+
+@functools.lru_cache(maxsize=1024)
+def command_key(message: bytes) -> str:
+	'''Return the headers of the commands in a message, without arguments and leading colons
+	(e.g. ``CH1:SCAle;HORizontal:SCAle`` for ``:CH1:SCAle 0.01;:HORizontal:SCAle 2e-7``).'''
+	text = message[:256].decode('latin-1').split('#', 1)[0] # Do not parse binary blocks
+	return ';'.join(c.split(None, 1)[0].lstrip(':') for c in text.split(';') if c.strip())
+
+class CommandStats(util.DisableNewAttr):
+	'''Counters of a command (or of the responses to it).'''
+
+	def __init__(self, n_buckets: int):
+		super().__init__()
+
+		#: Number of messages written
+		self.writes: int = 0
+		#: Number of reads (a response might take more than one)
+		self.reads: int = 0
+		#: Bytes written
+		self.bytes_out: int = 0
+		#: Bytes read
+		self.bytes_in: int = 0
+		#: Total time (in s) spent writing
+		self.write_time: float = 0.0
+		#: Total time (in s) spent reading
+		self.read_time: float = 0.0
+		#: Latency histogram of the writes (one count per bucket, the last one is +Inf)
+		self.write_hist: list[int] = [0] * (n_buckets + 1)
+		#: Latency histogram of the reads (one count per bucket, the last one is +Inf)
+		self.read_hist: list[int] = [0] * (n_buckets + 1)
+
+		self.disable_newattr()
+
+	def as_dict(self) -> dict[str, float]:
+		'''Return the counters as a dict (``writes``, ``reads``, ``bytes_out``, ``bytes_in``,
+		``write_time``, ``read_time`` and their sum ``time``, in s).'''
+		return {
+			'writes': self.writes,
+			'reads': self.reads,
+			'bytes_out': self.bytes_out,
+			'bytes_in': self.bytes_in,
+			'write_time': self.write_time,
+			'read_time': self.read_time,
+			'time': self.write_time + self.read_time,
+		}
+
+class VisaInstrumentation(util.DisableNewAttr):
+	'''Per-command counters, bytes in/out and latency histograms of the VISA transfers of a
+	resource, used by :func:`MSO4.stats`.
+
+	Nothing is installed on the resource unless statistics are enabled or hooks are registered:
+	the cost when disabled is zero. Reads are accounted to the last command written (e.g. the
+	waveforms received in curvestream mode to ``CURVEStream?``).
+
+	.. code-block:: python
+
+		mso44.instrument = True
+		... # Configure the scope
+		for cmd, s in list(mso44.stats().items())[:5]: # Slowest commands first
+			logging.info('%-40s %5d %8.2f ms', cmd, s['writes'], s['time'] * 1e3)
+		open('metrics.prom', 'w').write(mso44.instrumentation.prometheus())
+	'''
+
+	def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+		'''
+		Args:
+			buckets: Upper bounds (in s) of the latency histogram buckets, sorted
+		'''
+		super().__init__()
+
+		#: Upper bounds (in s) of the latency histogram buckets
+		self.buckets: tuple[float, ...] = tuple(buckets)
+		#: Collect the statistics returned by :func:`VisaInstrumentation.stats`
+		self.enabled: bool = False
+		#: Callables called after each transfer with ``(command, op, nbytes, seconds)``
+		self.hooks: list[Hook] = []
+
+		self._commands: dict[str, CommandStats] = {}
+		self._last = '' # Last command written, reads are accounted to it
+		self._res: pyvisa.resources.MessageBasedResource | None = None
+
+		self.disable_newattr()
+
+	@property
+	def active(self) -> bool:
+		'''True if the wrappers are needed (statistics enabled or hooks registered).'''
+		return self.enabled or bool(self.hooks)
+
+	def attach(self, res: pyvisa.resources.MessageBasedResource | None) -> None:
+		'''Install the wrappers on a resource if :attr:`VisaInstrumentation.active`, remove them
+		otherwise. Call it again after changing :attr:`VisaInstrumentation.enabled` or
+		:attr:`VisaInstrumentation.hooks`.
+
+		Args:
+			res: The resource to instrument, None to only remove the wrappers from the current one
+		'''
+		if self._res is not None and (res is not self._res or not self.active):
+			for name in _WRAPPED:
+				vars(self._res).pop(name, None)
+			self._res = None
+		if res is None or not self.active or self._res is res:
+			return
+		self._res = res
+		res.write_raw = self._wrap_write(res.write_raw) # type: ignore
+		res._read_raw = self._wrap_read(res._read_raw) # type: ignore # pylint: disable=protected-access
+		res.read_bytes = self._wrap_read(res.read_bytes) # type: ignore
+
+	def _record(self, command: str, op: str, nbytes: int, dt: float) -> None:
+		if self.enabled:
+			s = self._commands.get(command)
+			if s is None:
+				s = self._commands[command] = CommandStats(len(self.buckets))
+			idx = bisect.bisect_left(self.buckets, dt)
+			if op == 'write':
+				s.writes += 1
+				s.bytes_out += nbytes
+				s.write_time += dt
+				s.write_hist[idx] += 1
+			else:
+				s.reads += 1
+				s.bytes_in += nbytes
+				s.read_time += dt
+				s.read_hist[idx] += 1
+		for hook in self.hooks:
+			hook(command, op, nbytes, dt)
+
+	def _wrap_write(self, func: Callable[[bytes], int]) -> Callable[[bytes], int]:
+		def write_raw(message: bytes) -> int:
+			start = time.perf_counter()
+			try:
+				return func(message)
+			finally:
+				self._last = command_key(bytes(message))
+				self._record(self._last, 'write', len(message), time.perf_counter() - start)
+		return write_raw
+
+	def _wrap_read(self, func: Callable[..., bytes]) -> Callable[..., bytes]:
+		def read(*args, **kwargs) -> bytes:
+			start = time.perf_counter()
+			data = b''
+			try:
+				data = func(*args, **kwargs)
+				return data
+			finally:
+				self._record(self._last, 'read', len(data), time.perf_counter() - start)
+		return read
+
+	def stats(self) -> dict[str, dict[str, float]]:
+		'''Return the counters of each command (``writes``, ``reads``, ``bytes_out``, ``bytes_in``,
+		``write_time``, ``read_time`` and their sum ``time``, in s), the commands which took the
+		longest first.'''
+		stats = {cmd: s.as_dict() for cmd, s in self._commands.items()}
+		return dict(sorted(stats.items(), key=lambda kv: kv[1]['time'], reverse=True))
+
+	def histogram(self, command: str, op: str = 'read') -> list[int]:
+		'''Return the latency histogram of a command: the number of ``write`` or ``read`` transfers
+		which took at most the corresponding :attr:`VisaInstrumentation.buckets` upper bound
+		(not cumulative), the last element counting the slower ones.
+
+		Raises:
+			KeyError: The command was never sent
+			ValueError: Invalid op
+		'''
+		if op not in ('write', 'read'):
+			raise ValueError(f'Invalid op {op}. Valid ops are write and read')
+		s = self._commands[command]
+		return list(s.write_hist if op == 'write' else s.read_hist)
+
+	def reset(self) -> None:
+		'''Reset all the counters.'''
+		self._commands.clear()
+
+	def prometheus(self, prefix: str = 'pymso4_visa', labels: dict[str, str] | None = None) -> str:
+		'''Export the counters in the Prometheus text exposition format, e.g. to be written to a
+		file collected by the node exporter, or served over HTTP.
+
+		Args:
+			prefix: Prefix of the metric names
+			labels: Additional labels added to every sample (e.g. ``{'scope': 'mso44-lab'}``)
+		'''
+		def esc(v) -> str:
+			return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+		def fmt(**kw) -> str:
+			kw = {**(labels or {}), **kw}
+			return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in kw.items()) + '}'
+
+		lines = [
+			f'# HELP {prefix}_transfers_total VISA transfers per command',
+			f'# TYPE {prefix}_transfers_total counter',
+		]
+		for cmd, s in self._commands.items():
+			lines.append(f'{prefix}_transfers_total{fmt(command=cmd, op="write")} {s.writes}')
+			lines.append(f'{prefix}_transfers_total{fmt(command=cmd, op="read")} {s.reads}')
+		lines += [
+			f'# HELP {prefix}_bytes_total Bytes transferred per command',
+			f'# TYPE {prefix}_bytes_total counter',
+		]
+		for cmd, s in self._commands.items():
+			lines.append(f'{prefix}_bytes_total{fmt(command=cmd, op="write")} {s.bytes_out}')
+			lines.append(f'{prefix}_bytes_total{fmt(command=cmd, op="read")} {s.bytes_in}')
+		lines += [
+			f'# HELP {prefix}_latency_seconds Latency of the VISA transfers per command',
+			f'# TYPE {prefix}_latency_seconds histogram',
+		]
+		for cmd, s in self._commands.items():
+			for op, hist, total, count in (('write', s.write_hist, s.write_time, s.writes),
+					('read', s.read_hist, s.read_time, s.reads)):
+				if not count:
+					continue
+				cum = 0
+				for le, n in zip([*map(repr, self.buckets), '+Inf'], hist):
+					cum += n
+					lines.append(f'{prefix}_latency_seconds_bucket{fmt(command=cmd, op=op, le=le)} {cum}')
+				lines.append(f'{prefix}_latency_seconds_sum{fmt(command=cmd, op=op)} {total!r}')
+				lines.append(f'{prefix}_latency_seconds_count{fmt(command=cmd, op=op)} {count}')
+		return '\n'.join(lines) + '\n'
@@ -0,0 +1,114 @@
+import zlib
+from typing import TYPE_CHECKING, Callable
+
+try:
+	import xxhash
+except ImportError:
+	xxhash = None
+
+from . import util
+
+if TYPE_CHECKING:
+	from .acquisition import MSO4Acquisition
+
+class TraceIntegrityError(OSError):
+	'''A transfer does not have the expected length (e.g. truncated waveform).'''
+
+def _hash_function(name: str) -> Callable[[bytes], int]:
+	if name == 'crc32':
+		return zlib.crc32
+	if name == 'xxhash':
+		if xxhash is None:
+			raise ValueError('xxhash is not installed. Install it with `pip install xxhash` or use crc32')
+		return xxhash.xxh3_64_intdigest
+	raise ValueError(f'Invalid hash {name}. Valid hashes are crc32 and xxhash')
+
+class TraceIntegrity(util.DisableNewAttr):
+	'''Integrity checks of the waveforms read by :func:`MSO4Acquisition.read_waveform` and
+	:func:`MSO4Acquisition.read_waveforms`, enabled by setting :attr:`MSO4Acquisition.integrity`:
+
+	.. code-block:: python
+
+		mso44.acq.integrity = pyMSO4.TraceIntegrity.from_acquisition(mso44.acq)
+		trace = mso44.acq.read_waveform()
+		if mso44.acq.integrity.duplicate:
+			... # Same data as the previous trace
+
+	Each transfer is checked against the expected length (raising :class:`TraceIntegrityError`
+	if it differs) and hashed to detect duplicates, rather than comparing whole traces. Hashing
+	runs at several GB/s over the raw received buffer, so the cost is negligible compared to the
+	transfer itself.
+	'''
+
+	def __init__(self, wfm_bytes: int = 0, hash: str = 'crc32'): # pylint: disable=redefined-builtin
+		'''
+		Args:
+			wfm_bytes: Expected number of bytes of each waveform (per source), 0 to skip the check
+			hash: Hash used for duplicate detection: ``crc32`` (:func:`zlib.crc32`) or ``xxhash``
+				(faster, requires the optional ``xxhash`` package)
+
+		Raises:
+			ValueError: Invalid hash, or hash not available
+		'''
+		super().__init__()
+
+		self._hash = _hash_function(hash)
+		#: Expected number of bytes of each waveform (per source), 0 to skip the check
+		self.wfm_bytes: int = wfm_bytes
+		#: Number of transfers checked
+		self.traces: int = 0
+		#: Number of transfers with the same data as the previous one
+		self.duplicates: int = 0
+		#: Number of transfers shorter (or longer) than expected
+		self.short_reads: int = 0
+		#: Number of reads which timed out
+		self.timeouts: int = 0
+		#: Hash of the last transfer
+		self.last_hash: int | None = None
+		#: True if the last transfer had the same data as the previous one
+		self.duplicate: bool = False
+
+		self.disable_newattr()
+
+	@classmethod
+	def from_acquisition(cls, acq: 'MSO4Acquisition', hash: str = 'crc32') -> 'TraceIntegrity': # pylint: disable=redefined-builtin
+		'''Create the checks with the waveform length of the current acquisition settings
+		(:attr:`MSO4Acquisition.wfm_len` and :func:`MSO4Acquisition.get_datatype`).
+		Queries the scope, so it must be called before curvestream mode is enabled.
+
+		Args:
+			acq: The acquisition object of a connected scope
+			hash: Hash used for duplicate detection (``crc32`` or ``xxhash``)
+		'''
+		return cls(acq.wfm_len * acq.get_dtype().itemsize, hash)
+
+	def stats(self) -> dict[str, int]:
+		'''Return the counters (``traces``, ``duplicates``, ``short_reads``, ``timeouts``).'''
+		return {'traces': self.traces, 'duplicates': self.duplicates, 'short_reads': self.short_reads, 'timeouts': self.timeouts}
+
+	def reset(self) -> None:
+		'''Reset the counters and forget the last transfer.'''
+		self.traces = self.duplicates = self.short_reads = self.timeouts = 0
+		self.last_hash = None
+		self.duplicate = False
+
+	def check(self, data: bytes, wfm_bytes: int) -> None:
+		'''Check a transfer. Called by the read methods of :class:`MSO4Acquisition`.
+
+		Args:
+			data: The received data (one or more blocks)
+			wfm_bytes: Length of each waveform in the transfer, as declared by the block header
+
+		Raises:
+			TraceIntegrityError: The waveform length is not the expected one
+		'''
+		self.traces += 1
+		if self.wfm_bytes and wfm_bytes != self.wfm_bytes:
+			self.short_reads += 1
+			self.duplicate = False
+			raise TraceIntegrityError(f'Received a waveform of {wfm_bytes} bytes, expected {self.wfm_bytes}')
+		h = self._hash(data)
+		self.duplicate = h == self.last_hash
+		if self.duplicate:
+			self.duplicates += 1
+		self.last_hash = h
@@ -0,0 +1,396 @@
+import collections
+import concurrent.futures
+import multiprocessing
+import multiprocessing.util
+from multiprocessing import shared_memory
+from typing import Callable, Sequence
+
+import numpy as np
+
+from . import util
+from .acquisition import MSO4Preamble
+
+class PipelineStage:
+	'''Base class of the stages of a :class:`TracePipeline`. A stage processes batches of traces,
+	i.e. float arrays with the trace index on the first axis and the samples on the last one
+	(``(n, n_points)``, or ``(n, n_sources, n_points)`` with several sources).
+
+	Stages which accumulate results (e.g. :class:`RunningStats`) run on each batch in a worker
+	process, and the partial results are merged in the main process: they implement
+	:func:`PipelineStage.take` and :func:`PipelineStage.merge`.
+	'''
+
+	def prepare(self, batch: np.ndarray) -> None:
+		'''Called in the main process with the first batch before it is processed, e.g. to take
+		a reference from it.'''
+
+	def process(self, batch: np.ndarray) -> np.ndarray:
+		'''Process a batch and return the batch passed to the next stage.'''
+		return batch
+
+	def take(self) -> 'PipelineStage | None':
+		'''Return the results accumulated so far as a new stage, and reset them.
+		None if the stage does not accumulate results.'''
+		return None
+
+	def merge(self, other: 'PipelineStage') -> None:
+		'''Merge the results taken with :func:`PipelineStage.take` from a copy of this stage.'''
+
+class RunningStats(PipelineStage):
+	'''Running mean and variance of each sample (Welford's algorithm), without keeping the traces.
+	Each batch is reduced with vectorized operations, then combined with the previous results
+	(Chan et al. parallel update), so it is numerically stable and partial results computed by
+	different workers can be merged.
+	'''
+
+	def __init__(self):
+		#: Number of traces accumulated
+		self.count: int = 0
+		#: Mean of each sample, None until a trace is accumulated
+		self.mean: np.ndarray | None = None
+		self._m2: np.ndarray | None = None # Sum of the squared differences from the mean
+
+	def _update(self, count: int, mean: np.ndarray, m2: np.ndarray) -> None:
+		if not count:
+			return
+		if self.mean is None:
+			self.count, self.mean, self._m2 = count, mean, m2
+			return
+		total = self.count + count
+		delta = mean - self.mean
+		self.mean = self.mean + delta * (count / total)
+		self._m2 = self._m2 + m2 + delta ** 2 * (self.count * count / total)
+		self.count = total
+
+	def process(self, batch: np.ndarray) -> np.ndarray:
+		if len(batch):
+			mean = batch.mean(axis=0, dtype=np.float64)
+			self._update(len(batch), mean, ((batch - mean) ** 2).sum(axis=0))
+		return batch
+
+	def take(self) -> 'RunningStats':
+		part = RunningStats()
+		part.count, part.mean, part._m2 = self.count, self.mean, self._m2
+		self.count, self.mean, self._m2 = 0, None, None
+		return part
+
+	def merge(self, other: PipelineStage) -> None:
+		if not isinstance(other, RunningStats):
+			raise TypeError(f'Cannot merge {type(other).__name__} into RunningStats')
+		self._update(other.count, other.mean, other._m2) # type: ignore # pylint: disable=protected-access
+
+	@property
+	def variance(self) -> np.ndarray | None:
+		'''Variance of each sample (population variance, like :func:`numpy.var`).'''
+		return None if self._m2 is None else self._m2 / self.count
+
+	@property
+	def std(self) -> np.ndarray | None:
+		'''Standard deviation of each sample.'''
+		var = self.variance
+		return None if var is None else np.sqrt(var)
+
+class Align(PipelineStage):
+	'''Align each trace to a reference by cross-correlation, computed for the whole batch with
+	FFTs. Traces are shifted circularly by the lag with the highest correlation.
+	'''
+
+	def __init__(self, reference: np.ndarray | None = None, max_shift: int | None = None, channel: int = 0):
+		'''
+		Args:
+			reference: Reference trace, None to use the first trace
+			max_shift: Maximum shift (in samples) searched in both directions, None for any
+			channel: With several sources, index of the source used to compute the shift (which is
+				then applied to all the sources)
+		'''
+		#: Reference trace
+		self.reference: np.ndarray | None = None if reference is None else np.asarray(reference, dtype=np.float64)
+		self.max_shift = max_shift
+		self.channel = channel
+		#: Shift (in samples) applied to each trace of the last batch
+		self.shifts: np.ndarray = np.empty(0, dtype=np.intp)
+		self._ref_fft: np.ndarray | None = None
+
+	def _signal(self, batch: np.ndarray) -> np.ndarray:
+		return batch[:, self.channel] if batch.ndim == 3 else batch
+
+	def prepare(self, batch: np.ndarray) -> None:
+		if self.reference is None:
+			self.reference = self._signal(batch)[0].astype(np.float64)
+
+	def process(self, batch: np.ndarray) -> np.ndarray:
+		if self.reference is None:
+			self.prepare(batch)
+		sig = self._signal(batch)
+		n = sig.shape[-1]
+		if len(self.reference) != n: # type: ignore
+			raise ValueError(f'Reference has {len(self.reference)} points, traces have {n}') # type: ignore
+		nfft = 2 * n # Zero padded: linear rather than circular correlation
+		if self._ref_fft is None:
+			self._ref_fft = np.conj(np.fft.rfft(self.reference - self.reference.mean(), nfft)) # type: ignore
+		corr = np.fft.irfft(np.fft.rfft(sig - sig.mean(axis=-1, keepdims=True), nfft, axis=-1) * self._ref_fft, nfft, axis=-1)
+		# corr[:, k] peaks at the delay k of the trace, negative delays wrap around at the end
+		m = n - 1 if self.max_shift is None else min(self.max_shift, n - 1)
+		lags = np.r_[0:m + 1, -m:0]
+		self.shifts = lags[np.argmax(corr[:, lags], axis=-1)]
+		idx = (np.arange(n) + self.shifts[:, None]) % n
+		return np.take_along_axis(batch, idx[:, None, :] if batch.ndim == 3 else idx, axis=-1)
+
+class Decimate(PipelineStage):
+	'''Average each group of ``factor`` consecutive samples (boxcar filter and downsampling).
+	Trailing samples which do not fill a group are dropped.
+	'''
+
+	def __init__(self, factor: int):
+		'''
+		Raises:
+			ValueError: Invalid factor
+		'''
+		if factor < 1:
+			raise ValueError(f'Invalid decimation factor {factor}. Must be positive.')
+		self.factor = factor
+
+	def process(self, batch: np.ndarray) -> np.ndarray:
+		n = batch.shape[-1] // self.factor
+		return batch[..., :n * self.factor].reshape(*batch.shape[:-1], n, self.factor).mean(axis=-1, dtype=np.float32)
+
+class BandFilter(PipelineStage):
+	'''Keep only the frequencies between ``low`` and ``high`` (ideal filter applied in the
+	frequency domain, to the whole batch at once).'''
+
+	def __init__(self, low: float, high: float | None, fs: float):
+		'''
+		Args:
+			low: Lowest frequency kept (in Hz), 0 for a low pass filter
+			high: Highest frequency kept (in Hz), None for a high pass filter
+			fs: Sample rate (in Hz), e.g. ``1 / mso44.acq.preamble().xincr`` (divided by the
+				factor of any :class:`Decimate` stage before this one)
+
+		Raises:
+			ValueError: Invalid band
+		'''
+		if low < 0 or (high is not None and high <= low):
+			raise ValueError(f'Invalid band {low}-{high} Hz')
+		self.low = low
+		self.high = high
+		self.fs = fs
+
+	def process(self, batch: np.ndarray) -> np.ndarray:
+		n = batch.shape[-1]
+		spec = np.fft.rfft(batch, axis=-1)
+		freqs = np.fft.rfftfreq(n, 1 / self.fs)
+		spec[..., (freqs < self.low) | (freqs > (self.high if self.high is not None else np.inf))] = 0
+		return np.fft.irfft(spec, n, axis=-1).astype(np.float32)
+
+def _run_stages(stages: Sequence[PipelineStage], raw: np.ndarray, preamble: MSO4Preamble | None) -> np.ndarray:
+	batch = preamble.to_volts(raw) if preamble is not None else raw.astype(np.float32)
+	for stage in stages:
+		batch = stage.process(batch)
+	return batch
+
+# State of the worker processes
+_worker_stages: Sequence[PipelineStage] = []
+_worker_preamble: MSO4Preamble | None = None
+_worker_shm: dict[str, shared_memory.SharedMemory] = {}
+
+def _close_worker_shm() -> None:
+	for shm in _worker_shm.values():
+		try:
+			shm.close()
+		except BufferError: # A stage kept a view of the slot, it is released with the process
+			pass
+	_worker_shm.clear()
+
+def _init_worker(stages: Sequence[PipelineStage], preamble: MSO4Preamble | None) -> None:
+	global _worker_stages, _worker_preamble # pylint: disable=global-statement
+	for stage in stages:
+		stage.take() # Only the batches processed by this worker are accumulated
+	_worker_stages, _worker_preamble = stages, preamble
+	# Detach from the slots when the worker exits (the main process unlinks them)
+	multiprocessing.util.Finalize(None, _close_worker_shm, exitpriority=0)
+
+def _process_slot(name: str, shape: tuple[int, ...], dtype: str, n: int,
+		output: bool) -> tuple[list[PipelineStage | None], np.ndarray | None]:
+	shm = _worker_shm.get(name)
+	if shm is None:
+		# Workers share the resource tracker of the main process, which unlinks the block
+		shm = _worker_shm[name] = shared_memory.SharedMemory(name=name)
+	raw = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[:n]
+	out = _run_stages(_worker_stages, raw, _worker_preamble)
+	return [stage.take() for stage in _worker_stages], out if output else None
+
+class TracePipeline(util.DisableNewAttr):
+	'''Process traces on the fly while they are acquired, instead of storing them and processing
+	them afterwards. Traces are collected in batches, scaled to volts and passed through the
+	stages, each of them working on a whole batch with vectorized NumPy operations:
+
+	.. code-block:: python
+
+		stats = pyMSO4.RunningStats()
+		pipe = pyMSO4.TracePipeline([pyMSO4.Align(max_shift=50), pyMSO4.Decimate(4), stats],
+			workers=4, preamble=mso44.acq.preamble())
+		with pipe:
+			stream = mso44.start_stream(consumer=pipe.push)
+			... # Run the DUT
+			mso44.stop_stream()
+		plot(stats.mean)
+
+	With ``workers > 0``, batches are processed by a pool of processes: traces are copied into
+	shared memory slots, so they are not pickled, and only the (small) partial results of the
+	stages come back to be merged. When all the slots are busy, :func:`TracePipeline.push` waits
+	for the oldest batch to be processed, so memory use is bounded.
+
+	The stages must be picklable when using workers, and stages which do not accumulate results
+	(e.g. :attr:`Align.shifts`) are only updated in the workers. The workers are started with the
+	``spawn`` method, since the pool is usually created from the stream consumer thread and forking
+	a multithreaded process is unsafe: scripts must guard their entry point with
+	``if __name__ == '__main__':``, and the stages must be defined in an importable module.
+	'''
+
+	def __init__(self, stages: Sequence[PipelineStage], workers: int = 0, batch_size: int = 64,
+			n_slots: int | None = None, preamble: MSO4Preamble | None = None,
+			sink: Callable[[np.ndarray], None] | None = None):
+		'''
+		Args:
+			stages: The stages, in processing order
+			workers: Number of worker processes, 0 to process the batches in the calling thread
+			batch_size: Number of traces per batch
+			n_slots: Number of shared memory batches, defaults to twice the number of workers
+			preamble: Used to scale raw samples to volts (see :func:`MSO4Acquisition.preamble`),
+				None to process the samples as they are
+			sink: Called with each processed batch (the output of the last stage), in order
+
+		Raises:
+			ValueError: Invalid number of workers, batch size or number of slots
+		'''
+		super().__init__()
+
+		if workers < 0 or batch_size < 1 or (n_slots is not None and n_slots < 1):
+			raise ValueError('Invalid number of workers, batch size or number of slots')
+
+		#: The stages, in processing order. Results are merged into them.
+		self.stages: list[PipelineStage] = list(stages)
+		self.workers = workers
+		self.batch_size = batch_size
+		self.n_slots = n_slots or 2 * workers
+		self.preamble = preamble
+		self.sink = sink
+		#: Number of traces pushed
+		self.traces: int = 0
+
+		self._shape: tuple[int, ...] = ()
+		self._dtype: np.dtype | None = None
+		self._shms: list[shared_memory.SharedMemory] = []
+		self._slots: list[np.ndarray] = [] # One (batch_size, *trace_shape) array per slot
+		self._free: collections.deque[int] = collections.deque()
+		self._pending: collections.deque[tuple[int, concurrent.futures.Future]] = collections.deque()
+		self._pool: concurrent.futures.ProcessPoolExecutor | None = None
+		self._cur: int | None = None # Slot being filled
+		self._fill = 0 # Number of traces in the current slot
+		self._prepared = False
+
+		self.disable_newattr()
+
+	def __enter__(self) -> 'TracePipeline':
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.close()
+
+	def _setup(self, trace: np.ndarray) -> None:
+		self._shape = trace.shape
+		self._dtype = trace.dtype.newbyteorder('=')
+		shape = (self.batch_size, *self._shape)
+		for _ in range(max(self.n_slots, 1) if self.workers else 1):
+			if self.workers:
+				shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * self._dtype.itemsize)
+				self._shms.append(shm)
+				self._slots.append(np.ndarray(shape, dtype=self._dtype, buffer=shm.buf))
+			else:
+				self._slots.append(np.empty(shape, dtype=self._dtype))
+			self._free.append(len(self._slots) - 1)
+
+	def push(self, trace: np.ndarray) -> None:
+		'''Add a trace (copied, so it can be passed as the consumer of :func:`MSO4.start_stream`).
+
+		Raises:
+			ValueError: The trace has a different shape than the first one
+			Exception: Raised by a stage while processing a previous batch
+		'''
+		if self._dtype is None:
+			self._setup(trace)
+		if trace.shape != self._shape:
+			raise ValueError(f'Trace has shape {trace.shape}, expected {self._shape}')
+		if self._cur is None:
+			if not self._free:
+				self._complete(block=True)
+			self._cur = self._free.popleft()
+		self._slots[self._cur][self._fill] = trace
+		self._fill += 1
+		self.traces += 1
+		if self._fill == self.batch_size:
+			self._dispatch()
+
+	def _dispatch(self) -> None:
+		slot, n = self._cur, self._fill
+		self._cur, self._fill = None, 0
+		if slot is None or not n:
+			return
+		if not self._prepared or not self.workers:
+			# The first batch is processed here, so that stages can prepare (e.g. take a reference)
+			raw = self._slots[slot][:n]
+			if self._prepared:
+				out = _run_stages(self.stages, raw, self.preamble)
+			else:
+				out = self.preamble.to_volts(raw) if self.preamble is not None else raw.astype(np.float32)
+				for stage in self.stages:
+					stage.prepare(out)
+					out = stage.process(out)
+				self._prepared = True
+			self._free.append(slot)
+			if self.sink is not None:
+				self.sink(out)
+			return
+		if self._pool is None:
+			self._pool = concurrent.futures.ProcessPoolExecutor(self.workers,
+				mp_context=multiprocessing.get_context('spawn'),
+				initializer=_init_worker, initargs=(self.stages, self.preamble))
+		fut = self._pool.submit(_process_slot, self._shms[slot].name, self._slots[slot].shape,
+			self._dtype.str, n, self.sink is not None) # type: ignore
+		self._pending.append((slot, fut))
+		self._complete(block=False)
+
+	def _complete(self, block: bool) -> None:
+		'''Merge the results of the processed batches, in order.'''
+		while self._pending and (block or self._pending[0][1].done()):
+			slot, fut = self._pending.popleft()
+			try:
+				parts, out = fut.result()
+			finally:
+				self._free.append(slot)
+			for stage, part in zip(self.stages, parts):
+				if part is not None:
+					stage.merge(part)
+			if self.sink is not None:
+				self.sink(out) # type: ignore
+			block = False # Only wait for one batch
+
+	def flush(self) -> None:
+		'''Process the traces pushed so far, including an incomplete batch, and merge all the results.'''
+		self._dispatch()
+		while self._pending:
+			self._complete(block=True)
+
+	def close(self) -> None:
+		'''Flush, then stop the workers and release the shared memory.'''
+		try:
+			self.flush()
+		finally:
+			if self._pool is not None:
+				self._pool.shutdown()
+				self._pool = None
+			self._slots.clear()
+			for shm in self._shms:
+				shm.close()
+				shm.unlink()
+			self._shms.clear()
@@ -1,33 +1,53 @@
+import contextlib
+import re
+import select
+import socket
+import time
+from typing import Callable, Iterator
+
+import numpy as np
 import pyvisa as visa
 
 from . import scope_logger
+from .batch import SCPIBatch, join_commands
+from .state import MSO4State
 from .triggers import MSO4Triggers, MSO4EdgeTrigger
 from .acquisition import MSO4Acquisition
-from .channel import MSO4AnalogChannel
+from .channel import MSO4AnalogChannel, MSO4MathChannel
+from .instrumentation import VisaInstrumentation
+from .stream import MSO4Stream
+from .wait import wait_complete
 
 # TODO:
 # * Implement the other trigger types (mostly sequence)
-# * Change binary format to 8 bit when in low res mode?
 # * Add note about starting off with a freshly booted machine to avoid issues
 
 TEKTRONIX_USB_VID = 0x0699
 MSO44_USB_PID = 0x0527
 
+#: VISA resource of each network transport supported by :func:`MSO4.con`. The socket server
+#: must be enabled on the scope (Utility > I/O > Socket Server, port 4000).
+TRANSPORTS = {
+	'vxi11': 'TCPIP0::{ip}::inst0::INSTR',
+	'hislip': 'TCPIP0::{ip}::hislip0::INSTR',
+	'socket': 'TCPIP0::{ip}::4000::SOCKET',
+}
+#: Default VISA chunk size (in bytes) of the network transports, so that long waveforms are not
+#: received 20 kB at a time
+NETWORK_CHUNK_SIZE = 1024 * 1024
+
 class MSO4:
 	'''Tektronix MSO 4-Series scope object. This is not usable until :func:`MSO4.con()` is called.'''
 
-	_pyvisa_methods = ['write', 'write_ascii_values', 'write_binary_values',
-		'read_bytes', 'read', 'read_ascii_values', 'read_binary_values', 'query',
-		'query_ascii_values', 'query_binary_values'] # Ignore write_raw and read_raw as
-		# they are used in all the methods above, thus everything would be printed twice
-
-	def __init__(self, trig_type: MSO4Triggers = MSO4EdgeTrigger, timeout: float = 2000.0, debug: bool = False):
+	def __init__(self, trig_type: MSO4Triggers = MSO4EdgeTrigger, timeout: float = 2000.0, debug: bool = False,
+			instrument: bool = False):
 		'''Creates a new MSO4 object.
 
 		Args:
 			trig_type: The type of trigger to use. This can be changed later.
 			timeout: Timeout (in ms) for each VISA operation, including the CURVE? query.
 			debug: Enable printing each VISA operation to the console
+			instrument: Enable collecting per-command statistics (see :func:`MSO4.stats`)
 		'''
 		#: pyvisa ResourceManager object used tp setup the connection
 		self.rm: visa.ResourceManager = None # type: ignore
@@ -41,14 +61,22 @@ class MSO4:
 
 		#: MSO4Acquisition instance used to control the acquisition settings
 		self.acq: MSO4Acquisition = None # type: ignore
+		self._prev_acq: MSO4Acquisition | None = None # Acquisition of the last connection, see con()
 		#: List of MSO4AnalogChannel instances used to control the analog channels
 		self.ch_a: list[MSO4AnalogChannel] = []
 		self.ch_a.append(None) # Dummy channel to make indexing easier # type: ignore
-
-		#: Debug mode
-		self.debug: bool = debug
+		#: MSO4MathChannel instances of the math waveforms on the scope, keyed by their number
+		self.ch_math: dict[int, MSO4MathChannel] = {}
+		#: Background acquisition engine started by :func:`MSO4.start_stream`, if any
+		self.stream: MSO4Stream | None = None
+
+		#: Per-command statistics of the VISA transfers, see :func:`MSO4.stats`
+		self.instrumentation: VisaInstrumentation = VisaInstrumentation()
+		self.instrumentation.enabled = instrument
 		#: Current connection status
 		self.connect_status: bool = False
+		self._debug = False
+		self.debug = debug
 
 	def clear_cache(self) -> None:
 		'''Resets the local configuration cache so that values will be fetched from
@@ -60,10 +88,126 @@ class MSO4:
 			self._trig.clear_caches()
 		if self.acq:
 			self.acq.clear_caches()
-		for ch in self.ch_a:
+		for ch in [*self.ch_a, *self.ch_math.values()]:
 			if ch is not None:
 				ch.clear_caches()
 
+	def cache_stats(self) -> dict[str, int]:
+		'''Return the total number of cache ``hits`` and ``misses`` (i.e. queries sent to the
+		scope) of the settings of all subobjects (trigger, acquisition, channels).
+		'''
+		stats = {'hits': 0, 'misses': 0}
+		for obj in [self._trig, self.acq, *self.ch_a, *self.ch_math.values()]:
+			if obj is not None:
+				for k, v in obj.cache_stats().items():
+					stats[k] += v
+		return stats
+
+	def stats(self) -> dict[str, dict[str, float]]:
+		'''Return the number of transfers, bytes and time spent (in s) for each SCPI command sent
+		since statistics were enabled with :attr:`MSO4.instrument`, the slowest commands first.
+		See :func:`VisaInstrumentation.stats`.
+		'''
+		return self.instrumentation.stats()
+
+	@property
+	def instrument(self) -> bool:
+		'''Collect per-command statistics of the VISA transfers (see :func:`MSO4.stats`).
+		When disabled (and :attr:`MSO4.debug` as well), the VISA methods are not wrapped at all.
+		'''
+		return self.instrumentation.enabled
+
+	@instrument.setter
+	def instrument(self, value: bool):
+		self.instrumentation.enabled = value
+		self.instrumentation.attach(self.sc)
+
+	@property
+	def debug(self) -> bool:
+		'''Log each VISA transfer at the debug level of the ``pyMSO44`` logger.'''
+		return self._debug
+
+	@debug.setter
+	def debug(self, value: bool):
+		if value and not self._debug:
+			self.instrumentation.hooks.append(self._log_transfer)
+		elif not value and self._debug:
+			self.instrumentation.hooks.remove(self._log_transfer)
+		self._debug = value
+		self.instrumentation.attach(self.sc)
+
+	@staticmethod
+	def _log_transfer(command: str, op: str, nbytes: int, seconds: float) -> None:
+		scope_logger.debug('%s %s (%d B, %.3f ms)', op, command, nbytes, seconds * 1e3)
+
+	def load_state(self, state: MSO4State) -> None:
+		'''Fill the local configuration cache of all subobjects (trigger, acquisition, channels)
+		from a scope state, without communicating with the scope.
+
+		Args:
+			state: The state to take values from
+		'''
+		if self._trig:
+			self._trig.load_state(state)
+		if self.acq:
+			self.acq.load_state(state)
+		for ch in [*self.ch_a, *self.ch_math.values()]:
+			if ch is not None:
+				ch.load_state(state)
+
+	def snapshot(self) -> MSO4State:
+		'''Fetch the entire scope configuration with a single ``SET?`` query. The local
+		configuration cache of all subobjects is filled from it as well.
+
+		Returns: The current scope state, which can be restored later with :func:`MSO4.apply`
+		'''
+		state = MSO4State.parse(self.sc.query('SET?'))
+		self.load_state(state)
+		return state
+
+	def apply(self, state: MSO4State, current: MSO4State | None = None) -> list[str]:
+		'''Restore a scope state taken with :func:`MSO4.snapshot`. Only the settings which
+		differ from the current configuration are sent, in a single message.
+
+		Args:
+			state: The state to restore
+			current: The current scope state. If None, it is fetched with ``SET?``.
+
+		Returns: The commands which have been sent
+		'''
+		if current is None:
+			current = MSO4State.parse(self.sc.query('SET?'))
+		cmds = state.diff(current).commands()
+		if cmds:
+			self.sc.write(join_commands(cmds))
+		self.clear_cache()
+		self.load_state(state)
+		return cmds
+
+	@contextlib.contextmanager
+	def batch(self) -> Iterator[SCPIBatch]:
+		'''Context manager collecting all the commands sent by setters (on the scope, channels,
+		acquisition and trigger objects) and sending them as a single SCPI message on exit.
+		Setters which read back the value they set are verified with a single combined query
+		afterwards, so reconfiguring the scope costs two round trips:
+
+		.. code-block:: python
+
+			with mso44.batch():
+				mso44.ch_a[1].scale = 0.01
+				mso44.acq.horiz_scale = 200e-9
+				mso44.trigger.level = 1.4
+
+		Getters used inside the batch send the commands collected so far first, so they
+		always see the updated configuration. If an exception is raised inside the batch,
+		the collected commands are discarded and so are the values cached by the setters
+		called inside it (see :class:`SCPIBatch`).
+		'''
+		if not self.connect_status:
+			raise OSError('Scope is not connected. Connect it first...')
+		with SCPIBatch(self.sc) as b:
+			yield b
+
 	def _id_scope(self) -> dict[str, str]:
 		'''Reads identification string from scope and returns a dictionary with the
 		following keys:
@@ -93,57 +237,58 @@ class MSO4:
 			'firmware': s[3]
 		}
 
-	def con(self, ip: str = '', usb_vid_pid: tuple[int, int] = (), **kwargs) -> bool: # type: ignore
+	def con(self, ip: str = '', usb_vid_pid: tuple[int, int] = (), resource: str = '', transport: str = 'vxi11', **kwargs) -> bool: # type: ignore
 		'''Connects to scope and:
 			- clears event queue, standard event status register, status byte register
 			- sets timeout = timeout from :func:`MSO4.__init__`
 
-		Either ``ip`` or ``usb_vid_pid`` must be specified (not both).
+		Exactly one of ``ip``, ``usb_vid_pid`` or ``resource`` must be specified.
+
+		Over the network, the transport (see :data:`TRANSPORTS`) is either VXI-11 (``vxi11``, an RPC
+		per message), HiSLIP (``hislip``, less overhead per message) or a raw socket (``socket``,
+		the least overhead, but without end of message signaling: ``\\n`` terminates messages).
+		All of them read waveforms the same way. Use :func:`MSO4.probe_transports` to find the fastest.
+		Network connections use :data:`NETWORK_CHUNK_SIZE` and disable Nagle's algorithm, which
+		delays small messages sent back to back.
+
+		When reconnecting, the acquisition settings kept on the host rather than on the scope
+		(see :func:`MSO4Acquisition.copy_local_settings`) are carried over from the previous connection.
 
 		Args:
 			ip (str): IP address of scope
 			usb_vid_pid (tuple[int, int]): USB VID and PID of scope
+			resource (str): Full VISA resource string (e.g. :attr:`MSO4Simulator.resource`)
+			transport (str): Network transport used with ``ip``: ``vxi11``, ``hislip`` or ``socket``
 			kwargs: Additional arguments to pass to ``pyvisa.ResourceManager.open_resource``
 
 		Returns:
 			True if successful, False otherwise
 
 		Raises:
-			ValueError: Both or neither IP address and USB VID/PID were specified
+			ValueError: More than one or none of IP address, USB VID/PID and resource were specified,
+				or invalid transport
 			OSError: Invalid vendor or model returned from scope
 		'''
 
-		def _decorator_print(func):
-			'''Decorator added to pyvisa functions to debug what is happening at a lower level.
-			It is a nested function to have access to the pyMSO4 class instance context
-			'''
-			def wrapper(*args, **kwargs):
-				if self.debug: # This is why I declared here
-					print("[D]", func.__name__, *args)
-				return func(*args, **kwargs)
-			return wrapper
-
 		if self.connect_status:
 			try:
 				self.dis()
 			except Exception:
 				scope_logger.warning('Failed to disconnect from scope. Trying to connect anyway...')
 
+		addr = resource_address(ip, usb_vid_pid, resource, transport)
 		self.rm = visa.ResourceManager()
-		if ip and usb_vid_pid:
-			raise ValueError('Only one of IP address or USB resource string must be specified')
-		elif ip:
-			addr = f'TCPIP0::{ip}::inst0::INSTR'
-		elif usb_vid_pid:
-			vid, pid = usb_vid_pid
-			addr = f'USB0::{vid:04}::{pid:04}::*::0::INSTR' # '*' to match all serial numbers
-		else:
-			raise ValueError('Either IP address or USB resource string must be specified')
+		if addr.upper().startswith('TCPIP'):
+			kwargs.setdefault('chunk_size', NETWORK_CHUNK_SIZE)
+		if addr.upper().endswith('::SOCKET'): # Raw sockets have no end of message signaling
+			kwargs.setdefault('read_termination', '\n')
+			kwargs.setdefault('write_termination', '\n')
 		self.sc = self.rm.open_resource(addr, **kwargs) # type: ignore
+		if addr.upper().startswith('TCPIP'):
+			self._set_nodelay()
 
-		# Apply debugging decorator
-		for method in self._pyvisa_methods:
-			setattr(self.sc, method, _decorator_print(getattr(self.sc, method)))
+		# Only wrapped if debugging or collecting statistics
+		self.instrumentation.attach(self.sc)
 
 		# Set visa timeout
 		self.timeout = self._timeout
@@ -165,59 +310,145 @@ class MSO4:
 			self.ch_a.append(MSO4AnalogChannel(self.sc, ch_a + 1))
 		self.trigger = self._trig_type
 		self.acq = MSO4Acquisition(self.sc, ch_a_num)
+		if self._prev_acq is not None:
+			self.acq.copy_local_settings(self._prev_acq)
+		self.ch_math = {n: MSO4MathChannel(self.sc, n) for n in self._math_list()}
 
 		return True
 
+	def _set_nodelay(self) -> None:
+		try:
+			self.sc.set_visa_attribute(visa.constants.VI_ATTR_TCPIP_NODELAY, visa.constants.VI_TRUE)
+			return
+		except Exception: # pylint: disable=broad-exception-caught
+			pass
+		# pyvisa-py does not route the attribute to its setter for raw sockets, set the option directly
+		sess = self._socket_session()
+		if sess is not None:
+			sess.interface.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		else:
+			scope_logger.debug('Could not disable Nagle\'s algorithm on %s', self.sc.resource_name)
+
+	def _socket_session(self):
+		'''Return the pyvisa-py session of a raw socket resource, None for any other resource.'''
+		sess = getattr(self.rm.visalib, 'sessions', {}).get(self.sc.session)
+		return sess if isinstance(getattr(sess, 'interface', None), socket.socket) else None
+
+	def probe_transports(self, ip: str, transports: list[str] | None = None, traces: int = 20, **kwargs) -> dict[str, float]:
+		'''Measure the waveform rate (``CURVE?`` round trips) of each network transport with the
+		current acquisition settings (record length, sources, encoding...), and leave the scope
+		connected through the fastest one.
+
+		Args:
+			ip: IP address of scope
+			transports: Transports to measure (see :data:`TRANSPORTS`), defaults to all of them
+			traces: Number of waveforms read with each transport
+			kwargs: Additional arguments to pass to :func:`MSO4.con`
+
+		Returns: The waveforms per second of each transport, 0 if it could not be used
+			(e.g. the socket server is disabled), the fastest first
+
+		Raises:
+			OSError: None of the transports could be used
+		'''
+		transports = transports or list(TRANSPORTS)
+		rates = {}
+		for transport in transports:
+			try:
+				self.con(ip=ip, transport=transport, **kwargs)
+				self.acq.get_dtype() # Fill the cache, so that only CURVE? is measured
+				self.acq.wfm_src # pylint: disable=pointless-statement
+				read = self.acq.query_waveform if len(self.acq.wfm_src) == 1 else self.acq.query_waveforms
+				read() # Warm up
+				start = time.perf_counter()
+				for _ in range(traces):
+					read()
+				rates[transport] = traces / (time.perf_counter() - start)
+				scope_logger.info('%s: %.1f waveforms/s of %d points', transport, rates[transport], self.acq.wfm_len)
+			except Exception as e: # pylint: disable=broad-exception-caught
+				scope_logger.warning('Transport %s is not usable: %s', transport, e)
+				rates[transport] = 0.0
+		rates = dict(sorted(rates.items(), key=lambda kv: kv[1], reverse=True))
+		best = next(iter(rates))
+		if not rates[best]:
+			raise OSError('Could not connect to the scope with any transport')
+		if best != transports[-1] or not self.connect_status:
+			self.con(ip=ip, transport=best, **kwargs)
+		return rates
+
 	def dis(self) -> None:
 		'''Disconnects from scope and clears all local data.
 		'''
+		self.stop_stream()
+
 		# Re enable waveform display
+		self.cls() # Also stops curvestream, or clearing the buffers might never end
 		self.clear_buffers()
-		self.cls()
 		self.display = True
 
 		self.clear_cache()
 
+		self._prev_acq = self.acq
 		self.acq = None # type: ignore
 
-		self.sc.close()
-		self.sc = None # type: ignore
-		self.rm.close()
-		self.rm = None # type: ignore
+		self._close_resource()
 
 		self.ch_a = []
 		self.ch_a.append(None) # Dummy channel to make indexing easier # type: ignore
+		self.ch_math = {}
 
 		self.connect_status = False
 
+	def _close_resource(self) -> None:
+		self.instrumentation.attach(None)
+		self.sc.close()
+		self.sc = None # type: ignore
+		# The resource manager is shared by all the scopes of the process, and closing it
+		# closes all their resources: only close it with the last one
+		if not self.rm.list_opened_resources():
+			self.rm.close()
+		self.rm = None # type: ignore
+
 	def reboot(self) -> None:
 		'''Reboots the UI (as well as VISA server) on the scope. Note this will kill the current connection
 		'''
 		self.sc.write('SCOPEApp REBOOT')
 		self.clear_cache()
+		self._prev_acq = self.acq
 		self.acq = None # type: ignore
 
-		self.sc.close()
-		self.sc = None # type: ignore
-		self.rm.close()
-		self.rm = None # type: ignore
+		self._close_resource()
 
 		self.ch_a = []
 		self.ch_a.append(None) # Dummy channel to make indexing easier # type: ignore
+		self.ch_math = {}
 
 		self.connect_status = False
 
-	def reset(self) -> None:
-		'''Resets scope to default settings.
+	def reset(self, timeout: float | None = None) -> None:
+		'''Resets scope to default settings, and waits for the reset to complete
+		(see :func:`MSO4.wait_complete`).
+
+		Args:
+			timeout: Maximum time to wait (in ms), None to wait forever
 		'''
 		self.sc.write("*RST")
-		self.sc.write("*OPC?")
-		# Technically we could use "*OPC" to avoid the scope sending data on the bus, but
-		# that actually does not work, so we need to use "*OPC?" and read
-		while self.sc.read().strip() != "1":
-			pass
-		self.sc.clear() # Discard the `1` sent by the scope
+		self.wait_complete(timeout)
 		self.sc.write("*CLS")
+		self.clear_cache()
+
+	def wait_complete(self, timeout: float | None = None) -> None:
+		'''Wait until the scope completes all pending operations, using a service request when the
+		VISA backend supports it, or polling ``BUSY?`` with an exponential backoff otherwise.
+		See :func:`pyMSO4.wait.wait_complete`.
+
+		Args:
+			timeout: Maximum time to wait (in ms), None to wait forever
+
+		Raises:
+			TimeoutError: The operations did not complete within ``timeout``
+		'''
+		wait_complete(self.sc, timeout)
 
 	def busy(self) -> bool:
 		'''Queries the status of the scope
@@ -239,8 +470,100 @@ class MSO4:
 
 	def clear_buffers(self) -> None:
 		'''Clears the resource buffers.
+
+		Raises:
+			ConnectionResetError: The scope closed the connection (raw sockets only)
+		'''
+		sess = self._socket_session()
+		if sess is None:
+			self.sc.clear()
+			return
+		# pyvisa-py drains raw sockets until they are silent, and never returns if the scope
+		# closed the connection (e.g. while rebooting): drain it here and detect the end of stream
+		pending = getattr(sess, '_pending_buffer', None) # Bytes received past the last message
+		if pending is not None:
+			pending.clear()
+		while select.select([sess.interface], [], [], 0.1)[0]:
+			if not sess.interface.recv(65536):
+				raise ConnectionResetError(f'Connection to {self.sc.resource_name} closed by the scope')
+
+	def start_stream(self, consumer: Callable[[np.ndarray], None] | None = None, n_buffers: int = 16) -> MSO4Stream:
+		'''Start reading curvestream traces in a background thread (see :class:`MSO4Stream`).
+		Acquisition settings must be configured beforehand, and no other command must be sent
+		to the scope until :func:`MSO4.stop_stream` is called.
+
+		Args:
+			consumer: Called from a separate thread with each trace. The array is only valid
+				until the call returns. If None, use :func:`MSO4Stream.get` to retrieve traces.
+			n_buffers: Number of preallocated trace buffers (i.e. maximum queue depth)
+
+		Returns: The running stream
+
+		Raises:
+			OSError: A stream is already running
+		'''
+		if self.stream is not None and self.stream.running:
+			raise OSError('A stream is already running. Stop it first...')
+		self.stream = MSO4Stream(self.acq, consumer, n_buffers, self.clear_buffers)
+		self.stream.start()
+		return self.stream
+
+	def stop_stream(self) -> None:
+		'''Stop the background acquisition started by :func:`MSO4.start_stream`, if any,
+		and disable curvestream mode.
+		'''
+		if self.stream is not None:
+			self.stream.stop()
+			self.stream = None
+
+	def _math_list(self) -> list[int]:
+		'''Return the numbers of the math waveforms defined on the scope.'''
+		resp = self.sc.query('MATH:LIST?').strip().strip('"')
+		return [int(m) for m in re.findall(r'MATH(\d+)', resp, re.IGNORECASE)]
+
+	def add_math(self, definition: str | None = None) -> MSO4MathChannel:
+		'''Add a math waveform on the scope, computed there and read like a channel (e.g. the
+		difference of two channels, so one waveform is transferred instead of two):
+
+		.. code-block:: python
+
+			diff = mso44.add_math('CH1-CH2')
+			mso44.acq.wfm_src = [diff.source]
+			wfm = mso44.acq.query_waveform()
+
+		Args:
+			definition: Expression of the math waveform (see :attr:`MSO4MathChannel.definition`).
+				If None, the waveform is left with the scope defaults.
+
+		Returns: The new math waveform, also added to :attr:`MSO4.ch_math`
 		'''
-		self.sc.clear()
+		if not self.connect_status:
+			raise OSError('Scope is not connected. Connect it first...')
+		n = max([0, *self._math_list()]) + 1
+		self.sc.write(f'MATH:ADDNew "MATH{n}"')
+		self.ch_math[n] = math = MSO4MathChannel(self.sc, n)
+		if definition is not None:
+			with self.batch():
+				math.math_type = 'advanced'
+				math.definition = definition
+		return math
+
+	def delete_math(self, math: MSO4MathChannel | int) -> None:
+		'''Delete a math waveform from the scope.
+
+		Args:
+			math: The math waveform, or its number
+
+		Raises:
+			ValueError: No such math waveform
+		'''
+		if not self.connect_status:
+			raise OSError('Scope is not connected. Connect it first...')
+		n = math.math if isinstance(math, MSO4MathChannel) else math
+		if n not in self.ch_math:
+			raise ValueError(f'Invalid math waveform {n}. Valid math waveforms are {sorted(self.ch_math)}')
+		self.sc.write(f'MATH:DELete "MATH{n}"')
+		del self.ch_math[n]
 
 	def ch_a_enable(self, value: list[bool]) -> None:
 		'''Convenience function to enable/disable analog channels.
@@ -309,6 +632,26 @@ class MSO4:
 	def display(self, value: bool):
 		self.sc.write(f'DISplay:WAVEform {int(value)}')
 
+def resource_address(ip: str = '', usb_vid_pid: tuple[int, int] = (), resource: str = '', transport: str = 'vxi11') -> str:
+	'''Return the VISA resource string of a scope, given the arguments of :func:`MSO4.con`.
+
+	Raises:
+		ValueError: More than one or none of IP address, USB VID/PID and resource were specified,
+			or invalid transport
+	'''
+	if transport not in TRANSPORTS:
+		raise ValueError(f'Invalid transport {transport}. Valid transports are {", ".join(TRANSPORTS)}')
+	if sum(map(bool, [ip, usb_vid_pid, resource])) > 1:
+		raise ValueError('Only one of IP address, USB VID/PID or resource string must be specified')
+	if resource:
+		return resource
+	if ip:
+		return TRANSPORTS[transport].format(ip=ip)
+	if usb_vid_pid:
+		vid, pid = usb_vid_pid
+		return f'USB0::{vid:04}::{pid:04}::*::0::INSTR' # '*' to match all serial numbers
+	raise ValueError('Either IP address, USB VID/PID or resource string must be specified')
+
 def usb_reboot(vid: int, pid: int) -> bool:
 	'''Reboots the scope via USB when it is not reachable through TCP/IP.
 	Does not require a pre-existing connection to the scope.
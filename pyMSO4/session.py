@@ -0,0 +1,268 @@
+import time
+from typing import Any, Callable
+
+import numpy as np
+import pyvisa
+
+from . import util
+from . import scope_logger
+from .integrity import TraceIntegrityError
+from .pyMSO4 import MSO4, resource_address, usb_reboot, TEKTRONIX_USB_VID, MSO44_USB_PID
+from .state import MSO4State
+
+class CurvestreamSession(util.DisableNewAttr):
+	'''Long running curvestream acquisition with automatic recovery.
+
+	Recovery escalates in three steps:
+		1. A read timing out (e.g. a missed trigger) clears the buffers and re-enables
+		   curvestream mode, which is fast
+		2. After ``max_timeouts`` consecutive timeouts, or on any other VISA error, the scope
+		   is reconnected and the configuration taken when the session started is restored
+		   (only the settings which differ are sent, see :func:`MSO4.apply`)
+		3. If the scope cannot be reconnected, it is rebooted through USB (see :func:`usb_reboot`).
+		   Once it has stopped answering, it is reconnected as soon as it is back
+
+	The index of each trace that could not be read is recorded, so that gaps can be matched with
+	the stimuli sent to the device under test. Transfers rejected by :attr:`MSO4Acquisition.integrity`
+	are counted as lost as well:
+
+	.. code-block:: python
+
+		mso44.con(ip='128.181.240.130')
+		... # Configure the scope
+		with pyMSO4.CurvestreamSession(mso44, {'ip': '128.181.240.130'}) as session:
+			while True:
+				target.simpleserial_write('p', pt)
+				trace = session.read() # None if the trace was lost
+				...
+		print(session.stats())
+	'''
+
+	def __init__(self, scope: MSO4, con_kwargs: dict[str, Any], timeout: float = 200.0, max_timeouts: int = 10,
+			reboot_vid_pid: tuple[int, int] | None = (TEKTRONIX_USB_VID, MSO44_USB_PID), reboot_timeout: float = 300.0,
+			prepare: Callable[[MSO4], None] | None = None, down_timeout: float = 30.0):
+		'''
+		Args:
+			scope: A connected and configured scope
+			con_kwargs: Arguments passed to :func:`MSO4.con` to reconnect the scope
+			timeout: Timeout (in ms) for each trace while the session is running
+			max_timeouts: Number of consecutive timeouts after which the scope is reconnected
+			reboot_vid_pid: USB VID and PID used to reboot the scope when it cannot be
+				reconnected, None to never reboot it
+			reboot_timeout: Maximum time (in s) to wait for the scope to come back after a reboot
+			prepare: Called with the scope after the configuration has been restored, to apply
+				settings which are not part of the scope state (e.g. :attr:`MSO4.display`)
+			down_timeout: Maximum time (in s) to wait for the scope to go down after requesting
+				a reboot, before trying to reconnect anyway
+
+		Raises:
+			OSError: Scope is not connected
+		'''
+		super().__init__()
+
+		if not scope.connect_status:
+			raise OSError('Scope is not connected. Connect it first...')
+
+		#: The scope (the same object is reconnected on recovery)
+		self.scope: MSO4 = scope
+		self.con_kwargs = con_kwargs
+		self.timeout = timeout
+		self.max_timeouts = max_timeouts
+		self.reboot_vid_pid = reboot_vid_pid
+		self.reboot_timeout = reboot_timeout
+		self.prepare = prepare
+		self.down_timeout = down_timeout
+
+		#: Configuration restored after reconnecting, taken by :func:`CurvestreamSession.start`
+		self.snapshot: MSO4State | None = None
+		#: Index of the next trace
+		self.index: int = 0
+		#: Number of traces delivered
+		self.traces: int = 0
+		#: Indices of the traces which could not be read
+		self.lost: list[int] = []
+		#: Number of reads which timed out
+		self.timeouts: int = 0
+		#: Number of times the scope was reconnected
+		self.reconnects: int = 0
+		#: Number of times the scope was rebooted
+		self.reboots: int = 0
+
+		self._consecutive = 0 # Consecutive timeouts
+		self._read: Callable[..., np.ndarray] = scope.acq.read_waveform
+		self._old_timeout = scope.timeout
+		self._started = 0.0
+		self._downtime = 0.0
+
+		self.disable_newattr()
+
+	def start(self) -> 'CurvestreamSession':
+		'''Take a snapshot of the configuration and enable curvestream mode.'''
+		self.snapshot = self.scope.snapshot()
+		self._old_timeout = self.scope.timeout
+		self._started = time.monotonic()
+		self._arm()
+		return self
+
+	def stop(self) -> None:
+		'''Disable curvestream mode and restore the previous timeout.'''
+		self.scope.acq.curvestream = False
+		self.scope.clear_buffers()
+		self.scope.timeout = self._old_timeout
+
+	def __enter__(self) -> 'CurvestreamSession':
+		return self.start()
+
+	def __exit__(self, *args) -> None:
+		self.stop()
+
+	@property
+	def elapsed(self) -> float:
+		'''Time (in s) since the session started.'''
+		return time.monotonic() - self._started if self._started else 0.0
+
+	@property
+	def uptime(self) -> float:
+		'''Time (in s) since the session started, excluding the time spent reconnecting or rebooting.'''
+		return self.elapsed - self._downtime
+
+	def stats(self) -> dict[str, float]:
+		'''Return the session counters, the uptime ratio and the number of traces delivered per hour,
+		as well as the :class:`TraceIntegrity` counters if integrity checks are enabled.'''
+		elapsed = self.elapsed
+		return {
+			**(self.scope.acq.integrity.stats() if self.scope.acq.integrity else {}),
+			'traces': self.traces,
+			'lost': len(self.lost),
+			'timeouts': self.timeouts,
+			'reconnects': self.reconnects,
+			'reboots': self.reboots,
+			'elapsed': elapsed,
+			'uptime': self.uptime / elapsed if elapsed else 0.0,
+			'traces_per_hour': self.traces / elapsed * 3600 if elapsed else 0.0,
+		}
+
+	def _arm(self) -> None:
+		acq = self.scope.acq
+		# Fill the cache, no query can be sent in curvestream mode
+		acq.get_dtype()
+		self._read = acq.read_waveform if len(acq.wfm_src) == 1 else acq.read_waveforms
+		self.scope.timeout = self.timeout
+		acq.curvestream = True
+		self.scope.clear_buffers() # Good measure
+
+	def _rearm(self) -> None:
+		# Stop the stream first: clearing the buffers while the scope is still sending might never end
+		self.scope.acq.curvestream = False
+		self.scope.clear_buffers()
+		self.scope.acq.curvestream = True
+
+	def read(self, out: np.ndarray | None = None) -> np.ndarray | None:
+		'''Read the next trace, recovering from errors if needed.
+
+		Args:
+			out: Optional preallocated array the samples are copied into
+				(see :func:`MSO4Acquisition.read_waveform`)
+
+		Returns: The trace (a ``(n_sources, n_points)`` array if several sources are set),
+			or None if it was lost. Its index is then appended to :attr:`CurvestreamSession.lost`.
+
+		Raises:
+			OSError: The scope could not be recovered
+		'''
+		idx = self.index
+		self.index += 1
+		try:
+			trace = self._read(out=out)
+		except TraceIntegrityError as e:
+			# The transfer is incomplete, the rest of it might still be in the buffers
+			scope_logger.warning('%s, re-arming...', e)
+			self.lost.append(idx)
+			try:
+				self._rearm()
+			except pyvisa.errors.VisaIOError as err:
+				scope_logger.warning('Got VISA error %s while re-arming, reconnecting...', err)
+				self._recover()
+			return None
+		except pyvisa.errors.VisaIOError as e:
+			self.lost.append(idx)
+			if e.error_code != pyvisa.constants.VI_ERROR_TMO:
+				scope_logger.warning('Got VISA error %s, reconnecting...', e)
+				self._recover()
+				return None
+			self.timeouts += 1
+			self._consecutive += 1
+			if self._consecutive > self.max_timeouts:
+				scope_logger.warning('%d consecutive timeouts, reconnecting...', self._consecutive)
+				self._recover()
+				return None
+			try:
+				self._rearm()
+			except pyvisa.errors.VisaIOError as err:
+				scope_logger.warning('Got VISA error %s while re-arming, reconnecting...', err)
+				self._recover()
+			return None
+		self._consecutive = 0
+		self.traces += 1
+		return trace
+
+	def _reconnect(self) -> None:
+		self.scope.con(**self.con_kwargs)
+		self.scope.apply(self.snapshot) # type: ignore
+		if self.prepare:
+			self.prepare(self.scope)
+		self._arm()
+
+	def _wait_down(self) -> bool:
+		'''Wait for the scope to stop answering after a reboot request, so that it is not
+		reconnected before it has actually gone down. Returns False after ``down_timeout``.'''
+		kwargs = {k: v for k, v in self.con_kwargs.items() if k in ('ip', 'usb_vid_pid', 'resource', 'transport')}
+		addr = resource_address(**kwargs)
+		rm = pyvisa.ResourceManager()
+		try:
+			deadline = time.monotonic() + self.down_timeout
+			while time.monotonic() < deadline:
+				# pyvisa-py opens raw sockets even if the connection is refused, so the scope is
+				# only considered up if it answers
+				try:
+					res = rm.open_resource(addr, open_timeout=1000, timeout=1000)
+					try:
+						res.query('*IDN?')
+					finally:
+						res.close()
+				except Exception: # pylint: disable=broad-exception-caught
+					return True # pyvisa-py raises a bare Exception when the connection times out
+				time.sleep(0.5)
+			return False
+		finally:
+			# Shared by the whole process (see MSO4.dis), only close it if nothing else uses it
+			if not rm.list_opened_resources():
+				rm.close()
+
+	def _recover(self) -> None:
+		down = time.monotonic()
+		self._consecutive = 0
+		try:
+			try:
+				self._reconnect()
+				self.reconnects += 1
+				return
+			except (pyvisa.errors.VisaIOError, OSError) as e:
+				if self.reboot_vid_pid is None:
+					raise OSError(f'Could not reconnect to the scope: {e}') from e
+				scope_logger.warning('Could not reconnect to the scope (%s), rebooting it through USB...', e)
+			if not usb_reboot(*self.reboot_vid_pid):
+				raise OSError('Could not reconnect to the scope, nor reboot it through USB')
+			self.reboots += 1
+			if not self._wait_down():
+				scope_logger.warning('Scope still answers %.0f s after the reboot request', self.down_timeout)
+			while time.monotonic() - down < self.reboot_timeout:
+				try:
+					self._reconnect()
+					self.reconnects += 1
+					return
+				except (pyvisa.errors.VisaIOError, OSError):
+					time.sleep(1) # Scope is not ready yet
+			raise OSError(f'Scope did not come back within {self.reboot_timeout} s after rebooting')
+		finally:
+			self._downtime += time.monotonic() - down
@@ -0,0 +1,446 @@
+import itertools
+import re
+import select
+import socket
+import threading
+import time
+
+import numpy as np
+
+from . import util
+from . import scope_logger
+from .state import _forms, _split
+
+# Settings known by the simulator and their value after *RST. Headers are given in mixed case,
+# so that they are matched both in long and short form. ``{n}`` is replaced by the channel number.
+_DEFAULTS: dict[str, str] = {
+	'ACQuire:MODe': 'SAMPLE',
+	'ACQuire:STOPAfter': 'RUNSTOP',
+	'ACQuire:SEQuence:NUMSEQuence': '1',
+	'ACQuire:NUMAVg': '16',
+	'ACQuire:FASTAcq:STATE': '0',
+	'ACQuire:STATE': '1',
+	'HORizontal:FASTframe:STATE': '0',
+	'HORizontal:FASTframe:COUNt': '1',
+	'DATa:FRAMESTARt': '1',
+	'DATa:FRAMESTOP': '1',
+	'HORizontal:MODe': 'AUTO',
+	'HORizontal:MODe:SAMPlerate': '6.25E+9',
+	'HORizontal:MODe:RECOrdlength': '10000',
+	'HORizontal:SCAle': '160.0E-9',
+	'HORizontal:POSition': '50.0000',
+	'DATa:SOUrce': 'CH1',
+	'DATa:STARt': '1',
+	'DATa:STOP': '10000',
+	'WFMOutpre:ENCdg': 'BINARY',
+	'WFMOutpre:BN_Fmt': 'RI',
+	'WFMOutpre:BYT_Nr': '1',
+	'WFMOutpre:BYT_Or': 'MSB',
+	'SELect:CH{n}': '0',
+	'CH{n}:SCAle': '100.0000E-3',
+	'CH{n}:POSition': '0.0E+0',
+	'TRIGger:A:TYPe': 'EDGE',
+	'TRIGger:A:MODe': 'AUTO',
+	'TRIGger:A:EDGE:SOUrce': 'CH1',
+	'TRIGger:A:EDGE:COUPling': 'DC',
+	'TRIGger:A:EDGE:SLOpe': 'RISE',
+	'TRIGger:A:LEVel:CH{n}': '0.0E+0',
+	'TRIGger:A:PULSEWidth:LOWLimit': '4.0000E-9',
+	'TRIGger:A:PULSEWidth:HIGHLimit': '8.0000E-9',
+	'TRIGger:A:PULSEWidth:WHEn': 'LESSTHAN',
+	'TRIGger:A:PULSEWidth:POLarity': 'POSITIVE',
+	'TRIGger:A:PULSEWidth:LOGICQUALification': 'OFF',
+	'DISplay:WAVEform': 'ON',
+	'HEADer': '0',
+	'VERBose': '1',
+}
+
+def _header_keys(spec: str) -> list[str]:
+	'''Return all the ways a mixed case header can be written, mixing long and short nodes.'''
+	nodes = [tuple(dict.fromkeys(f)) for f in zip(*(form.split(':') for form in _forms(spec)))]
+	return [':'.join(combo) for combo in itertools.product(*nodes)]
+
+class MSO4Simulator(util.DisableNewAttr):
+	'''Simulated MSO4 scope, served over a raw TCP socket on localhost, to run code and benchmarks
+	without an instrument on the bench:
+
+	.. code-block:: python
+
+		with pyMSO4.MSO4Simulator(trigger_rate=500) as sim:
+			mso44 = pyMSO4.MSO4()
+			mso44.con(resource=sim.resource)
+			...
+
+	The SCPI subset used by this library is implemented: settings of the acquisition, channel and
+	trigger objects are stored and read back (unknown settings are echoed back as well),
+	``SET?``, ``WFMOutpre?``, ``CURVE?`` and ``CURVestream?`` are supported. Waveforms are
+	noisy sine waves, a different one for each channel, encoded according to the ``WFMOutpre``
+	settings. The simulated instrument accepts a single connection at a time.
+	'''
+
+	def __init__(self, model: str = 'MSO44', port: int = 0, latency: float = 0.0, bandwidth: float = 0.0,
+			trigger_rate: float = 1000.0, arm_delay: float = 0.2, noise: float = 0.02, seed: int | None = None):
+		'''
+		Args:
+			model: Model returned by ``*IDN?`` (``MSO44`` or ``MSO46``)
+			port: TCP port to listen on, 0 to pick a free one
+			latency: Delay (in s) before each response is sent
+			bandwidth: Maximum transfer rate (in bytes/s) of responses, 0 for unlimited
+			trigger_rate: Maximum number of acquisitions per second in curvestream mode
+			arm_delay: Delay (in s) between ``CURVestream?`` and the first waveform. Like on the
+				real scope, it lets the client clear its buffers after enabling curvestream.
+			noise: Standard deviation of the noise added to each waveform, relative to full scale
+			seed: Seed of the noise generator, for reproducible waveforms
+
+		Raises:
+			ValueError: Invalid model
+		'''
+		super().__init__()
+
+		if model not in ['MSO44', 'MSO46']:
+			raise ValueError(f'Invalid model {model}. Valid models are MSO44 and MSO46')
+		self.model = model
+		#: Delay (in s) before each response is sent
+		self.latency: float = latency
+		#: Maximum transfer rate (in bytes/s) of responses, 0 for unlimited
+		self.bandwidth: float = bandwidth
+		#: Maximum number of acquisitions per second in curvestream mode
+		self.trigger_rate: float = trigger_rate
+		#: Delay (in s) between ``CURVestream?`` and the first waveform
+		self.arm_delay: float = arm_delay
+		#: Number of waveforms sent to the client
+		self.waveforms: int = 0
+
+		self._ch_a_count = int(model[-1])
+		self._noise = noise
+		self._rng = np.random.default_rng(seed)
+		self._noise_pool = np.empty(0)
+		self._settings: dict[str, str] = {}
+		self._headers: dict[str, str] = {} # Any form of a known header -> its long form
+		for spec in _DEFAULTS:
+			for n in (range(1, self._ch_a_count + 1) if '{n}' in spec else [0]):
+				full = spec.format(n=n)
+				for key in _header_keys(full):
+					self._headers[key] = _forms(full)[0]
+		self.reset()
+
+		self._srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._srv.bind(('127.0.0.1', port))
+		self._srv.listen(1)
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._serve, name='pyMSO4-simulator', daemon=True)
+		self._streaming = 0.0 # Time of the next curvestream waveform, 0 if disabled
+		self._acq_start = 0.0 # Time the last single sequence acquisition was armed
+		self._acq_done = 0.0 # Time the last single sequence acquisition completes
+
+		self.disable_newattr()
+
+	@property
+	def port(self) -> int:
+		'''TCP port the simulator listens on.'''
+		return self._srv.getsockname()[1]
+
+	@property
+	def resource(self) -> str:
+		'''VISA resource string of the simulator, to be passed to :func:`MSO4.con`.'''
+		return f'TCPIP0::127.0.0.1::{self.port}::SOCKET'
+
+	def start(self) -> 'MSO4Simulator':
+		'''Start serving in a background thread.'''
+		self._stop.clear()
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		'''Stop serving and close the socket.'''
+		self._stop.set()
+		if self._thread.is_alive():
+			self._thread.join()
+		self._srv.close()
+
+	def __enter__(self) -> 'MSO4Simulator':
+		return self.start()
+
+	def __exit__(self, *args) -> None:
+		self.stop()
+
+	def reset(self) -> None:
+		'''Restore the default settings (like ``*RST``).'''
+		self._settings = {_forms(spec.format(n=n))[0]: value
+			for spec, value in _DEFAULTS.items()
+			for n in (range(1, self._ch_a_count + 1) if '{n}' in spec else [0])}
+		self._settings['SELECT:CH1'] = '1'
+		# Data window of the last single sequence acquisition, None while acquiring continuously.
+		# Like on the scope, CURVE? applies DATa:STARt/STOP to the stored record right away,
+		# but the preamble (NR_Pt, XZERO) is only updated by an acquisition.
+		self._acq_window: tuple[int, int] | None = None
+
+	def _serve(self) -> None:
+		self._srv.settimeout(0.1)
+		while not self._stop.is_set():
+			try:
+				conn, _ = self._srv.accept()
+			except socket.timeout:
+				continue
+			with conn:
+				conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+				try:
+					self._handle(conn)
+				except OSError as e: # Client went away
+					scope_logger.debug('Simulator connection closed: %s', e)
+			self._streaming = 0.0
+
+	def _handle(self, conn: socket.socket) -> None:
+		pending = b''
+		while not self._stop.is_set():
+			timeout = 0.1
+			if self._streaming:
+				timeout = max(0.0, min(timeout, self._streaming - time.monotonic()))
+			readable, _, _ = select.select([conn], [], [], timeout)
+			if readable:
+				data = conn.recv(65536)
+				if not data:
+					return
+				pending += data
+				while b'\n' in pending:
+					line, pending = pending.split(b'\n', 1)
+					self._streaming = 0.0 # Any command interrupts curvestream
+					resp = self._execute(line.decode('ascii', 'replace').strip())
+					if resp:
+						self._send(conn, resp)
+			elif self._streaming and time.monotonic() >= self._streaming:
+				self._send(conn, self._curve() + b'\n')
+				self._streaming = max(self._streaming + 1 / self.trigger_rate, time.monotonic())
+
+	def _send(self, conn: socket.socket, data: bytes) -> None:
+		if self.latency:
+			time.sleep(self.latency)
+		if not self.bandwidth:
+			conn.sendall(data)
+			return
+		chunk = 65536
+		for i in range(0, len(data), chunk):
+			conn.sendall(data[i:i + chunk])
+			time.sleep(len(data[i:i + chunk]) / self.bandwidth)
+
+	def _execute(self, msg: str) -> bytes:
+		'''Execute a (compound) message and return the response, terminator included.'''
+		resps: list[bytes] = []
+		path: list[str] = []
+		for cmd in _split(msg):
+			cmd = cmd.strip()
+			if not cmd:
+				continue
+			header, _, arg = cmd.partition(' ')
+			arg = arg.strip()
+			query = header.endswith('?')
+			header = header.rstrip('?').upper()
+			if header.startswith('*'):
+				resp = self._common(header, query)
+			else:
+				nodes = header[1:].split(':') if header.startswith(':') else path + header.split(':')
+				path = nodes[:-1]
+				resp = self._command(':'.join(nodes), arg, query)
+			if resp is not None:
+				resps.append(resp if isinstance(resp, bytes) else resp.encode())
+		if not resps:
+			return b''
+		return b';'.join(resps) + b'\n'
+
+	def _common(self, header: str, query: bool) -> str | None:
+		if header == '*IDN' and query:
+			return f'TEKTRONIX,{self.model},SIM0001,CF:91.1CT FV:2.0.3.950'
+		if header == '*RST':
+			self.reset()
+		elif header == '*OPC' and query:
+			time.sleep(max(0.0, self._acq_done - time.monotonic())) # Wait for the acquisition
+			return '1'
+		elif header in ('*ESR', '*STB') and query:
+			return '0'
+		return None
+
+	def _canon(self, header: str) -> str:
+		return self._headers.get(header, header)
+
+	def _reply(self, header: str, value: str) -> str:
+		if self._settings['HEADER'] in ('1', 'ON'):
+			return f':{header} {value}'
+		return value
+
+	def _command(self, header: str, arg: str, query: bool) -> str | bytes | None:
+		canon = self._canon(header)
+		if canon in ('CURVE', 'CURV') and query:
+			return self._curve()
+		if canon.startswith('CURVES') and query: # CURVEStream
+			self._streaming = time.monotonic() + self.arm_delay
+			self._acq_window = None # Each waveform streamed is a new acquisition
+			return None
+		if canon == 'SET' and query:
+			return ';'.join(f':{k} {v}' for k, v in self._settings.items())
+		if canon in ('WFMOUTPRE', 'WFMO') and query:
+			return ';'.join(self._reply(f'WFMOUTPRE:{k}', v) for k, v in self._preamble().items())
+		if canon.startswith('WFMOUTPRE:') and query:
+			field = canon.split(':', 1)[1]
+			return self._reply(canon, self._preamble().get(field, self._settings.get(canon, '0')))
+		if canon == 'BUSY' and query:
+			return self._reply('BUSY', '1' if time.monotonic() < self._acq_done else '0')
+		if canon.startswith('HORIZONTAL:FASTFRAME:TIMESTAMP:ALL:') and query:
+			return self._timestamps(arg)
+		if canon == 'ACQUIRE:STATE' and not query and arg in ('1', 'ON', 'RUN') and self._get('ACQuire:STOPAfter') == 'SEQUENCE':
+			# Single sequence: one trigger per frame at the trigger rate
+			frames = self._get('HORizontal:FASTframe:COUNt', int) if self._fastframe() else 1
+			if self._get('ACQuire:MODe') in ('AVERAGE', 'AVE'):
+				frames *= self._get('ACQuire:NUMAVg', int) # One sequence averages NUMAVg acquisitions
+			self._acq_start = time.monotonic()
+			self._acq_done = self._acq_start + frames / self.trigger_rate
+			self._acq_window = self._record()
+		elif canon == 'ACQUIRE:STATE' and not query and arg in ('1', 'ON', 'RUN'):
+			self._acq_window = None
+		elif canon == 'ACQUIRE:STOPAFTER' and not query and arg.upper().startswith('SEQ') and self._acq_window is None:
+			self._acq_window = self._record() # Continuous acquisition stops after the current one
+		if canon in ('MATH:ADDNEW', 'MATH:DELETE', 'MATH:LIST'):
+			return self._math_command(canon, arg, query)
+		if query:
+			return self._reply(canon, self._settings.get(canon, '0'))
+		if canon in ('CLEAR', 'TRIGGER', 'SCOPEAPP:REBOOT'):
+			return None
+		if canon == 'DATA:SOURCE':
+			arg = ','.join(arg.upper().replace(',', ' ').split())
+		elif not arg.startswith('"'):
+			arg = arg.upper()
+		self._settings[canon] = arg
+		return None
+
+	def _math_command(self, canon: str, arg: str, query: bool) -> str | None:
+		'''Handle ``MATH:ADDNew``, ``MATH:DELete`` and ``MATH:LIST?``. The settings of the math
+		waveforms (e.g. ``MATH:MATH1:DEFine``) are stored like any other.'''
+		if query:
+			names = sorted({k.split(':')[1] for k in self._settings if re.match(r'MATH:MATH\d+:', k)})
+			return self._reply(canon, ','.join(names) or 'NONE')
+		name = arg.strip('"').upper()
+		if canon == 'MATH:ADDNEW':
+			self._settings[f'MATH:{name}:DEFINE'] = '"CH1"'
+			self._settings[f'MATH:{name}:TYPE'] = 'BASIC'
+		else:
+			for k in [k for k in self._settings if k.startswith(f'MATH:{name}:')]:
+				del self._settings[k]
+		return None
+
+	def _math_waveform(self, math: int, first: int, n: int, levels: float) -> np.ndarray:
+		'''Evaluate the definition of a math waveform: a channel, or two channels combined with
+		``+``, ``-``, ``*`` or ``/``. Anything else (e.g. FFTs) gives the waveform of channel 1.'''
+		definition = self._settings.get(f'MATH:MATH{math}:DEFINE', '"CH1"').strip('"').upper().replace(' ', '')
+		m = re.fullmatch(r'CH(\d)(?:([-+*/])CH(\d))?', definition)
+		if not m:
+			return self._waveform(1, first, n, levels)
+		a = self._waveform(int(m.group(1)), first, n, levels)
+		if not m.group(2):
+			return a
+		b = self._waveform(int(m.group(3)), first, n, levels)
+		op = {'+': np.add, '-': np.subtract, '*': lambda x, y: x * y / levels, '/': lambda x, y: np.divide(x, np.where(y == 0, 1, y))}
+		return op[m.group(2)](a, b)
+
+	def _get(self, spec: str, typ: type = str):
+		return typ(self._settings[_forms(spec)[0]])
+
+	def _sources(self) -> list[int]:
+		return [int(s[2:]) for s in self._settings['DATA:SOURCE'].split(',') if s.startswith('CH')]
+
+	def _record(self) -> tuple[int, int]:
+		'''Return the first index and number of points of the transferred waveforms.'''
+		record_length = self._get('HORizontal:MODe:RECOrdlength', int)
+		start = min(max(self._get('DATa:STARt', int), 1), record_length)
+		stop = min(max(self._get('DATa:STOP', int), start), record_length)
+		return start - 1, stop - start + 1
+
+	def _preamble(self) -> dict[str, str]:
+		byt_nr = self._get('WFMOutpre:BYT_Nr', int)
+		fmt = self._get('WFMOutpre:BN_Fmt')
+		src = (self._sources() or [1])[0]
+		scale = self._get(f'CH{src}:SCAle', float)
+		position = self._get(f'CH{src}:POSition', float)
+		first, nr_pt = self._acq_window or self._record()
+		xincr = 1 / self._get('HORizontal:MODe:SAMPlerate', float)
+		# Time of the first point transferred, the trigger is at HORizontal:POSition of the record
+		trigger = self._get('HORizontal:POSition', float) / 100 * self._get('HORizontal:MODe:RECOrdlength', int)
+		return {
+			'BYT_NR': str(byt_nr),
+			'BIT_NR': str(8 * byt_nr),
+			'ENCDG': self._get('WFMOutpre:ENCdg'),
+			'BN_FMT': fmt,
+			'BYT_OR': self._get('WFMOutpre:BYT_Or'),
+			'WFID': f'"Ch{src}, DC coupling, {scale * 1e3:.1f}mV/div, simulated"',
+			'NR_PT': str(nr_pt),
+			'PT_FMT': 'Y',
+			'PT_ORDER': 'LINEAR',
+			'XUNIT': '"s"',
+			'XINCR': f'{xincr:.4E}',
+			'XZERO': f'{(first - trigger) * xincr:.6E}',
+			'PT_OFF': '0',
+			'NR_FR': str(len(self._frames())),
+			'YUNIT': '"V"',
+			'YMULT': f'{1.0 if fmt == "FP" else scale * 10 / 256 ** byt_nr:.4E}',
+			'YOFF': f'{0 if fmt != "RP" else 2 ** (8 * byt_nr - 1):.4E}',
+			'YZERO': f'{-position * scale:.4E}',
+		}
+
+	def _waveform(self, ch: int, first: int, n: int, levels: float) -> np.ndarray:
+		'''Return a noisy sine wave in ADC levels (full scale is ``±levels``).'''
+		if self._noise_pool.size < n + 4096:
+			self._noise_pool = self._rng.normal(0, self._noise, n + 4096)
+		off = self._rng.integers(4096)
+		noise = self._noise_pool[off:off + n]
+		if self._get('ACQuire:MODe') in ('AVERAGE', 'AVE'):
+			noise = noise / np.sqrt(self._get('ACQuire:NUMAVg', int))
+		t = np.arange(first, first + n) * (2 * np.pi * ch / self._get('HORizontal:MODe:RECOrdlength', int))
+		return (0.5 * np.sin(t + ch) + noise) * levels
+
+	def _fastframe(self) -> bool:
+		return self._get('HORizontal:FASTframe:STATE') in ('1', 'ON')
+
+	def _frames(self) -> range:
+		'''Return the (0-based) FastFrame frames transferred.'''
+		if not self._fastframe():
+			return range(1)
+		count = self._get('HORizontal:FASTframe:COUNt', int)
+		start = min(max(self._get('DATa:FRAMESTARt', int), 1), count)
+		return range(start - 1, min(max(self._get('DATa:FRAMESTOP', int), start), count))
+
+	def _timestamps(self, arg: str) -> str:
+		'''Return the trigger time of FastFrame frames (``<start>,<count>`` in ``arg``).'''
+		start, count = (int(x) for x in arg.split(','))
+		stamps = []
+		for frame in range(start - 1, start - 1 + count):
+			t = time.time() - (time.monotonic() - self._acq_start) + frame / self.trigger_rate
+			frac = f'{t % 1:.12f}'[2:]
+			stamps.append(f'"{time.strftime("%d %b %Y %H:%M:%S", time.gmtime(t))}.{frac[:3]} {frac[3:6]} {frac[6:9]} {frac[9:]}"')
+		return ','.join(stamps)
+
+	def _curve(self) -> bytes:
+		'''Return one waveform per source, encoded according to the WFMOutpre settings (without terminator).'''
+		first, n = self._record()
+		byt_nr = self._get('WFMOutpre:BYT_Nr', int)
+		fmt = self._get('WFMOutpre:BN_Fmt')
+		order = '>' if self._get('WFMOutpre:BYT_Or') == 'MSB' else '<'
+		if fmt == 'FP':
+			dtype, levels, offset = np.dtype(f'{order}f4'), 5.0, 0
+		else:
+			dtype = np.dtype(f'{order}{"u" if fmt == "RP" else "i"}{byt_nr}')
+			levels, offset = 2 ** (8 * byt_nr - 1) - 1, (2 ** (8 * byt_nr - 1) if fmt == 'RP' else 0)
+		blocks = []
+		for src in self._settings['DATA:SOURCE'].split(','):
+			kind, num = re.fullmatch(r'(CH|MATH)(\d+)', src).groups()
+			gen = self._math_waveform if kind == 'MATH' else self._waveform
+			# FastFrame frames are sent back to back in a single block
+			wfm = np.concatenate([gen(int(num), first, n, levels) for _ in self._frames()]) + offset
+			if dtype.kind != 'f':
+				wfm = np.clip(np.rint(wfm), np.iinfo(dtype).min, np.iinfo(dtype).max)
+			if self._get('WFMOutpre:ENCdg') == 'ASCII':
+				blocks.append(','.join(map(str, wfm.astype(dtype).tolist())).encode())
+			else:
+				payload = wfm.astype(dtype).tobytes()
+				length = str(len(payload)).encode()
+				blocks.append(b'#' + str(len(length)).encode() + length + payload)
+			self.waveforms += 1
+		return b';'.join(blocks)
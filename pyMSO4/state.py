@@ -0,0 +1,144 @@
+from typing import Any, Callable, Iterator
+
+def _split(resp: str) -> Iterator[str]:
+	'''Split a SCPI response on ``;``, ignoring separators inside quoted strings.'''
+	start = 0
+	quote = ''
+	for i, c in enumerate(resp):
+		if quote:
+			if c == quote:
+				quote = ''
+		elif c in '"\'':
+			quote = c
+		elif c == ';':
+			yield resp[start:i]
+			start = i + 1
+	yield resp[start:]
+
+def _forms(spec: str) -> tuple[str, str]:
+	'''Return the long and short form of a SCPI header given in mixed case (e.g. ``CH1:SCAle``
+	becomes ``CH1:SCALE`` and ``CH1:SCA``).'''
+	longs, shorts = [], []
+	for node in spec.strip(':').split(':'):
+		stem = node.rstrip('0123456789')
+		suffix = node[len(stem):]
+		short = stem
+		if not stem.islower(): # All lower case nodes are matched in full
+			short = ''
+			for c in stem:
+				if c.islower():
+					break
+				short += c
+		longs.append(node.upper())
+		shorts.append((short + suffix).upper())
+	return ':'.join(longs), ':'.join(shorts)
+
+def _parse_value(value: str, typ: type) -> Any:
+	if typ is bool:
+		return value.strip().upper() in ('1', 'ON')
+	if typ is str:
+		return value.strip()
+	return typ(value.strip())
+
+class MSO4State:
+	'''Full configuration of the scope, as returned by the ``SET?`` query.
+
+	Settings are stored as the (uppercase) headers and values sent by the scope, and are looked
+	up with mixed case SCPI headers, matching both the long and short form:
+
+	.. code-block:: python
+
+		state = mso44.snapshot()
+		state['CH1:SCAle']                # '1.0000E-2'
+		state.get('CH1:SCAle', float)     # 0.01
+		state.get('ACQuire:FASTAcq:STATE', bool)
+	'''
+
+	def __init__(self, settings: dict[str, str] | None = None):
+		'''
+		Args:
+			settings: Mapping of uppercase SCPI headers (without leading ``:``) to their values
+		'''
+		#: Mapping of uppercase SCPI headers (without leading ``:``) to their values
+		self.settings: dict[str, str] = dict(settings or {})
+
+	@classmethod
+	def parse(cls, resp: str) -> 'MSO4State':
+		'''Parse the response to a ``SET?`` query. Compound headers relative to the
+		previous command are expanded to their full path.
+
+		Args:
+			resp: The response to ``SET?``
+		'''
+		settings = {}
+		path: list[str] = []
+		for entry in _split(resp.strip()):
+			entry = entry.strip()
+			if not entry:
+				continue
+			header, _, value = entry.partition(' ')
+			if header.startswith('*'): # Common commands don't change the current path
+				settings[header.upper()] = value.strip()
+				continue
+			if header.startswith(':'):
+				nodes = header[1:].split(':')
+			else:
+				nodes = path + header.split(':')
+			path = nodes[:-1]
+			settings[':'.join(nodes).upper()] = value.strip()
+		return cls(settings)
+
+	def _key(self, spec: str) -> str | None:
+		if spec.upper().lstrip(':') in self.settings:
+			return spec.upper().lstrip(':')
+		for form in _forms(spec):
+			if form in self.settings:
+				return form
+		return None
+
+	def __getitem__(self, spec: str) -> str:
+		key = self._key(spec)
+		if key is None:
+			raise KeyError(spec)
+		return self.settings[key]
+
+	def __contains__(self, spec: str) -> bool:
+		return self._key(spec) is not None
+
+	def __len__(self) -> int:
+		return len(self.settings)
+
+	def __iter__(self) -> Iterator[str]:
+		return iter(self.settings)
+
+	def __eq__(self, other: object) -> bool:
+		return isinstance(other, MSO4State) and self.settings == other.settings
+
+	def get(self, spec: str, typ: Callable | type = str, default: Any = None) -> Any:
+		'''Get a setting converted to ``typ``.
+
+		Args:
+			spec: SCPI header in mixed case (e.g. ``HORizontal:SCAle``)
+			typ: Type to convert the value to. ``bool`` accepts ``1``/``0`` and ``ON``/``OFF``.
+			default: Returned if the setting is not part of the state
+
+		Raises:
+			ValueError: The value cannot be converted to ``typ``
+		'''
+		key = self._key(spec)
+		if key is None:
+			return default
+		return _parse_value(self.settings[key], typ) # type: ignore
+
+	def diff(self, other: 'MSO4State') -> 'MSO4State':
+		'''Return the settings of this state which are missing or different in ``other``,
+		in the same order as in this state.
+
+		Args:
+			other: The state to compare with (usually the current state of the scope)
+		'''
+		return MSO4State({k: v for k, v in self.settings.items() if other.settings.get(k) != v})
+
+	def commands(self) -> list[str]:
+		'''Return the commands needed to apply this state.'''
+		return [f':{k} {v}' if v else f':{k}' for k, v in self.settings.items()]
@@ -0,0 +1,248 @@
+import datetime
+import json
+import os
+import struct
+
+import numpy as np
+
+from . import util
+from .acquisition import MSO4Acquisition
+
+# File layout:
+#  - fixed size preamble (see _PREAMBLE)
+#  - JSON header (scaling, acquisition settings, sample layout)
+#  - zero padding up to a multiple of _ALIGN
+#  - samples, one trace after the other with a fixed stride of wfm_len * itemsize bytes
+_MAGIC = b'PYMSO4TA'
+_VERSION = 1
+_PREAMBLE = struct.Struct('<8sIIQQ') # magic, version, header length, data offset, number of traces
+_ALIGN = 4096
+
+class TraceArchiveWriter(util.DisableNewAttr):
+	'''Streaming writer for on-disk trace archives, to collect more traces than fit in RAM.
+
+	Samples are appended through a :class:`numpy.memmap` window that grows along with the file,
+	so traces can be written in place by :func:`MSO4Acquisition.read_waveform`:
+
+	.. code-block:: python
+
+		with TraceArchiveWriter.from_acquisition('traces.bin', mso44.acq) as archive:
+			mso44.acq.curvestream = True
+			for _ in range(1_000_000):
+				mso44.acq.read_waveform(out=archive.reserve())
+				archive.commit()
+
+	Use :class:`TraceArchive` to read the archive back.
+	'''
+
+	def __init__(self, path: str | os.PathLike, wfm_len: int, dtype: np.dtype | str, header: dict | None = None, grow: int = 4096):
+		'''Create a new archive, overwriting ``path`` if it exists.
+
+		Args:
+			path: Path of the archive file
+			wfm_len: Number of points in each trace
+			dtype: Data type of the samples. Samples are stored little endian.
+			header: Additional JSON-serializable information to store in the header
+				(e.g. waveform scaling and acquisition settings)
+			grow: Number of traces the file is grown by every time it fills up
+
+		Raises:
+			ValueError: Invalid trace length or grow size
+		'''
+		super().__init__()
+
+		if wfm_len < 1 or grow < 1:
+			raise ValueError(f'Invalid trace length {wfm_len} or grow size {grow}. Both must be positive.')
+
+		self._dtype = np.dtype(dtype).newbyteorder('<')
+		self._wfm_len = wfm_len
+		self._stride = wfm_len * self._dtype.itemsize
+		self._grow = grow
+
+		#: Header stored in the archive
+		self.header: dict = {
+			'dtype': self._dtype.str,
+			'wfm_len': wfm_len,
+			'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+			**(header or {}),
+		}
+		hdr = json.dumps(self.header).encode()
+		self._header_len = len(hdr)
+		self._data_offset = -(-(_PREAMBLE.size + len(hdr)) // _ALIGN) * _ALIGN
+
+		self._f = open(path, 'w+b') # pylint: disable=consider-using-with
+		self._f.write(_PREAMBLE.pack(_MAGIC, _VERSION, self._header_len, self._data_offset, 0))
+		self._f.write(hdr)
+		self._f.truncate(self._data_offset)
+
+		self._count = 0 # Committed traces
+		self._capacity = 0 # Traces the file can hold before growing
+		self._window: np.memmap | None = None # Mapping of the last grown region
+		self._window_start = 0 # Index of the first trace in the window
+		self._reserved = False
+
+		self.disable_newattr()
+
+	@classmethod
+	def from_acquisition(cls, path: str | os.PathLike, acq: MSO4Acquisition, header: dict | None = None, grow: int = 4096) -> 'TraceArchiveWriter':
+		'''Create a new archive sized from the current acquisition settings. The WFMOutpre
+		scaling and the acquisition settings are stored in the header.
+
+		NOTE: This sends queries to the scope, call it before enabling curvestream mode.
+
+		Args:
+			path: Path of the archive file
+			acq: The acquisition object of a connected scope
+			header: Additional JSON-serializable information to store in the header
+			grow: Number of traces the file is grown by every time it fills up
+		'''
+		scaling = acq.preamble().as_dict()
+		settings = {
+			'mode': acq.mode,
+			'horiz_sample_rate': acq.horiz_sample_rate,
+			'horiz_scale': acq.horiz_scale,
+			'horiz_pos': acq.horiz_pos,
+			'horiz_record_length': acq.horiz_record_length,
+			'wfm_src': acq.wfm_src,
+			'wfm_start': acq.wfm_start,
+			'wfm_stop': acq.wfm_stop,
+			'wfm_binary_format': acq.wfm_binary_format,
+			'wfm_byte_nr': acq.wfm_byte_nr,
+		}
+		return cls(path, acq.wfm_len, acq.get_datatype(), {'scaling': scaling, 'settings': settings, **(header or {})}, grow)
+
+	def __enter__(self) -> 'TraceArchiveWriter':
+		return self
+
+	def __exit__(self, *exc) -> None:
+		self.close()
+
+	def __len__(self) -> int:
+		return self._count
+
+	def _grow_file(self) -> None:
+		if self._window is not None:
+			self._window.flush()
+		self._window_start = self._capacity
+		self._capacity += self._grow
+		self._f.truncate(self._data_offset + self._capacity * self._stride)
+		self._window = np.memmap(self._f, dtype=self._dtype, mode='r+',
+			offset=self._data_offset + self._window_start * self._stride, shape=(self._grow, self._wfm_len))
+
+	def reserve(self) -> np.ndarray:
+		'''Return a writable view of the next trace slot in the file. The trace becomes part
+		of the archive once :func:`TraceArchiveWriter.commit` is called.
+
+		Raises:
+			ValueError: The archive is closed
+		'''
+		if self._f.closed:
+			raise ValueError('Trace archive is closed')
+		self._reserved = True
+		if self._count >= self._capacity:
+			self._grow_file()
+		return self._window[self._count - self._window_start] # type: ignore
+
+	def commit(self) -> None:
+		'''Add the trace written in the slot returned by :func:`TraceArchiveWriter.reserve`.
+
+		Raises:
+			ValueError: No slot was reserved
+		'''
+		if not self._reserved:
+			raise ValueError('No trace slot was reserved')
+		self._reserved = False
+		self._count += 1
+
+	def append(self, trace: np.ndarray) -> None:
+		'''Copy a trace at the end of the archive.
+
+		Args:
+			trace: 1-D array of ``wfm_len`` points
+		'''
+		self.reserve()[:] = trace
+		self.commit()
+
+	def flush(self) -> None:
+		'''Write pending samples and the trace count to disk, so that readers can see them.'''
+		if self._window is not None:
+			self._window.flush()
+		self._f.seek(0)
+		self._f.write(_PREAMBLE.pack(_MAGIC, _VERSION, self._header_len, self._data_offset, self._count))
+		self._f.flush()
+
+	def close(self) -> None:
+		'''Flush the archive and trim the unused preallocated space.'''
+		if self._f.closed:
+			return
+		self.flush()
+		self._window = None
+		self._f.truncate(self._data_offset + self._count * self._stride)
+		self._f.close()
+
+class TraceArchive(util.DisableNewAttr):
+	'''Read-only view of a trace archive written by :class:`TraceArchiveWriter`.
+
+	The samples are memory mapped and only loaded from disk when accessed, so slicing a
+	few traces out of a huge archive is cheap:
+
+	.. code-block:: python
+
+		archive = TraceArchive('traces.bin')
+		first = archive[:1000] # (1000, wfm_len) array
+	'''
+
+	def __init__(self, path: str | os.PathLike):
+		'''Open an existing archive.
+
+		Args:
+			path: Path of the archive file
+
+		Raises:
+			OSError: The file is not a valid trace archive
+		'''
+		super().__init__()
+
+		self._path = path
+		with open(path, 'rb') as f:
+			magic, version, header_len, data_offset, _ = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+			if magic != _MAGIC:
+				raise OSError(f'{path} is not a pyMSO4 trace archive')
+			if version != _VERSION:
+				raise OSError(f'Unsupported trace archive version {version}')
+			#: Header stored in the archive
+			self.header: dict = json.loads(f.read(header_len))
+		self._data_offset: int = data_offset
+		self._dtype = np.dtype(self.header['dtype'])
+		self._wfm_len: int = self.header['wfm_len']
+
+		#: Memory mapped ``(n_traces, wfm_len)`` array of samples
+		self.traces: np.ndarray = np.empty((0, self._wfm_len), dtype=self._dtype)
+		self.refresh()
+
+		self.disable_newattr()
+
+	def refresh(self) -> None:
+		'''Re-read the trace count from disk, to pick up traces flushed by a writer
+		since the archive was opened.'''
+		with open(self._path, 'rb') as f:
+			count = _PREAMBLE.unpack(f.read(_PREAMBLE.size))[4]
+		if count:
+			self.traces = np.memmap(self._path, dtype=self._dtype, mode='r',
+				offset=self._data_offset, shape=(count, self._wfm_len))
+
+	@property
+	def scaling(self) -> dict[str, float]:
+		'''WFMOutpre preamble (see :class:`MSO4Preamble`) stored in the header, empty if not available.'''
+		return self.header.get('scaling', {})
+
+	@property
+	def wfm_len(self) -> int:
+		'''Number of points in each trace.'''
+		return self._wfm_len
+
+	def __len__(self) -> int:
+		return self.traces.shape[0]
+
+	def __getitem__(self, key) -> np.ndarray:
+		return self.traces[key]
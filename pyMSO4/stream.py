@@ -0,0 +1,171 @@
+import queue
+import threading
+from typing import Callable, Iterator
+
+import numpy as np
+import pyvisa
+
+from . import util
+from . import scope_logger
+from .acquisition import MSO4Acquisition
+from .integrity import TraceIntegrityError
+
+class MSO4Stream(util.DisableNewAttr):
+	'''Background curvestream acquisition engine.
+
+	A dedicated reader thread owns the VISA resource and reads curvestream blocks into a pool
+	of preallocated buffers. Filled buffers are pushed onto a bounded queue: when the consumer
+	falls behind, the reader stops reading until a buffer is released (backpressure), so the
+	memory used is fixed. This lets DUT stimulus, trace reading and processing/storage overlap.
+
+	While the stream is running, no other command must be sent to the scope.
+	Use :func:`MSO4.start_stream` rather than instantiating this class directly.
+	'''
+
+	def __init__(self, acq: MSO4Acquisition, consumer: Callable[[np.ndarray], None] | None = None, n_buffers: int = 16,
+			clear: Callable[[], None] | None = None):
+		'''Create a new stream. Queries the waveform length and datatype, so it must be
+		created before curvestream mode is enabled.
+
+		Args:
+			acq: The acquisition object of a connected scope
+			consumer: Called from a separate thread with each trace (a ``(n_sources, wfm_len)`` array
+				if several sources are set in :attr:`MSO4Acquisition.wfm_src`). The array is only valid
+				until the call returns (the buffer is reused afterwards). If None, traces must
+				be retrieved with :func:`MSO4Stream.get` or by iterating the stream.
+			n_buffers: Number of preallocated trace buffers (i.e. maximum queue depth)
+			clear: Clears the input buffers of the resource (see :func:`MSO4.clear_buffers`),
+				defaults to a VISA clear
+
+		Raises:
+			ValueError: Invalid number of buffers
+		'''
+		super().__init__()
+
+		if n_buffers < 1:
+			raise ValueError(f'Invalid number of buffers {n_buffers}. Must be positive.')
+
+		self.acq: MSO4Acquisition = acq
+		self._consumer = consumer
+		self._clear = clear or acq.sc.clear
+		# With several sources, each buffer holds one (n_sources, wfm_len) transfer
+		n_src = len(acq.wfm_src)
+		shape = (n_buffers, acq.wfm_len) if n_src == 1 else (n_buffers, n_src, acq.wfm_len)
+		self._bufs = np.empty(shape, dtype=acq.get_dtype().newbyteorder('='))
+		self._read = acq.read_waveform if n_src == 1 else acq.read_waveforms
+		self._free: queue.Queue[int] = queue.Queue()
+		for i in range(n_buffers):
+			self._free.put(i)
+		self._filled: queue.Queue[int | None] = queue.Queue(maxsize=n_buffers)
+
+		self._stop = threading.Event()
+		self._reader = threading.Thread(target=self._read_loop, name='pyMSO4-reader', daemon=True)
+		self._worker = threading.Thread(target=self._consume_loop, name='pyMSO4-consumer', daemon=True) if consumer else None
+
+		#: Number of traces read from the scope
+		self.traces: int = 0
+		#: Number of reads that timed out
+		self.timeouts: int = 0
+		#: Exception that stopped the reader or consumer thread, if any
+		self.error: BaseException | None = None
+
+		self.disable_newattr()
+
+	@property
+	def running(self) -> bool:
+		'''True if the reader thread is running.'''
+		return self._reader.is_alive()
+
+	def start(self) -> None:
+		'''Enable curvestream mode and start the reader (and consumer) threads.'''
+		self.acq.curvestream = True
+		self._clear() # Good measure
+		self._stop.clear()
+		self._reader.start()
+		if self._worker:
+			self._worker.start()
+
+	def stop(self) -> None:
+		'''Stop the reader thread, let the consumer process the traces already read,
+		disable curvestream mode and discard the traces still in the input buffer.
+		The reader stops after its current read completes or times out, so this might
+		take up to one VISA timeout.
+		'''
+		self._stop.set()
+		if self._reader.is_alive():
+			self._reader.join()
+		if self._worker and self._worker.is_alive():
+			self._filled.put(None)
+			self._worker.join()
+		self.acq.curvestream = False
+		self._clear() # Otherwise the blocks sent meanwhile are read as the next response
+
+	def _read_loop(self) -> None:
+		try:
+			while not self._stop.is_set():
+				try:
+					idx = self._free.get(timeout=0.1)
+				except queue.Empty:
+					continue # Backpressure, consumer is lagging behind
+				try:
+					self._read(out=self._bufs[idx])
+				except (pyvisa.errors.VisaIOError, TraceIntegrityError) as e:
+					self._free.put(idx)
+					if isinstance(e, TraceIntegrityError):
+						scope_logger.warning('%s, re-arming...', e)
+					elif e.error_code != pyvisa.constants.VI_ERROR_TMO:
+						raise
+					else:
+						self.timeouts += 1
+					self.acq.curvestream = False # Stop first, the scope might still be sending
+					self._clear()
+					self.acq.curvestream = True
+					continue
+				self.traces += 1
+				self._filled.put(idx)
+		except Exception as e: # pylint: disable=broad-exception-caught
+			scope_logger.error('Stream reader stopped: %s', e)
+			self.error = e
+			self._stop.set()
+
+	def _consume_loop(self) -> None:
+		while True:
+			idx = self._filled.get()
+			if idx is None:
+				return
+			try:
+				self._consumer(self._bufs[idx]) # type: ignore
+			except Exception as e: # pylint: disable=broad-exception-caught
+				scope_logger.error('Stream consumer stopped: %s', e)
+				self.error = e
+				self._stop.set()
+				return
+			finally:
+				self._free.put(idx)
+
+	def get(self, timeout: float | None = None) -> np.ndarray:
+		'''Get the next trace read by the stream. Only usable when no consumer was given.
+
+		Args:
+			timeout: Maximum time to wait for a trace (in s), None to wait forever
+
+		Returns: A copy of the trace
+
+		Raises:
+			ValueError: The stream has a consumer
+			queue.Empty: No trace was read within ``timeout``
+		'''
+		if self._worker:
+			raise ValueError('Cannot get traces from a stream with a consumer')
+		idx = self._filled.get(timeout=timeout)
+		try:
+			return self._bufs[idx].copy() # type: ignore
+		finally:
+			self._free.put(idx) # type: ignore
+
+	def __iter__(self) -> Iterator[np.ndarray]:
+		while self.running or not self._filled.empty():
+			try:
+				yield self.get(timeout=0.1)
+			except queue.Empty:
+				continue
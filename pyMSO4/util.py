@@ -56,11 +56,15 @@ class DisableNewAttr(object):
         if name in self._read_only_attrs:
             self._read_only_attrs.remove(name)
 
+    def _has_attr(self, name):
+        # Don't use hasattr(self, name): it would run property getters, i.e. query the scope
+        return name in self.__dict__ or hasattr(type(self), name)
+
     def __setattr__(self, name, value):
-        if hasattr(self, '_new_attributes_disabled') and self._new_attributes_disabled and not hasattr(self, name):  # would this create a new attribute?
+        if hasattr(self, '_new_attributes_disabled') and self._new_attributes_disabled and not self._has_attr(name):  # would this create a new attribute?
             #raise AttributeError("Attempt to set unknown attribute in %s"%self.__class__, name)
             scope_logger.error("Setting unknown attribute {} in {}".format(name, self.__class__))
-            if hasattr(self, '_new_attributes_disabled_strict') and self._new_attributes_disabled_strict and not hasattr(self, name):
+            if hasattr(self, '_new_attributes_disabled_strict') and self._new_attributes_disabled_strict and not self._has_attr(name):
                 raise AttributeError("Attempt to set unknown attribute in %s"%self.__class__, name)
         if name in self._read_only_attrs:
             raise AttributeError("Attribute {} is read-only!".format(name))
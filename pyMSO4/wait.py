@@ -0,0 +1,77 @@
+import time
+
+import pyvisa
+from pyvisa.constants import EventMechanism, EventType
+
+from . import scope_logger
+
+#: Status Byte bit set when an enabled Standard Event Status Register bit is set (ESB)
+STB_ESB = 1 << 5
+#: Standard Event Status Register bit set when all pending operations complete (OPC)
+ESR_OPC = 1 << 0
+
+# Attribute of the resource recording whether service requests work on it. It is stored on the
+# resource so that it goes away with the connection: unknown resources are tried once.
+_SRQ_SUPPORT = '_pymso4_srq_support'
+
+def _wait_srq(res: pyvisa.resources.MessageBasedResource, timeout: float | None) -> bool:
+	'''Wait for the Operation Complete service request. Returns False if service requests are not
+	supported by the VISA backend or interface (e.g. raw sockets).'''
+	try:
+		res.enable_event(EventType.service_request, EventMechanism.queue)
+	except (NotImplementedError, pyvisa.errors.VisaIOError) as e:
+		scope_logger.debug('Service requests not supported (%s), polling BUSY? instead', e)
+		return False
+	try:
+		# OPC sets the ESB bit of the status byte, which requests service
+		res.write(f'*CLS;*ESE {ESR_OPC};*SRE {STB_ESB};*OPC')
+		try:
+			res.wait_on_event(EventType.service_request, pyvisa.constants.VI_TMO_INFINITE if timeout is None else int(timeout))
+		except pyvisa.errors.VisaIOError as e:
+			if e.error_code == pyvisa.constants.VI_ERROR_TMO:
+				raise TimeoutError(f'Operation did not complete within {timeout} ms') from e
+			raise
+		res.read_stb() # Clear the request
+	finally:
+		res.disable_event(EventType.service_request, EventMechanism.queue)
+		res.write('*SRE 0;*ESE 0;*CLS')
+	return True
+
+def _poll_busy(res: pyvisa.resources.MessageBasedResource, timeout: float | None,
+		min_interval: float, max_interval: float) -> None:
+	'''Poll ``BUSY?``, doubling the interval between polls from ``min_interval`` up to ``max_interval``,
+	so that short operations are detected quickly and long ones do not flood the scope.'''
+	deadline = None if timeout is None else time.monotonic() + timeout / 1000
+	interval = min_interval
+	while int(res.query('BUSY?').strip()):
+		if deadline is not None and time.monotonic() + interval > deadline:
+			raise TimeoutError(f'Operation did not complete within {timeout} ms')
+		time.sleep(interval)
+		interval = min(interval * 2, max_interval)
+
+def wait_complete(res: pyvisa.resources.MessageBasedResource, timeout: float | None = None, srq: bool = True,
+		min_interval: float = 0.001, max_interval: float = 0.1) -> None:
+	'''Wait until the scope completes all pending operations (e.g. a single sequence acquisition,
+	a reset...), without sending queries in a loop when possible.
+
+	If ``srq`` is True and the VISA backend supports it, the Operation Complete bit is routed to a
+	service request (``*ESE``/``*SRE``/``*OPC``) and the VISA event is waited for: no traffic is
+	generated while waiting, and completion is detected immediately. Otherwise ``BUSY?`` is polled
+	with an exponential backoff between ``min_interval`` and ``max_interval``.
+
+	Args:
+		res: The VISA resource of the scope
+		timeout: Maximum time to wait (in ms), None to wait forever
+		srq: Try to use service requests
+		min_interval: First interval (in s) between ``BUSY?`` polls
+		max_interval: Maximum interval (in s) between ``BUSY?`` polls
+
+	Raises:
+		TimeoutError: The operation did not complete within ``timeout``
+	'''
+	if srq and getattr(res, _SRQ_SUPPORT, True):
+		supported = _wait_srq(res, timeout)
+		setattr(res, _SRQ_SUPPORT, supported)
+		if supported:
+			return
+	_poll_busy(res, timeout, min_interval, max_interval)
@@ -0,0 +1,29 @@
+import pytest
+import pyvisa
+
+import pyMSO4
+
+@pytest.fixture
+def sim():
+	'''A simulated MSO44, served for the duration of the test.'''
+	with pyMSO4.MSO4Simulator(trigger_rate=2000, seed=0) as s:
+		yield s
+
+@pytest.fixture
+def scope(sim):
+	'''A scope connected to :func:`sim`, set up to read 8 bit waveforms of channel 1.'''
+	mso44 = pyMSO4.MSO4()
+	mso44.con(resource=sim.resource)
+	with mso44.batch():
+		mso44.acq.mode = 'sample'
+		mso44.acq.wfm_src = ['ch1']
+		mso44.acq.wfm_encoding = 'binary'
+		mso44.acq.wfm_binary_format = 'ri'
+		mso44.acq.wfm_byte_nr = 1
+		mso44.acq.wfm_byte_order = 'msb'
+	yield mso44
+	if mso44.connect_status:
+		try:
+			mso44.dis()
+		except (OSError, pyvisa.errors.VisaIOError):
+			pass # The test stopped the simulator
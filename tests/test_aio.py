@@ -0,0 +1,50 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from pyMSO4.aio import AsyncMSO4
+
+async def _collect(scope, n, **kwargs):
+	traces = []
+	async with contextlib.aclosing(scope.acq.astream(**kwargs)) as stream:
+		async for trace in stream:
+			traces.append(trace.copy())
+			if len(traces) == n:
+				break
+	return traces
+
+def test_astream(scope):
+	scope.acq.set_window(1, 1000)
+	ascope = AsyncMSO4(scope)
+	traces = asyncio.run(_collect(ascope, 5, timeout=1))
+	assert len(traces) == 5 and traces[0].shape == (1000,)
+	assert not scope.acq.curvestream
+	assert scope.sc.query('*IDN?').startswith('TEKTRONIX')
+
+def test_astream_recover(sim, scope):
+	scope.acq.set_window(1, 1000)
+	old_timeout = scope.sc.timeout
+	# After the first waveform of each arm, the next one only comes 10 s later
+	sim.trigger_rate = 0.1
+	scope.instrument = True
+	traces = asyncio.run(_collect(AsyncMSO4(scope), 3, timeout=0.5))
+	assert len(traces) == 3
+	assert scope.stats()['*CLS']['writes'] >= 2 # Re-armed after each timeout
+	assert scope.sc.timeout == old_timeout
+	assert scope.sc.query('*IDN?').startswith('TEKTRONIX')
+
+def test_astream_timeout(sim, scope):
+	scope.acq.set_window(1, 1000)
+	old_timeout = scope.sc.timeout
+	sim.trigger_rate = 0.1
+	with pytest.raises(TimeoutError):
+		asyncio.run(_collect(AsyncMSO4(scope), 3, timeout=0.5, recover=False))
+	assert scope.sc.timeout == old_timeout
+	assert not scope.acq.curvestream
+	assert scope.sc.query('*IDN?').startswith('TEKTRONIX')
+
+def test_not_connected():
+	ascope = AsyncMSO4()
+	with pytest.raises(OSError):
+		asyncio.run(_collect(ascope, 1))
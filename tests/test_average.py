@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+def test_acquire_average(scope):
+	scope.acq.set_window(1, 1000)
+	wfm = scope.acq.acquire_average(16, timeout=5000)
+	assert wfm.shape == (1000,)
+	assert scope.acq.mode == 'average'
+	assert scope.acq.num_avg == 16
+
+def test_acquire_average_invalid_keeps_cache(scope):
+	with pytest.raises(ValueError):
+		scope.acq.acquire_average(1)
+	assert scope.acq.mode == 'sample'
+	scope.clear_cache()
+	assert scope.acq.mode == 'sample'
+
+def test_acquire_average_after_fastframe(scope):
+	scope.acq.set_window(1, 1000)
+	assert scope.acq.acquire_fastframe(4, timeout=5000).shape == (4, 1000)
+	wfm = scope.acq.acquire_average(4, timeout=5000)
+	assert wfm.shape == (1000,)
+	assert not scope.acq.fastframe
+
+def test_math_channel(scope):
+	scope.acq.set_window(1, 1000)
+	diff = scope.add_math('CH1-CH2')
+	assert diff.source == 'math1'
+	assert diff.definition == 'CH1-CH2'
+	assert scope.ch_math == {1: diff}
+	scope.acq.wfm_src = ['ch1', 'ch2', diff.source]
+	wfm = scope.acq.acquire_average(2, timeout=5000).astype(np.float64)
+	assert wfm.shape == (3, 1000)
+	# Noise is drawn independently for each source, only the shape of the difference is checked
+	assert np.corrcoef(wfm[0] - wfm[1], wfm[2])[0, 1] > 0.9
+	scope.delete_math(diff)
+	assert not scope.ch_math
+	with pytest.raises(ValueError):
+		scope.delete_math(1)
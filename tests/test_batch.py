@@ -0,0 +1,46 @@
+import pytest
+
+from pyMSO4.batch import SCPIBatch, join_commands
+
+def test_join_commands():
+	assert join_commands(['CH1:SCAle 0.1', ':HORizontal:SCAle 2e-7', '*CLS']) == ':CH1:SCAle 0.1;:HORizontal:SCAle 2e-7;*CLS'
+
+def test_batch_single_message(scope):
+	scope.clear_cache()
+	scope.instrument = True
+	with scope.batch():
+		scope.ch_a[1].scale = 0.5
+		scope.ch_a[2].position = 1.0
+		scope.acq.horiz_pos = 20
+	stats = scope.stats()
+	assert stats['CH1:SCAle;CH2:POSition;HORizontal:POSition']['writes'] == 1
+	scope.clear_cache()
+	assert (scope.ch_a[1].scale, scope.ch_a[2].position, scope.acq.horiz_pos) == (0.5, 1.0, 20)
+
+def test_batch_exception_drops_cache(scope):
+	scale = scope.ch_a[1].scale
+	with pytest.raises(RuntimeError):
+		with scope.batch():
+			scope.ch_a[1].scale = scale * 2
+			raise RuntimeError
+	assert scope.ch_a[1].scale == scale
+	scope.clear_cache()
+	assert scope.ch_a[1].scale == scale
+
+def test_internal_batch_exception_drops_cache(scope):
+	'''Bare SCPIBatch, as used inside the library, keeps the cache coherent too.'''
+	assert scope.acq.mode == 'sample'
+	with pytest.raises(ValueError):
+		with SCPIBatch(scope.sc):
+			scope.acq.mode = 'average'
+			scope.acq.num_avg = 1 # Rejected by the validator
+	assert scope.acq.mode == 'sample'
+	scope.acq.mode = 'average' # Not skipped as a cached value
+	scope.clear_cache()
+	assert scope.acq.mode == 'average'
+
+def test_getter_inside_batch_sees_update(scope):
+	with scope.batch():
+		scope.ch_a[1].scale = 0.25
+		scope.ch_a[1].clear_caches()
+		assert scope.ch_a[1].scale == 0.25
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from pyMSO4 import TraceBuffer
+
+def _trace(value, wfm_len=4):
+	return np.full(wfm_len, value, dtype=np.int8)
+
+def test_reserve_commit():
+	buf = TraceBuffer(3, 4, 'b')
+	idx, row = buf.reserve()
+	assert idx == 0 and not buf.valid[0]
+	row[:] = 5
+	buf.commit(idx)
+	assert len(buf) == 1 and buf.total == 1
+	traces = buf.traces()
+	assert traces.tolist() == [[5] * 4]
+	assert np.shares_memory(traces, buf.data) # In order without gaps: a view
+
+def test_reserve_twice_reuses_slot():
+	buf = TraceBuffer(3, 4, 'b')
+	assert buf.reserve()[0] == buf.reserve()[0] == 0
+	assert buf.total == 1
+
+def test_commit_not_reserved():
+	buf = TraceBuffer(3, 4, 'b')
+	with pytest.raises(ValueError):
+		buf.commit(0)
+	idx, _ = buf.reserve()
+	buf.commit(idx)
+	with pytest.raises(ValueError):
+		buf.mark_timeout(idx)
+
+def test_full():
+	buf = TraceBuffer(2, 4, 'b')
+	buf.append(_trace(1))
+	buf.append(_trace(2))
+	assert buf.full
+	with pytest.raises(IndexError):
+		buf.reserve()
+
+def test_mark_timeout():
+	buf = TraceBuffer(4, 4, 'b')
+	buf.append(_trace(1))
+	idx, _ = buf.reserve()
+	buf.mark_timeout(idx)
+	buf.append(_trace(3))
+	assert buf.total == 3 and len(buf) == 2
+	assert buf.timed_out.tolist() == [False, True, False, False]
+	assert buf.traces()[:, 0].tolist() == [1, 3] # The timed out slot is skipped
+	# Reusing a timed out slot clears its flag
+	buf.reset()
+	idx, _ = buf.reserve()
+	assert idx == 0 and not buf.timed_out.any()
+
+def test_ring_overwrite_order():
+	buf = TraceBuffer(3, 4, 'b', ring=True)
+	for i in range(5):
+		buf.append(_trace(i))
+	assert not buf.full and len(buf) == 3 and buf.total == 5
+	assert buf.data[:, 0].tolist() == [3, 4, 2] # Slots 0 and 1 were overwritten
+	assert buf.traces()[:, 0].tolist() == [2, 3, 4] # Oldest first
+
+def test_ring_timeout_after_wrap():
+	buf = TraceBuffer(3, 4, 'b', ring=True)
+	for i in range(4):
+		buf.append(_trace(i))
+	idx, _ = buf.reserve()
+	buf.mark_timeout(idx)
+	assert idx == 1
+	assert buf.traces()[:, 0].tolist() == [2, 3]
+
+def test_readonly_masks():
+	buf = TraceBuffer(2, 4, 'b')
+	with pytest.raises(ValueError):
+		buf.valid[0] = True
+
+def test_from_acquisition(scope):
+	scope.acq.set_window(1, 1000)
+	buf = TraceBuffer.from_acquisition(scope.acq, 2)
+	idx, row = buf.reserve()
+	scope.acq.query_waveform(out=row)
+	buf.commit(idx)
+	assert buf.traces().shape == (1, 1000)
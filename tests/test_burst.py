@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from pyMSO4.burst import find_edges, match_template, segment
+
+def _square(period=100, n_periods=10):
+	return np.tile(np.repeat([0.0, 1.0], period // 2), n_periods)
+
+def test_find_edges():
+	sync = _square()
+	assert list(find_edges(sync)) == list(range(50, 1000, 100))
+	assert list(find_edges(sync, slope='fall')) == list(range(100, 1000, 100))
+	assert list(find_edges(sync, threshold=2)) == []
+
+def test_find_edges_holdoff():
+	sync = _square()
+	sync[52] = 0 # Glitch just after the first edge
+	assert find_edges(sync)[:3].tolist() == [50, 53, 150]
+	assert find_edges(sync, holdoff=10)[:2].tolist() == [50, 150]
+
+def test_find_edges_invalid_slope():
+	with pytest.raises(ValueError):
+		find_edges(_square(), slope='both') # type: ignore
+
+def test_match_template():
+	rng = np.random.default_rng(0)
+	template = rng.normal(size=32)
+	signal = rng.normal(scale=0.1, size=2000)
+	positions = [100, 700, 1500]
+	for p in positions:
+		signal[p:p + len(template)] += template
+	assert match_template(signal, template).tolist() == positions
+
+def test_match_template_errors():
+	with pytest.raises(ValueError):
+		match_template(np.zeros(10), np.arange(20.0))
+	with pytest.raises(ValueError):
+		match_template(np.arange(100.0), np.ones(10))
+
+def test_segment():
+	data = np.arange(100)
+	segs = segment(data, np.array([0, 10, 95]), 10)
+	assert segs.tolist() == [list(range(0, 10)), list(range(10, 20))] # The last one does not fit
+	segs = segment(data, np.array([0, 10, 95]), 5, offset=-2)
+	assert segs.tolist() == [list(range(8, 13)), list(range(93, 98))] # The first one starts before 0
+
+def test_segment_multi_source():
+	data = np.arange(200).reshape(2, 100)
+	segs = segment(data, np.array([10, 50]), 4)
+	assert segs.shape == (2, 2, 4)
+	assert segs[1].tolist() == [list(range(50, 54)), list(range(150, 154))]
+
+def test_segment_invalid_length():
+	with pytest.raises(ValueError):
+		segment(np.arange(10), np.array([0]), 0)
+
+def test_acquire_burst(scope):
+	scope.acq.horiz_record_length = 10_000
+	segments, starts = scope.acq.acquire_burst(200, data_src='ch1', sync_src='ch1', timeout=5000)
+	assert len(starts) and segments.shape == (len(starts), 200)
+	assert scope.acq.wfm_src == ['ch1']
+
+def test_acquire_burst_curvestream(scope):
+	scope.acq.get_dtype()
+	scope.acq.wfm_src # pylint: disable=pointless-statement
+	scope.acq.curvestream = True
+	scope.instrument = True
+	with pytest.raises(ValueError):
+		scope.acq.acquire_burst(200, data_src='ch1', sync_src='ch2')
+	assert not scope.stats() # Nothing was sent
+	scope.acq.curvestream = False
+	scope.clear_buffers()
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+def _transfer(scope):
+	scope.clear_cache()
+	return scope.acq.wfm_byte_nr, scope.acq.wfm_binary_format
+
+def test_auto_byte_nr(scope):
+	scope.acq.auto_byte_nr = True
+	assert _transfer(scope) == (1, 'ri')
+	for mode in ('average', 'hires'):
+		scope.acq.mode = mode
+		assert _transfer(scope) == (2, 'ri')
+		assert scope.acq.get_dtype() == np.dtype('>i2')
+	scope.acq.mode = 'sample'
+	assert _transfer(scope) == (1, 'ri')
+
+def test_auto_byte_nr_in_batch(scope):
+	scope.acq.auto_byte_nr = True
+	scope.instrument = True
+	with scope.batch():
+		scope.acq.mode = 'hires'
+	# The mode and the width are sent in the same message (the format is already ri)
+	assert scope.stats()['ACQuire:MODe;WFMOutpre:BYT_Nr']['writes'] == 1
+	assert _transfer(scope) == (2, 'ri')
+
+def test_auto_byte_nr_enable_applies_mode(scope):
+	scope.acq.mode = 'average'
+	assert _transfer(scope) == (1, 'ri') # Disabled by default
+	scope.acq.auto_byte_nr = True
+	assert _transfer(scope) == (2, 'ri')
+
+def test_set_mode_byte_nr(scope):
+	scope.acq.auto_byte_nr = True
+	scope.acq.mode = 'average'
+	scope.acq.set_mode_byte_nr('average', 8, 'fp') # Applied right away to the current mode
+	assert _transfer(scope) == (8, 'fp')
+	scope.acq.set_mode_byte_nr('sample', 2, 'rp')
+	scope.acq.mode = 'sample'
+	assert _transfer(scope) == (2, 'rp')
+
+@pytest.mark.parametrize('args', [('fastacq', 1), ('sample', 4), ('sample', 1, 'fp')])
+def test_set_mode_byte_nr_invalid(scope, args):
+	with pytest.raises(ValueError):
+		scope.acq.set_mode_byte_nr(*args)
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from pyMSO4 import cache
+
+def _misses(obj):
+	return obj.cache_stats()['misses']
+
+def test_write_through(scope):
+	ch = scope.ch_a[1]
+	ch.clear_caches()
+	before = ch.cache_stats()
+	scale = ch.scale
+	assert ch.scale == scale
+	stats = ch.cache_stats()
+	assert (stats['hits'] - before['hits'], stats['misses'] - before['misses']) == (1, 1)
+	scope.instrument = True
+	ch.scale = scale # Already set, nothing is sent
+	assert 'CH1:SCAle' not in scope.stats()
+
+def test_never(scope):
+	ch = scope.ch_a[1]
+	ch.set_cache_policy('scale', cache.NEVER)
+	misses = _misses(ch)
+	ch.scale = 0.2
+	assert ch.scale == 0.2 and ch.scale == 0.2
+	assert _misses(ch) == misses + 2
+
+def test_ttl(scope):
+	ch = scope.ch_a[1]
+	ch.set_cache_policy('position', cache.TTL, ttl=0.2)
+	misses = _misses(ch)
+	ch.position
+	ch.position
+	assert _misses(ch) == misses + 1
+	time.sleep(0.25)
+	ch.position
+	assert _misses(ch) == misses + 2
+
+def test_invalid_policy(scope):
+	with pytest.raises(ValueError):
+		scope.ch_a[1].set_cache_policy('scale', 'sometimes')
+	with pytest.raises(ValueError):
+		scope.ch_a[1].set_cache_policy('channel', cache.NEVER)
+
+def test_invalidates(scope):
+	acq = scope.acq
+	acq.horiz_sample_rate
+	misses = _misses(acq)
+	acq.horiz_sample_rate
+	assert _misses(acq) == misses
+	acq.horiz_scale = 4e-7 # Changes the sample rate or the record length
+	acq.horiz_sample_rate
+	assert _misses(acq) == misses + 1
+
+def test_falsy_value_hit(scope):
+	trig = scope.trigger
+	trig.source = 'ch1'
+	trig.level = 0.0
+	stats = scope.cache_stats()
+	assert trig.level == 0.0
+	assert scope.cache_stats() == {'hits': stats['hits'] + 1, 'misses': stats['misses']}
+
+def test_mso4_cache_stats(scope):
+	scope.clear_cache()
+	stats = scope.cache_stats()
+	scope.ch_a[2].scale
+	scope.ch_a[2].scale
+	scope.acq.mode
+	assert scope.cache_stats() == {'hits': stats['hits'] + 1, 'misses': stats['misses'] + 2}
+
+def test_load_state_skips_never(scope):
+	ch = scope.ch_a[1]
+	ch.set_cache_policy('scale', cache.NEVER)
+	scope.snapshot()
+	misses = _misses(ch)
+	ch.scale
+	ch.position
+	assert _misses(ch) == misses + 1
+
+def test_scaling_epoch_per_resource(sim, scope):
+	epoch = cache.scaling_epoch(scope.sc)
+	scope.ch_a[1].scale = 0.3
+	assert cache.scaling_epoch(scope.sc) == epoch + 1
+	scope.dis()
+	scope.con(resource=sim.resource)
+	assert cache.scaling_epoch(scope.sc) == 0 # New connection, new resource
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+def test_acquire_fastframe(scope):
+	scope.acq.set_window(1, 500)
+	frames = scope.acq.acquire_fastframe(8, timeout=5000)
+	assert frames.shape == (8, 500)
+	assert frames.dtype == np.dtype('>i1')
+	assert scope.acq.fastframe
+	assert scope.acq.stop_after == 'sequence'
+	stamps = scope.acq.fastframe_timestamps()
+	assert stamps is not None and len(stamps) == 8
+	assert stamps[0] == 0 and np.all(np.diff(stamps) > 0)
+
+def test_acquire_fastframe_out(scope):
+	scope.acq.set_window(1, 500)
+	out = np.empty((4, 500), dtype=np.float32)
+	assert scope.acq.acquire_fastframe(4, timeout=5000, out=out) is out
+	with pytest.raises(ValueError):
+		scope.acq.acquire_fastframe(4, timeout=5000, out=np.empty((3, 500)))
+
+@pytest.mark.parametrize('n_frames', [0, -1, 2.5])
+def test_acquire_fastframe_invalid_keeps_cache(scope, n_frames):
+	assert scope.acq.stop_after == 'runstop'
+	assert not scope.acq.fastframe
+	with pytest.raises(ValueError):
+		scope.acq.acquire_fastframe(n_frames)
+	assert scope.acq.stop_after == 'runstop'
+	assert not scope.acq.fastframe
+	scope.clear_cache()
+	assert scope.acq.stop_after == 'runstop'
+	assert not scope.acq.fastframe
+
+def test_acquire_fastframe_multi_source(scope):
+	scope.acq.set_window(1, 500)
+	scope.acq.wfm_src = ['ch1', 'ch2']
+	frames = scope.acq.acquire_fastframe(4, timeout=5000)
+	assert frames.shape == (2, 4, 500)
+	# Each channel is a sine of a different frequency
+	assert not np.array_equal(frames[0], frames[1])
+	# Both blocks were read
+	assert scope.sc.query('*IDN?').startswith('TEKTRONIX')
+	out = np.empty((2, 4, 500), dtype=np.int16)
+	assert scope.acq.acquire_fastframe(4, timeout=5000, out=out) is out
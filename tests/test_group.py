@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from pyMSO4.acquisition import MSO4Preamble
+from pyMSO4.group import align_traces
+from pyMSO4.state import MSO4State
+
+def _preamble(xincr, xzero=0.0, pt_off=0):
+	return MSO4Preamble(MSO4State({'WFMOUTPRE:XINCR': repr(xincr), 'WFMOUTPRE:XZERO': repr(xzero),
+		'WFMOUTPRE:PT_OFF': str(pt_off)}))
+
+def test_same_xincr_views():
+	a, b = np.arange(100.0), np.arange(100.0)
+	# b triggered 10 samples later than a
+	t, (ra, rb) = align_traces([a, b], [_preamble(1e-9, pt_off=0), _preamble(1e-9, pt_off=10)])
+	assert len(t) == len(ra) == len(rb) == 90
+	assert np.isclose(t[0], 0)
+	assert np.array_equal(ra, a[:90]) and np.array_equal(rb, b[10:])
+	assert np.shares_memory(ra, a) and np.shares_memory(rb, b)
+
+def test_deskew():
+	a, b = np.arange(100.0), np.arange(100.0)
+	t, (ra, rb) = align_traces([a, b], [_preamble(1e-9), _preamble(1e-9)], deskew=[0, 5e-9])
+	assert len(t) == 95
+	assert np.array_equal(ra, a[5:]) and np.array_equal(rb, b[:95])
+
+def test_multi_source():
+	a = np.arange(200.0).reshape(2, 100)
+	b = np.arange(100.0)
+	_, (ra, rb) = align_traces([a, b], [_preamble(1e-9, pt_off=20), _preamble(1e-9)])
+	assert ra.shape == (2, 80) and rb.shape == (80,)
+	assert np.array_equal(ra, a[:, 20:])
+
+def test_different_xincr_interpolates():
+	# Ramps of slope 1 V/ns sampled at 1 ns and 0.5 ns
+	fast = np.arange(200) * 0.5
+	slow = np.arange(100) * 1.0
+	t, (rf, rs) = align_traces([fast, slow], [_preamble(0.5e-9), _preamble(1e-9)])
+	assert np.allclose(np.diff(t), 1e-9)
+	assert len(t) == 100
+	assert np.allclose(rf, t * 1e9) and np.allclose(rs, t * 1e9)
+
+def test_length_mismatch():
+	with pytest.raises(ValueError):
+		align_traces([np.zeros(10)], [_preamble(1e-9), _preamble(1e-9)])
+	with pytest.raises(ValueError):
+		align_traces([np.zeros(10)], [_preamble(1e-9)], deskew=[0, 0])
+
+def test_no_overlap():
+	with pytest.raises(ValueError):
+		align_traces([np.zeros(10), np.zeros(10)], [_preamble(1e-9), _preamble(1e-9, xzero=1e-6)])
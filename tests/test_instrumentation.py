@@ -0,0 +1,26 @@
+import logging
+
+from pyMSO4.instrumentation import VisaInstrumentation
+
+def test_debug_logs_transfers(scope, caplog):
+	scope.debug = True
+	with caplog.at_level(logging.DEBUG, logger='pyMSO44'):
+		scope.sc.query('*IDN?')
+	scope.debug = False
+	messages = [r.getMessage() for r in caplog.records if r.name == 'pyMSO44']
+	assert any(m.startswith('write *IDN?') for m in messages)
+	assert any(m.startswith('read *IDN?') for m in messages)
+
+def test_stats(scope):
+	scope.instrument = True
+	scope.sc.query('*IDN?')
+	scope.sc.query('*IDN?')
+	assert scope.stats()['*IDN?']['writes'] == 2
+
+def test_prometheus_escapes_labels():
+	instr = VisaInstrumentation()
+	instr.enabled = True
+	instr._record('CH1:SCAle', 'write', 20, 1e-3) # pylint: disable=protected-access
+	text = instr.prometheus(labels={'scope': 'a"b\\c\nd'})
+	assert 'scope="a\\"b\\\\c\\nd"' in text
+	assert 'pymso4_visa_transfers_total{scope="a\\"b\\\\c\\nd",command="CH1:SCAle",op="write"} 1' in text
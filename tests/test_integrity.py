@@ -0,0 +1,74 @@
+import zlib
+
+import pytest
+import pyvisa
+
+from pyMSO4 import integrity as integrity_mod
+from pyMSO4 import TraceIntegrity, TraceIntegrityError
+
+def test_duplicates():
+	integrity = TraceIntegrity(wfm_bytes=4)
+	integrity.check(b'abcd', 4)
+	assert not integrity.duplicate and integrity.last_hash == zlib.crc32(b'abcd')
+	integrity.check(b'abcd', 4)
+	assert integrity.duplicate
+	integrity.check(b'abce', 4) # Different data, different hash
+	assert not integrity.duplicate
+	integrity.check(b'abce', 4)
+	assert integrity.stats() == {'traces': 4, 'duplicates': 2, 'short_reads': 0, 'timeouts': 0}
+
+def test_length_mismatch():
+	integrity = TraceIntegrity(wfm_bytes=4)
+	integrity.check(b'abcd', 4)
+	with pytest.raises(TraceIntegrityError):
+		integrity.check(b'abc', 3)
+	assert integrity.short_reads == 1 and not integrity.duplicate
+	# The rejected transfer is not hashed, the next one is compared with the last valid one
+	integrity.check(b'abcd', 4)
+	assert integrity.duplicate
+	assert integrity.stats() == {'traces': 3, 'duplicates': 1, 'short_reads': 1, 'timeouts': 0}
+
+def test_no_length_check():
+	integrity = TraceIntegrity()
+	integrity.check(b'abc', 3)
+	integrity.check(b'abcdef', 6)
+	assert integrity.short_reads == 0
+
+def test_reset():
+	integrity = TraceIntegrity(wfm_bytes=4)
+	integrity.check(b'abcd', 4)
+	integrity.reset()
+	integrity.check(b'abcd', 4)
+	assert not integrity.duplicate
+	assert integrity.stats() == {'traces': 1, 'duplicates': 0, 'short_reads': 0, 'timeouts': 0}
+
+def test_xxhash():
+	xxhash = pytest.importorskip('xxhash')
+	integrity = TraceIntegrity(wfm_bytes=4, hash='xxhash')
+	integrity.check(memoryview(b'abcd'), 4)
+	assert integrity.last_hash == xxhash.xxh3_64_intdigest(b'abcd')
+	integrity.check(b'abcd', 4)
+	assert integrity.duplicate
+
+def test_xxhash_missing(monkeypatch):
+	monkeypatch.setattr(integrity_mod, 'xxhash', None)
+	with pytest.raises(ValueError):
+		TraceIntegrity(hash='xxhash')
+
+def test_invalid_hash():
+	with pytest.raises(ValueError):
+		TraceIntegrity(hash='md5')
+
+def test_timeouts(sim, scope):
+	scope.acq.set_window(1, 1000)
+	scope.acq.integrity = TraceIntegrity.from_acquisition(scope.acq)
+	assert scope.acq.integrity.wfm_bytes == 1000
+	sim.trigger_rate = 0.1 # A single trace per arm
+	scope.sc.timeout = 500
+	scope.acq.curvestream = True
+	scope.acq.read_waveform()
+	with pytest.raises(pyvisa.errors.VisaIOError):
+		scope.acq.read_waveform()
+	scope.acq.curvestream = False
+	scope.clear_buffers()
+	assert scope.acq.integrity.stats() == {'traces': 1, 'duplicates': 0, 'short_reads': 0, 'timeouts': 1}
@@ -0,0 +1,46 @@
+import threading
+
+import numpy as np
+import pytest
+
+from pyMSO4.pipeline import Decimate, RunningStats, TracePipeline
+
+def _traces(n=200, n_points=64):
+	return np.random.default_rng(0).integers(-128, 128, (n, n_points), dtype=np.int8)
+
+def _run(pipe, traces):
+	with pipe:
+		for trace in traces:
+			pipe.push(trace)
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_running_stats(workers):
+	traces = _traces()
+	stats = RunningStats()
+	_run(TracePipeline([stats], workers=workers, batch_size=16), traces)
+	assert stats.count == len(traces)
+	assert np.allclose(stats.mean, traces.mean(axis=0))
+	assert np.allclose(stats.variance, traces.astype(np.float64).var(axis=0))
+
+def test_workers_from_thread():
+	# The pool is created from the stream consumer thread
+	traces = _traces()
+	stats, out = RunningStats(), []
+	pipe = TracePipeline([Decimate(4), stats], workers=2, batch_size=16, sink=out.append)
+	thread = threading.Thread(target=_run, args=(pipe, traces))
+	thread.start()
+	thread.join(60)
+	assert not thread.is_alive()
+	assert stats.count == len(traces)
+	assert np.allclose(np.concatenate(out), traces.reshape(len(traces), -1, 4).mean(axis=-1))
+
+def test_shape_mismatch():
+	traces = _traces(2)
+	with TracePipeline([RunningStats()]) as pipe:
+		pipe.push(traces[0])
+		with pytest.raises(ValueError):
+			pipe.push(traces[0][:10])
+
+def test_merge_type():
+	with pytest.raises(TypeError):
+		RunningStats().merge(Decimate(2))
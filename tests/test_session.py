@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+import pyvisa
+
+import pyMSO4
+from pyMSO4 import session as session_mod
+
+def make_session(scope, sim, **kwargs):
+	kwargs.setdefault('reboot_vid_pid', None)
+	return pyMSO4.CurvestreamSession(scope, {'resource': sim.resource}, timeout=500, **kwargs)
+
+def read_next(session, attempts=5):
+	'''Read until a trace is delivered, e.g. while a re-armed stream restarts.'''
+	for _ in range(attempts):
+		trace = session.read()
+		if trace is not None:
+			return trace
+	return None
+
+def test_read(scope, sim):
+	scope.acq.set_window(1, 500)
+	with make_session(scope, sim) as session:
+		traces = [session.read() for _ in range(10)]
+	assert all(t is not None and t.shape == (500,) for t in traces)
+	assert session.stats()['traces'] == 10
+	assert not session.lost
+
+def test_timeouts_rearm_then_reconnect(scope, sim):
+	scope.acq.set_window(1, 500)
+	sim.trigger_rate = 0.1 # A single trace within the timeout
+	with make_session(scope, sim, max_timeouts=2) as session:
+		assert session.read() is not None
+		sim.arm_delay = 2.0 # No trigger within the timeout, even after re-arming
+		while session.reconnects == 0:
+			assert session.read() is None
+		assert session.timeouts == 3
+		assert session.lost == [1, 2, 3]
+		sim.arm_delay = 0.2
+		sim.trigger_rate = 2000
+		assert read_next(session) is not None
+
+def test_reconnect_keeps_local_settings(scope, sim):
+	scope.acq.set_window(1, 500)
+	scope.acq.set_mode_byte_nr('sample', 2)
+	integrity = scope.acq.integrity = pyMSO4.TraceIntegrity.from_acquisition(scope.acq)
+	with make_session(scope, sim) as session:
+		session.read()
+		session._recover() # pylint: disable=protected-access
+		assert session.reconnects == 1
+		assert scope.acq.integrity is integrity
+		assert scope.acq._mode_byte_nrs['sample'] == (2, 'ri') # pylint: disable=protected-access
+		assert session.read() is not None
+		stats = session.stats()
+	assert stats['duplicates'] == 0
+	assert stats['traces'] == 2
+
+def test_recover_waits_for_reboot(scope, sim, monkeypatch):
+	port = sim.port
+	events = []
+	restarted = []
+	def usb_reboot(vid, pid):
+		def cycle():
+			time.sleep(0.5) # The scope takes a while to go down
+			sim.stop()
+			events.append('down')
+			time.sleep(0.5)
+			restarted.append(pyMSO4.MSO4Simulator(port=port).start())
+		threading.Thread(target=cycle, daemon=True).start()
+		return True
+	monkeypatch.setattr(session_mod, 'usb_reboot', usb_reboot)
+
+	scope.acq.set_window(1, 500)
+	session = make_session(scope, sim, reboot_vid_pid=(0x0699, 0x0527), reboot_timeout=10, down_timeout=5)
+	session.snapshot = scope.snapshot()
+	reconnect = session._reconnect # pylint: disable=protected-access
+	attempts = []
+	def reconnect_after_reboot():
+		attempts.append(list(events))
+		if not session.reboots:
+			scope.dis() # Like a failed MSO4.con
+			raise OSError('Scope not answering')
+		reconnect()
+	monkeypatch.setattr(session, '_reconnect', reconnect_after_reboot)
+	try:
+		session._recover() # pylint: disable=protected-access
+		assert attempts[0] == []
+		assert all(a == ['down'] for a in attempts[1:]) # Never before the scope went down
+		assert (session.reboots, session.reconnects) == (1, 1)
+		assert read_next(session) is not None
+		session.stop()
+		scope.dis()
+	finally:
+		for s in restarted:
+			s.stop()
+
+def test_recover_without_reboot_raises(scope, sim):
+	session = make_session(scope, sim)
+	session.snapshot = scope.snapshot()
+	sim.stop()
+	with pytest.raises(OSError):
+		session._recover() # pylint: disable=protected-access
+
+def test_wait_down_closes_resource_manager(scope, sim, monkeypatch):
+	managers = []
+	new = pyvisa.ResourceManager
+	def resource_manager(*args):
+		managers.append(new(*args))
+		return managers[-1]
+	monkeypatch.setattr(session_mod.pyvisa, 'ResourceManager', resource_manager)
+	session = make_session(scope, sim)
+	scope.dis()
+	sim.stop()
+	assert session._wait_down() # pylint: disable=protected-access
+	with pytest.raises(pyvisa.errors.InvalidSession):
+		managers[0].session # pylint: disable=pointless-statement
@@ -0,0 +1,45 @@
+from pyMSO4.state import MSO4State
+
+def test_parse_path_expansion():
+	state = MSO4State.parse(':ACQUIRE:MODE SAMPLE;NUMAVG 16;:CH1:SCALE 1.0E-2;POSITION 0.5;*ESE 0;BANDWIDTH 1.0E9\n')
+	assert state.settings == {
+		'ACQUIRE:MODE': 'SAMPLE',
+		'ACQUIRE:NUMAVG': '16',
+		'CH1:SCALE': '1.0E-2',
+		'CH1:POSITION': '0.5',
+		'*ESE': '0',
+		'CH1:BANDWIDTH': '1.0E9', # Common commands do not change the path
+	}
+
+def test_parse_quoted_separator():
+	state = MSO4State.parse(':CH1:LABEL:NAME "a;b";:CH1:SCALE 1')
+	assert state['CH1:LABel:NAMe'] == '"a;b"'
+	assert state['CH1:SCAle'] == '1'
+
+def test_short_and_long_forms():
+	state = MSO4State.parse(':HORIZONTAL:SCALE 2.0E-7;:HOR:POS 50;:DATA:SOURCE CH1')
+	assert state['HORizontal:SCAle'] == state[':horizontal:scale'] == '2.0E-7'
+	assert state.get('HORizontal:POSition', float) == 50.0 # Stored in the short form
+	assert 'DATa:SOUrce' in state and 'DATa:STARt' not in state
+	assert state.get('DATa:STARt', int, 1) == 1
+	assert MSO4State.parse(':ACQUIRE:FASTACQ:STATE OFF').get('ACQuire:FASTAcq:STATE', bool) is False
+
+def test_diff_commands():
+	old = MSO4State({'CH1:SCALE': '1.0E-2', 'CH1:POSITION': '0', 'DATA:SOURCE': 'CH1'})
+	new = MSO4State({'CH1:SCALE': '2.0E-2', 'CH1:POSITION': '0', 'DATA:SOURCE': 'CH1,CH2', 'HEADER': ''})
+	diff = new.diff(old)
+	assert list(diff) == ['CH1:SCALE', 'DATA:SOURCE', 'HEADER']
+	assert diff.commands() == [':CH1:SCALE 2.0E-2', ':DATA:SOURCE CH1,CH2', ':HEADER']
+	assert not old.diff(old)
+
+def test_snapshot_apply(scope):
+	state = scope.snapshot()
+	assert state.get('CH1:SCAle', float) == scope.ch_a[1].scale
+	scope.ch_a[1].scale = 0.5
+	scope.acq.horiz_pos = 20
+	cmds = scope.apply(state)
+	assert sorted(c.split()[0] for c in cmds) == [':CH1:SCALE', ':HORIZONTAL:POSITION']
+	assert scope.snapshot() == state
+	scope.clear_cache()
+	assert scope.ch_a[1].scale == state.get('CH1:SCAle', float)
+	assert scope.apply(state) == [] # Nothing left to send
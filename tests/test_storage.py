@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from pyMSO4 import TraceArchive, TraceArchiveWriter
+from pyMSO4.storage import _ALIGN
+
+def test_round_trip(tmp_path):
+	path = tmp_path / 'traces.bin'
+	rng = np.random.default_rng(0)
+	traces = rng.integers(-2**15, 2**15, (10, 1001), dtype=np.int16)
+	# The stride is not a multiple of the page size, so the grown windows are not aligned
+	with TraceArchiveWriter(path, 1001, '>i2', header={'dut': 'aes'}, grow=3) as archive:
+		for i, trace in enumerate(traces):
+			if i % 2:
+				archive.append(trace)
+			else:
+				archive.reserve()[:] = trace
+				archive.commit()
+		assert len(archive) == 10
+	archive = TraceArchive(path)
+	assert len(archive) == 10 and archive.wfm_len == 1001
+	assert archive.header['dut'] == 'aes' and archive.header['dtype'] == '<i2'
+	assert np.array_equal(archive[:], traces)
+	assert path.stat().st_size == _ALIGN + traces.nbytes # Unused space trimmed on close
+
+def test_large_header(tmp_path):
+	path = tmp_path / 'traces.bin'
+	# The header does not fit in the first block, the data starts at the next boundary
+	with TraceArchiveWriter(path, 8, 'b', header={'notes': 'x' * _ALIGN}) as archive:
+		archive.append(np.arange(8))
+	archive = TraceArchive(path)
+	assert archive.header['notes'] == 'x' * _ALIGN
+	assert archive[0].tolist() == list(range(8))
+	assert path.stat().st_size == 2 * _ALIGN + 8
+
+def test_refresh(tmp_path):
+	path = tmp_path / 'traces.bin'
+	with TraceArchiveWriter(path, 8, 'b') as writer:
+		writer.append(np.zeros(8))
+		writer.flush()
+		archive = TraceArchive(path)
+		assert len(archive) == 1
+		writer.append(np.ones(8))
+		writer.flush()
+		archive.refresh()
+		assert archive[:, 0].tolist() == [0, 1]
+
+def test_writer_errors(tmp_path):
+	writer = TraceArchiveWriter(tmp_path / 'traces.bin', 8, 'b')
+	with pytest.raises(ValueError):
+		writer.commit()
+	writer.close()
+	with pytest.raises(ValueError):
+		writer.reserve()
+	with pytest.raises(ValueError):
+		TraceArchiveWriter(tmp_path / 'traces.bin', 0, 'b')
+
+def test_invalid_archive(tmp_path):
+	path = tmp_path / 'traces.bin'
+	path.write_bytes(bytes(64))
+	with pytest.raises(OSError):
+		TraceArchive(path)
+
+def test_from_acquisition(scope, tmp_path):
+	path = tmp_path / 'traces.bin'
+	scope.acq.set_window(1, 1000)
+	with TraceArchiveWriter.from_acquisition(path, scope.acq) as archive:
+		scope.acq.query_waveform(out=archive.reserve())
+		archive.commit()
+	archive = TraceArchive(path)
+	assert archive.traces.shape == (1, 1000)
+	assert archive.header['settings']['wfm_src'] == ['ch1']
+	assert archive.scaling['xincr'] > 0
@@ -0,0 +1,29 @@
+import pytest
+
+def test_stream_get(scope):
+	scope.acq.set_window(1, 1000)
+	stream = scope.start_stream()
+	traces = [stream.get(timeout=5) for _ in range(10)]
+	scope.stop_stream()
+	assert all(t.shape == (1000,) for t in traces)
+	assert stream.traces >= 10 and stream.error is None
+	# The blocks sent before curvestream was disabled are discarded
+	assert scope.sc.query('*IDN?').startswith('TEKTRONIX')
+
+def test_stream_consumer(scope):
+	scope.acq.set_window(1, 1000)
+	scope.acq.wfm_src = ['ch1', 'ch2']
+	shapes = []
+	stream = scope.start_stream(consumer=lambda t: shapes.append(t.shape))
+	while stream.traces < 10:
+		assert stream.running
+	scope.stop_stream()
+	assert shapes and set(shapes) == {(2, 1000)}
+	assert scope.sc.query('*IDN?').startswith('TEKTRONIX')
+
+def test_stream_already_running(scope):
+	scope.acq.set_window(1, 1000)
+	scope.start_stream()
+	with pytest.raises(OSError):
+		scope.start_stream()
+	scope.stop_stream()
@@ -0,0 +1,49 @@
+import pytest
+
+import pyMSO4
+
+@pytest.fixture
+def sim4000():
+	'''A simulated MSO44 on the port of the socket server of the scope (see TRANSPORTS).'''
+	try:
+		sim = pyMSO4.MSO4Simulator(port=4000, seed=0).start()
+	except OSError:
+		pytest.skip('Port 4000 is in use')
+	yield sim
+	sim.stop()
+
+def test_socket_con(sim4000):
+	scope = pyMSO4.MSO4()
+	assert scope.con(ip='127.0.0.1', transport='socket')
+	assert scope.sc.resource_name == 'TCPIP0::127.0.0.1::4000::SOCKET'
+	assert scope.sc.query('*IDN?').startswith('TEKTRONIX')
+	assert scope.acq.query_waveform().shape == (scope.acq.wfm_len,)
+	scope.dis()
+
+def test_invalid_transport():
+	with pytest.raises(ValueError):
+		pyMSO4.MSO4().con(ip='127.0.0.1', transport='usb')
+
+def test_probe_transports(sim4000):
+	scope = pyMSO4.MSO4()
+	rates = scope.probe_transports('127.0.0.1', traces=5, open_timeout=1000)
+	# Nothing serves VXI-11 or HiSLIP on localhost
+	assert list(rates) == ['socket', 'vxi11', 'hislip']
+	assert rates['socket'] > 0 and rates['vxi11'] == rates['hislip'] == 0
+	assert scope.connect_status and scope.sc.resource_name.endswith('::SOCKET')
+	scope.dis()
+
+def test_probe_transports_none_usable():
+	with pytest.raises(OSError):
+		pyMSO4.MSO4().probe_transports('127.0.0.1', transports=['vxi11'], open_timeout=1000)
+
+def test_clear_buffers_socket(scope):
+	scope.sc.write('CURVE?') # Response left unread
+	scope.sc.write('*IDN?')
+	scope.clear_buffers()
+	assert scope.sc.query('*IDN?').startswith('TEKTRONIX')
+
+def test_clear_buffers_closed_socket(sim, scope):
+	sim.stop()
+	with pytest.raises(ConnectionResetError):
+		scope.clear_buffers()
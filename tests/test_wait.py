@@ -0,0 +1,23 @@
+import pytest
+
+import pyMSO4
+from pyMSO4 import wait
+
+def test_wait_complete_falls_back_to_polling(scope):
+	'''Raw sockets have no service requests: the first wait finds out and polls BUSY? instead.'''
+	assert not hasattr(scope.sc, wait._SRQ_SUPPORT) # pylint: disable=protected-access
+	scope.acq.acquire_single(timeout=2000)
+	assert getattr(scope.sc, wait._SRQ_SUPPORT) is False # pylint: disable=protected-access
+	assert not scope.busy()
+
+def test_srq_support_is_per_connection(scope, sim):
+	scope.acq.acquire_single(timeout=2000)
+	scope.dis()
+	scope.con(resource=sim.resource)
+	assert not hasattr(scope.sc, wait._SRQ_SUPPORT) # pylint: disable=protected-access
+
+def test_wait_complete_timeout(scope, sim):
+	sim.trigger_rate = 1
+	scope.acq.arm()
+	with pytest.raises(TimeoutError):
+		pyMSO4.wait_complete(scope.sc, timeout=100)
@@ -0,0 +1,96 @@
+import io
+
+import numpy as np
+import pytest
+import pyvisa
+
+from pyMSO4 import TraceIntegrity, TraceIntegrityError
+from pyMSO4.acquisition import MSO4Acquisition
+
+class BlockSource:
+	'''Minimal resource serving canned responses to read_bytes(), to test the block parser alone.'''
+
+	def __init__(self, data: bytes):
+		self._data = io.BytesIO(data)
+
+	def read_bytes(self, n: int) -> bytes:
+		return self._data.read(n)
+
+def parse(data: bytes) -> bytes:
+	acq = MSO4Acquisition(BlockSource(data), 4)
+	return acq._read_block() # pylint: disable=protected-access
+
+def test_block_header():
+	assert parse(b'#15hello\n') == b'hello'
+	assert parse(b'#210' + bytes(range(10)) + b'\n') == bytes(range(10))
+
+@pytest.mark.parametrize('data', [b'15hello\n', b'#x5hello\n', b'#0hello\n'])
+def test_invalid_block_header(data):
+	with pytest.raises(OSError):
+		parse(data)
+
+@pytest.mark.parametrize('byte_nr, fmt, order, dtype', [
+	(1, 'ri', 'msb', '>i1'),
+	(2, 'ri', 'msb', '>i2'),
+	(2, 'ri', 'lsb', '<i2'),
+	(2, 'rp', 'lsb', '<u2'),
+	(8, 'ri', 'lsb', '<i8'),
+])
+def test_query_waveform_formats(scope, byte_nr, fmt, order, dtype):
+	with scope.batch():
+		scope.acq.wfm_byte_nr = byte_nr
+		scope.acq.wfm_binary_format = fmt
+		scope.acq.wfm_byte_order = order
+	wfm = scope.acq.query_waveform()
+	assert wfm.dtype == np.dtype(dtype)
+	assert wfm.shape == (10000,)
+	volts = scope.acq.to_volts(wfm)
+	# One period of a sine of half the full scale (10 divisions of 0.1 V) over the record, with some noise
+	assert 0.2 < volts.max() < 0.35 and -0.35 < volts.min() < -0.2
+
+def test_query_waveform_out(scope):
+	scope.acq.set_window(1, 1000)
+	out = np.empty(1000, dtype=np.float64)
+	assert scope.acq.query_waveform(out) is out
+	with pytest.raises(ValueError):
+		scope.acq.query_waveform(np.empty(999))
+
+def test_query_waveform_reads(scope):
+	scope.acq.set_window(1, 1000)
+	scope.acq.get_dtype()
+	scope.instrument = True
+	scope.acq.query_waveform()
+	# Block header (2 calls), then the payload with the terminator
+	assert scope.stats()['CURVE?']['reads'] == 3
+	assert scope.sc.query('*IDN?').startswith('TEKTRONIX')
+
+def test_query_waveforms(scope):
+	scope.acq.set_window(1, 1000)
+	scope.acq.wfm_src = ['ch1', 'ch2', 'ch3']
+	wfms = scope.acq.query_waveforms()
+	assert wfms.shape == (3, 1000)
+	# Each channel is a sine of a different frequency
+	assert not np.array_equal(wfms[0], wfms[1])
+
+def test_integrity_short_read(scope):
+	scope.acq.set_window(1, 1000)
+	scope.acq.integrity = TraceIntegrity(wfm_bytes=2000)
+	with pytest.raises(TraceIntegrityError):
+		scope.acq.query_waveform()
+	assert scope.acq.integrity.short_reads == 1
+
+def test_preamble_failure_disables_headers(scope):
+	def timeout(*args, **kwargs):
+		raise pyvisa.errors.VisaIOError(pyvisa.constants.VI_ERROR_TMO)
+	scope.acq.clear_caches()
+	scope.instrument = True
+	scope.sc.read = timeout
+	try:
+		with pytest.raises(pyvisa.errors.VisaIOError):
+			scope.acq.preamble()
+	finally:
+		del scope.sc.read
+	assert scope.stats()['HEADer']['writes'] == 1
+	scope.clear_buffers() # The response was never read
+	assert scope.sc.query('HEADer?').strip() in ('0', 'OFF')
+	assert scope.acq.preamble().nr_pt == 10000
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+def test_set_window_updates_preamble(scope):
+	scope.acq.set_window(101, 600)
+	assert (scope.acq.wfm_start, scope.acq.wfm_stop) == (101, 600)
+	assert scope.acq.wfm_len == 500
+	assert scope.acq.stop_after == 'runstop'
+	assert scope.acq.query_waveform().shape == (500,)
+	pre = scope.acq.preamble()
+	assert pre.xzero == pytest.approx(scope.acq.time_axis(1)[0])
+
+def test_window_lags_preamble_without_acquisition(scope):
+	'''CURVE? follows the data window right away, the preamble only after an acquisition.'''
+	scope.acq.set_window(1, 1000)
+	scope.acq.stop_after = 'sequence' # No acquisition running
+	scope.acq.wfm_start, scope.acq.wfm_stop = 1, 200
+	assert scope.acq.query_waveform().shape == (200,)
+	assert scope.acq.wfm_len == 1000
+
+def test_set_window_invalid(scope):
+	for start, stop in [(0, 10), (10, 5), (1.5, 10)]:
+		with pytest.raises(ValueError):
+			scope.acq.set_window(start, stop)
+	assert (scope.acq.wfm_start, scope.acq.wfm_stop) == (1, 10000)
+
+def test_set_roi(scope):
+	xincr = 1 / scope.acq.horiz_sample_rate
+	start, stop = scope.acq.set_roi(0, 100 * xincr)
+	assert stop - start == 100
+	assert scope.acq.time_axis(1)[0] == pytest.approx(0, abs=xincr)
+
+def test_read_long(scope):
+	scope.acq.set_window(1, 10000)
+	scope.acq.stop_after = 'sequence'
+	progress = []
+	wfm = scope.acq.read_long(chunk_points=3000, progress=lambda done, total: progress.append((done, total)))
+	assert wfm.shape == (10000,)
+	assert wfm.dtype == np.dtype('i1')
+	assert progress == [(3000, 10000), (6000, 10000), (9000, 10000), (10000, 10000)]
+	assert (scope.acq.wfm_start, scope.acq.wfm_stop) == (1, 10000)
+	scope.clear_cache()
+	assert (scope.acq.wfm_start, scope.acq.wfm_stop) == (1, 10000)
+
+def test_read_long_sources(scope):
+	scope.acq.wfm_src = ['ch1', 'ch2']
+	out = np.empty((2, 2500), dtype=np.int16)
+	assert scope.acq.read_long(chunk_points=1000, start=501, stop=3000, out=out) is out
+	with pytest.raises(ValueError):
+		scope.acq.read_long(start=10, stop=5)